@@ -0,0 +1,193 @@
+# ai_cache.py
+# Two-tier (memory LRU + SQLite) cache for LLM responses
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger('coach_agent.ai_cache')
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    cache_key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access);
+"""
+
+
+def normalize_prompt(prompt_text):
+    """Collapses all whitespace so indentation-only differences hash to the same key."""
+    return ' '.join(prompt_text.split())
+
+
+def make_cache_key(prompt_text, model_name, safety_settings=None):
+    """Content-addressed key over the normalized prompt, model name and safety settings."""
+    payload = json.dumps(
+        {
+            'prompt': normalize_prompt(prompt_text),
+            'model': model_name,
+            'safety': safety_settings or [],
+        },
+        sort_keys=True,
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """LLM response cache with an in-memory LRU in front of a SQLite table.
+
+    Every entry carries its own expiry time. The memory tier is bounded by
+    ``max_memory_entries`` (least recently used evicted first) and the disk
+    tier by ``max_disk_entries`` (least recently accessed rows deleted in bulk).
+    Pass ``path=None`` for a memory-only cache.
+    """
+
+    def __init__(self, path, max_memory_entries=512, max_disk_entries=10000, default_ttl=6 * 3600):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.default_ttl = default_ttl
+        self._memory = OrderedDict()  # key -> (response, expires_at)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_count = 0
+        self._counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'sets': 0,
+            'evictions': 0,
+            'disk_errors': 0,
+        }
+
+    def _disk(self):
+        """Opens the SQLite tier on first use (called with the lock held)."""
+        if self._conn is None and self.path:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.executescript(CACHE_SCHEMA)
+            self._disk_count = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, key, response, expires_at):
+        self._memory[key] = (response, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def get(self, key):
+        """Returns the cached response for ``key`` or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return response
+                del self._memory[key]
+                self._counters['expired'] += 1
+
+            try:
+                conn = self._disk()
+                if conn is not None:
+                    row = conn.execute(
+                        "SELECT response, expires_at FROM llm_cache WHERE cache_key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        response, expires_at = row
+                        if expires_at > now:
+                            conn.execute("UPDATE llm_cache SET last_access = ? WHERE cache_key = ?", (now, key))
+                            conn.commit()
+                            self._remember(key, response, expires_at)
+                            self._counters['disk_hits'] += 1
+                            return response
+                        conn.execute("DELETE FROM llm_cache WHERE cache_key = ?", (key,))
+                        conn.commit()
+                        self._disk_count -= 1
+                        self._counters['expired'] += 1
+            except sqlite3.Error as e:
+                self._counters['disk_errors'] += 1
+                log.warning("AI cache read failed: %s", e)
+
+            self._counters['misses'] += 1
+            return None
+
+    def set(self, key, response, ttl=None):
+        """Stores ``response`` in both tiers for ``ttl`` seconds (default_ttl if omitted)."""
+        now = time.time()
+        expires_at = now + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._remember(key, response, expires_at)
+            self._counters['sets'] += 1
+            try:
+                conn = self._disk()
+                if conn is None:
+                    return
+                conn.execute(
+                    """INSERT INTO llm_cache (cache_key, response, created_at, expires_at, last_access)
+                       VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT(cache_key) DO UPDATE SET
+                           response = excluded.response,
+                           created_at = excluded.created_at,
+                           expires_at = excluded.expires_at,
+                           last_access = excluded.last_access""",
+                    (key, response, now, expires_at, now),
+                )
+                conn.commit()
+                self._disk_count += 1  # Upper bound (upserts count too); recounted on eviction
+                if self._disk_count > self.max_disk_entries:
+                    self._evict_disk(conn, now)
+            except sqlite3.Error as e:
+                self._counters['disk_errors'] += 1
+                log.warning("AI cache write failed: %s", e)
+
+    def _evict_disk(self, conn, now):
+        """Drops expired rows, then the least recently used 10% if still over the bound."""
+        conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        count = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if count > self.max_disk_entries:
+            overflow = count - self.max_disk_entries + max(1, self.max_disk_entries // 10)
+            conn.execute(
+                """DELETE FROM llm_cache WHERE cache_key IN (
+                       SELECT cache_key FROM llm_cache ORDER BY last_access LIMIT ?)""",
+                (overflow,),
+            )
+            self._counters['evictions'] += overflow
+        conn.commit()
+        self._disk_count = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def clear(self):
+        """Removes every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            conn = self._disk()
+            if conn is not None:
+                conn.execute("DELETE FROM llm_cache")
+                conn.commit()
+            self._disk_count = 0
+
+    def stats(self):
+        """Returns hit/miss counters and tier sizes as a plain dict."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._memory)
+            stats['disk_entries'] = self._disk_count
+        hits = stats['memory_hits'] + stats['disk_hits']
+        lookups = hits + stats['misses']
+        stats['hit_rate'] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
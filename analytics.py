@@ -0,0 +1,203 @@
+# analytics.py
+# Vectorized habit analytics (success rates, streaks, peak times) over a goal's or user's task history
+#
+# Everything is computed with NumPy over per-day count arrays. Those come straight from the
+# progress rollups (goal_progress_daily / goal_completion_hours, one row per goal-day), so a
+# goal or user with millions of tasks costs a few thousand rows to load.
+
+import collections
+import datetime
+
+# NumPy is imported inside the functions that use it: it is most of the cost of importing the
+# app (and prompts.py), and most processes compute analytics rarely or never.
+
+# Hour ranges used for the "peak performance time" described in the README
+DAY_PERIODS = (
+    ('morning', 5, 12),
+    ('afternoon', 12, 17),
+    ('evening', 17, 22),
+)
+
+RECENT_TASKS = 10  # The README's "reviews last 10 tasks"
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+# julianday() - this offset == datetime.date.toordinal(), so SQLite hands NumPy plain integers
+_ORDINAL = "CAST(julianday({}) - 1721424.5 AS INTEGER)"
+
+# Per-day counts: day is a sorted array of date ordinals, the others are counts for that day
+DailyCounts = collections.namedtuple('DailyCounts', 'day planned completed missed')
+
+
+def _fetch_array(db, sql, params, columns):
+    import numpy as np
+    cursor = db.cursor()
+    cursor.row_factory = None  # Plain tuples: much cheaper than sqlite3.Row for large results
+    rows = cursor.execute(sql, params).fetchall()
+    if not rows:
+        return np.empty((0, columns), dtype=np.int64)
+    return np.array(rows, dtype=np.int64)
+
+
+def _daily(data):
+    import numpy as np
+    data = data[data[:, 0] > 0]  # Unparseable due dates come back as NULL -> 0
+    data = data[np.argsort(data[:, 0], kind='stable')]
+    return DailyCounts(data[:, 0], data[:, 1], data[:, 2], data[:, 3])
+
+
+def _hours(data):
+    import numpy as np
+    hours = np.zeros(24, dtype=np.int64)
+    if data.size:
+        valid = (data[:, 0] >= 0) & (data[:, 0] < 24)
+        np.add.at(hours, data[valid, 0], data[valid, 1])
+    return hours
+
+
+def load_goal_daily(db, goal_id):
+    """Per-day status counts and the completion-hour histogram of one goal, from the rollups."""
+    daily = _fetch_array(
+        db,
+        f"""SELECT {_ORDINAL.format('day')}, planned, completed, missed
+            FROM goal_progress_daily WHERE goal_id = ?""",
+        (goal_id,), 4)
+    hours = _fetch_array(
+        db, "SELECT hour, completed FROM goal_completion_hours WHERE goal_id = ?", (goal_id,), 2)
+    return _daily(daily), _hours(hours)
+
+
+def load_user_daily(db, user_id):
+    """Per-day status counts and the completion-hour histogram across all of a user's goals."""
+    daily = _fetch_array(
+        db,
+        f"""SELECT {_ORDINAL.format('p.day')}, SUM(p.planned), SUM(p.completed), SUM(p.missed)
+            FROM goals g JOIN goal_progress_daily p ON p.goal_id = g.goal_id
+            WHERE g.user_id = ?
+            GROUP BY p.day""",
+        (user_id,), 4)
+    hours = _fetch_array(
+        db,
+        """SELECT h.hour, SUM(h.completed)
+           FROM goals g JOIN goal_completion_hours h ON h.goal_id = g.goal_id
+           WHERE g.user_id = ?
+           GROUP BY h.hour""",
+        (user_id,), 2)
+    return _daily(daily), _hours(hours)
+
+
+def _rate(completed, resolved):
+    return round(float(completed) / float(resolved), 4) if resolved else None
+
+
+def _runs(mask):
+    """Lengths of consecutive True runs in a boolean array."""
+    import numpy as np
+    if not mask.any():
+        return np.empty(0, dtype=np.int64)
+    edges = np.diff(np.concatenate(([False], mask, [False])).astype(np.int8))
+    return np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+
+
+def difficulty_band(success_rate):
+    """Maps a success rate onto the README's adaptation bands."""
+    if success_rate is None:
+        return 'moderate'
+    if success_rate < 0.3:
+        return 'easier'
+    if success_rate > 0.7:
+        return 'challenge'
+    return 'moderate'
+
+
+def compute_stats(daily, hours, today=None, windows=(7, 30)):
+    """Computes success rates, streaks, weekday/hour distributions and missed-day clusters."""
+    import numpy as np
+    today = today or datetime.date.today()
+    today_ord = today.toordinal()
+
+    stats = {
+        'total_tasks': int(daily.planned.sum() + daily.completed.sum() + daily.missed.sum()),
+        'completed': int(daily.completed.sum()),
+        'missed': int(daily.missed.sum()),
+        'planned': int(daily.planned.sum()),
+    }
+    stats['success_rate'] = _rate(stats['completed'], stats['completed'] + stats['missed'])
+
+    # Dense per-day arrays from the first task up to today (days without tasks are zeros)
+    past = daily.day <= today_ord
+    if past.any():
+        first = int(daily.day[past][0])
+        offsets = daily.day[past] - first
+        length = today_ord - first + 1
+        done = np.bincount(offsets, weights=daily.completed[past], minlength=length)
+        missed = np.bincount(offsets, weights=daily.missed[past], minlength=length)
+    else:
+        done = missed = np.zeros(0)
+    resolved = done + missed
+
+    # README: adapt to the outcome of the most recent ~10 resolved tasks (whole days, newest first)
+    resolved_back = np.cumsum(resolved[::-1])
+    if resolved_back.size and resolved_back[-1]:
+        n_days = int(np.searchsorted(resolved_back, RECENT_TASKS)) + 1
+        stats['recent_success_rate'] = _rate(done[-n_days:].sum(), resolved[-n_days:].sum())
+    else:
+        stats['recent_success_rate'] = None
+    stats['difficulty'] = difficulty_band(stats['recent_success_rate'])
+
+    done_cum = np.concatenate(([0.0], np.cumsum(done)))
+    resolved_cum = np.concatenate(([0.0], np.cumsum(resolved)))
+    rolling = {}
+    for window in windows:
+        w = min(window, done.size)
+        rolling[f'{window}d'] = (
+            _rate(done_cum[-1] - done_cum[-1 - w], resolved_cum[-1] - resolved_cum[-1 - w]) if w else None)
+    stats['rolling_success_rate'] = rolling
+
+    # Streaks: consecutive calendar days with at least one completed task. Today is still
+    # in progress, so the current streak may end yesterday.
+    success_days = done > 0
+    runs = _runs(success_days)
+    stats['longest_streak'] = int(runs.max()) if runs.size else 0
+    current = 0
+    if success_days.size:
+        tail = success_days if success_days[-1] else success_days[:-1]
+        if tail.size and tail[-1]:
+            breaks = np.flatnonzero(~tail)
+            current = int(tail.size - (breaks[-1] + 1 if breaks.size else 0))
+    stats['current_streak'] = current
+
+    # Weekday distribution (date ordinal 1 is a Monday)
+    weekday = (daily.day - 1) % 7
+    done_by_weekday = np.bincount(weekday, weights=daily.completed, minlength=7)
+    missed_by_weekday = np.bincount(weekday, weights=daily.missed, minlength=7)
+    stats['weekday'] = [
+        {'weekday': name, 'completed': int(d), 'missed': int(m), 'success_rate': _rate(d, d + m)}
+        for name, d, m in zip(WEEKDAYS, done_by_weekday, missed_by_weekday)
+    ]
+
+    # Completion-hour distribution and the peak period of the day
+    stats['completions_by_hour'] = [int(h) for h in hours]
+    period_totals = {name: int(hours[start:end].sum()) for name, start, end in DAY_PERIODS}
+    period_totals['night'] = int(hours[22:].sum() + hours[:5].sum())
+    stats['completions_by_period'] = period_totals
+    stats['peak_period'] = max(period_totals, key=period_totals.get) if hours.any() else None
+
+    # Missed-task clustering: runs of consecutive days where something was missed and nothing completed
+    clusters = _runs((missed > 0) & ~success_days)
+    stats['missed_clusters'] = {
+        'count': int(clusters.size),
+        'longest': int(clusters.max()) if clusters.size else 0,
+        'mean_length': round(float(clusters.mean()), 2) if clusters.size else 0.0,
+        'most_missed_weekday': WEEKDAYS[int(missed_by_weekday.argmax())] if missed_by_weekday.any() else None,
+    }
+    return stats
+
+
+def goal_stats(db, goal_id, today=None):
+    """Analytics for one goal."""
+    return compute_stats(*load_goal_daily(db, goal_id), today=today)
+
+
+def user_stats(db, user_id, today=None):
+    """Analytics across all of a user's goals."""
+    return compute_stats(*load_user_daily(db, user_id), today=today)
@@ -2,38 +2,114 @@
 # ==========================================
 
 import sqlite3
-from flask import Flask, g, render_template, request, redirect, url_for, flash, get_flashed_messages, jsonify
+from flask import (Flask, current_app, g, render_template, stream_template, request, redirect, url_for, flash,
+                   get_flashed_messages, jsonify, make_response, session, Response, stream_with_context)
+from markupsafe import Markup
+import json
+import logging
 import os
 import datetime
-import google.generativeai as genai # Import Gemini library
+import threading
+import time
 from dotenv import load_dotenv # Import dotenv
-# Optional: For more detailed error logging
-# import traceback
+from ai_cache import ResponseCache, make_cache_key
+from single_flight import SingleFlight, SingleFlightTimeout
+from jobs import JobQueue, QueueFullError, PermanentJobError
+from llm_backends import create_backend, LLMBlockedError, LLMEmptyResponseError
+from planner import PLAN_SCHEMA, PlanStreamParser, parse_plan
+import migrate
+import analytics
+import prompts
+import search
+import data_transfer
+from precompute import get_suggestion
+from page_cache import FragmentCache, get_versions, is_not_modified, last_modified, make_etag, templates_fingerprint
+from tenancy import ShardRouter, UserDirectory, current_user_id, get_goal, user_goals
+from write_queue import WriteQueue
+from instrumentation import TimedConnection, configure_logging, instrument_app, metrics, record_llm_call
+from task_store import (insert_tasks, set_task_statuses, sweep_overdue_tasks,
+                        TaskValidationError, IdempotencyConflictError)
 
 # --- Load Environment Variables ---
 load_dotenv() # Load variables from .env file
 
-app = Flask(__name__)
-# Use environment variable for secret key or fallback to random bytes for flash messages
-app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', os.urandom(24))
+log = logging.getLogger('coach_agent')
+# Leveled logging (LOG_LEVEL=DEBUG also logs the start of every prompt); LOG_FORMAT=json for log shippers
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+
+# Importing this module only defines things: the Flask app is built by create_app() (routes,
+# hooks, instrumentation), and pools, writer threads, caches and the AI client all start on
+# first use, so CLI scripts and prefork workers import it cheaply
 DATABASE = 'coach_agent.db'
-SCHEMA = 'schema.sql'
-DEFAULT_USER_ID = 1 # Assuming a single-user setup for now
+DEFAULT_USER_ID = 1 # Who anonymous requests act for, unless REQUIRE_LOGIN is set
+REQUIRE_LOGIN = os.getenv('REQUIRE_LOGIN', '').lower() in ('1', 'true', 'yes') # Anonymous requests get a 401
+USER_HEADER = os.getenv('USER_HEADER') # Trusted username header set by an authenticating proxy, e.g. X-Forwarded-User
+# /login takes any username without a credential, so it (and the session users it sets) only exists for development
+DEV_LOGIN = os.getenv('DEV_LOGIN', '').lower() in ('1', 'true', 'yes')
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1')) # Database files users are spread over (see tenancy.py)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8')) # Max pooled connections per worker process
+# Route writes go through one writer thread per database file that group-commits them (see write_queue.py);
+# WRITE_QUEUE=0 makes every request commit its own writes instead
+WRITE_QUEUE = os.getenv('WRITE_QUEUE', '1').lower() not in ('0', 'false', 'no')
+WRITE_BATCH_WINDOW_MS = float(os.getenv('WRITE_BATCH_WINDOW_MS', '1')) # How long a write waits for others to share its commit
+WRITE_MAX_BATCH = int(os.getenv('WRITE_MAX_BATCH', '64'))
+TASK_PAGE_SIZE = int(os.getenv('TASK_PAGE_SIZE', '50')) # Tasks per goal page / infinite-scroll fetch
+MAX_TASK_PAGE_SIZE = 200
+TASK_WINDOW_PAST_DAYS = 7 # Goal pages open on tasks due from a week ago onwards
+# Estimated-token budgets of the AI prompts; long task histories are summarized to fit
+TASK_PROMPT_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', str(prompts.TASK_PROMPT_BUDGET)))
+PLAN_PROMPT_BUDGET = int(os.getenv('PLAN_PROMPT_TOKEN_BUDGET', str(prompts.PLAN_PROMPT_BUDGET)))
+
+PAGE_FRAGMENT_CACHE_SIZE = int(os.getenv('PAGE_FRAGMENT_CACHE_SIZE', '2000')) # Rendered goal headers / task lists kept
+SQL_METRICS = os.getenv('SQL_METRICS', '1').lower() not in ('0', 'false', 'no') # Time every SQL statement for /metrics
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0')) # Share of requests run under cProfile
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles') # Where the sampled requests' .prof files go
+
+# Connections are reused across requests (WAL mode, tuned pragmas, warm statement caches),
+# one pool per shard; each user's data lives in the shard picked by a hash of their user_id
+DB_CONNECTION_CLASS = TimedConnection if SQL_METRICS else sqlite3.Connection
+db_shards = ShardRouter(DATABASE, SHARD_COUNT, max_size=DB_POOL_SIZE, factory=DB_CONNECTION_CLASS)
+users = UserDirectory(db_shards)
+db_writers = {path: WriteQueue(path, max_batch=WRITE_MAX_BATCH, window=WRITE_BATCH_WINDOW_MS / 1000.0,
+                               factory=DB_CONNECTION_CLASS)
+              for path in db_shards.paths} if WRITE_QUEUE else None
+# Rendered page fragments keyed on content versions (create_app() adds the template hash to every ETag)
+page_fragments = FragmentCache(max_entries=PAGE_FRAGMENT_CACHE_SIZE)
 
 # --- Configure Gemini API ---
+GEMINI_MODEL_NAME = 'gemini-2.5-flash-preview-04-17'
+# Safety settings sent with every request (also part of the response cache key)
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+]
+AI_CACHE_DB = os.getenv('AI_CACHE_DB', 'ai_cache.db')
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', str(6 * 3600))) # Seconds a generated response is reused
+
+# Repeat prompts (same goal + same weekly progress) are answered from here without an API call
+ai_cache = ResponseCache(AI_CACHE_DB, default_ttl=AI_CACHE_TTL)
+# Double-clicks and bursts of identical prompts share one in-flight Gemini call
+ai_single_flight = SingleFlight(timeout=float(os.getenv('AI_INFLIGHT_TIMEOUT', '60')))
+# AI generation runs here instead of in request threads; AI_JOB_WORKERS caps concurrent Gemini calls
+ai_jobs = JobQueue(
+    workers=int(os.getenv('AI_JOB_WORKERS', '4')),
+    max_queue=int(os.getenv('AI_JOB_QUEUE_SIZE', '100')),
+    max_attempts=int(os.getenv('AI_JOB_MAX_ATTEMPTS', '3')),
+)
+
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
-GEMINI_CONFIGURED = False
-if not GOOGLE_API_KEY:
-    print("🔴 WARNING: GOOGLE_API_KEY environment variable not found. AI features will be disabled.")
-else:
-    try:
-        # Removed the AI model configuration and call on app reload
-        # genai.configure(api_key=GOOGLE_API_KEY)
-        GEMINI_CONFIGURED = True
-        print("✅ Gemini API configured successfully.")
-    except Exception as e:
-        print(f"🔴 ERROR: Failed to configure Gemini API: {e}")
-        print("   AI features will be unavailable.")
+# LLM_BACKEND: gemini | template (offline, deterministic) | fake (simulated latency/errors).
+# Defaults to gemini with an API key and to the template generator without one. The Gemini
+# SDK is only imported by the first call (see llm_backends.py).
+try:
+    llm_backend = create_backend(model_name=GEMINI_MODEL_NAME, safety_settings=SAFETY_SETTINGS, api_key=GOOGLE_API_KEY)
+except ValueError as e:
+    log.warning("%s. Falling back to offline template generation.", e)
+    llm_backend = create_backend('template')
+GEMINI_CONFIGURED = llm_backend.name == 'gemini'
 
 # app.py - PART 2: Database Helper Functions
 # =========================================
@@ -41,115 +117,339 @@ else:
 
 # --- Database Helper Functions ---
 def get_db():
-    """Opens a new database connection if there is none yet for the current application context."""
+    """Checks a pooled connection to the current user's shard out for the application context."""
     if 'db' not in g:
+        g.db_pool = db_shards.pool_for(g.get('user_id') or DEFAULT_USER_ID)
         try:
-            g.db = sqlite3.connect(DATABASE, detect_types=sqlite3.PARSE_DECLTYPES)
-            # Return rows that behave like dicts (access columns by name)
-            g.db.row_factory = sqlite3.Row
-            print("Database connection opened.")
+            g.db = g.db_pool.acquire()
         except sqlite3.Error as e:
-            print(f"🔴 ERROR connecting to database: {e}")
+            log.error("Could not connect to the database: %s", e)
             # Stop the request if DB connection fails
             raise ConnectionError(f"Could not connect to database: {e}") from e
     return g.db
 
-@app.teardown_appcontext
 def close_db(e=None):
-    """Closes the database again at the end of the request."""
+    """Returns the database connection to the pool at the end of the request."""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
-        print("Database connection closed.")
+        g.pop('db_pool').release(db)
+
+def run_write(fn, *args, **kwargs):
+    """Runs ``fn(db, *args, **kwargs)`` against the current user's shard and returns its result once committed.
+
+    Normally on the shard's writer thread, batched with other requests' writes into one
+    commit; with WRITE_QUEUE=0 on the request's own connection, committed right away.
+    Exceptions raised by ``fn`` come back here, and its writes are undone.
+    """
+    if db_writers is not None:
+        return db_writers[db_shards.path_for(g.user_id)].execute(fn, *args, **kwargs)
+    db = get_db()
+    try:
+        result = fn(db, *args, **kwargs)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return result
 
 def init_db_command():
-    """Helper to initialize DB from schema file if it doesn't exist or is empty."""
-    print("Attempting to initialize database if needed...")
-    try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        # Basic check if tables exist (checks for 'users' table)
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users';")
-        table_exists = cursor.fetchone()
-        if not table_exists:
-             print(f"Database table 'users' not found. Initializing from {SCHEMA}...")
-             try:
-                 with open(SCHEMA, 'r') as f:
-                     sql_script = f.read()
-                 cursor.executescript(sql_script)
-                 conn.commit()
-                 print(f"✅ Database initialized successfully using {SCHEMA}.")
-             except FileNotFoundError:
-                 print(f"🔴 ERROR: {SCHEMA} not found. Cannot initialize database.")
-             except sqlite3.Error as e:
-                 print(f"🔴 ERROR: SQLite error during schema execution: {e}")
-        else:
-             print("Database tables appear to exist.")
-             # Ensure default user exists even if tables are present
-             cursor.execute("INSERT OR IGNORE INTO users (user_id, username, preferences) VALUES (?, ?, ?)",
-                            (DEFAULT_USER_ID, 'default_user', '{}'))
-             conn.commit()
-        conn.close()
+    """Brings the database schema up to date. Normally just one PRAGMA user_version read."""
+    try:
+        for path in db_shards.all_paths():
+            migrate.ensure_current(path)
+    except (sqlite3.Error, migrate.MigrationError) as e:
+        log.error("Could not connect to or migrate the database: %s", e)
+        return False
+    return True
+
+_db_ready_pid = None # Process that has run init_db_command() successfully
+_db_ready_lock = threading.Lock()
+
+def ensure_database_ready():
+    """Runs init_db_command() once per process, on its first request rather than at import.
+
+    Keyed on the pid like the pools and writers, so forked workers each check for themselves.
+    A failed check is retried by the next request.
+    """
+    global _db_ready_pid
+    if _db_ready_pid == os.getpid():
+        return
+    with _db_ready_lock:
+        if _db_ready_pid != os.getpid() and init_db_command():
+            _db_ready_pid = os.getpid()
+
+# --- Routes ---
+# Collected here and registered on each app create_app() builds: building Flask's URL map
+# is a large share of app start-up, which scripts that only import helpers never need
+_routes = []
+
+def route(rule, **options):
+    """Same as Flask's ``@app.route``, for the app that create_app() builds."""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+# --- Who the request is for ---
+PUBLIC_ENDPOINTS = {'login', 'logout', 'static', 'metrics'}
+
+def load_request_user():
+    """Sets g.user_id for the request; anonymous requests get a 401 when REQUIRE_LOGIN is set."""
+    g.user_id = current_user_id(request, session if DEV_LOGIN else {}, users, header=USER_HEADER,
+                                default=None if REQUIRE_LOGIN else DEFAULT_USER_ID)
+    if g.user_id is None and request.endpoint not in PUBLIC_ENDPOINTS \
+            and not (request.endpoint or '').endswith('_health'):
+        return jsonify({"error": "Login required."}), 401
+
+@route('/login', methods=['POST'])
+def login():
+    """Logs this session in as ``username`` (form or JSON body), creating the user on first login.
+
+    There are no passwords, so this is a development aid, off (404) unless DEV_LOGIN is set:
+    deployments authenticate in a reverse proxy and pass the username in USER_HEADER instead.
+    """
+    if not DEV_LOGIN:
+        return jsonify({"error": "Not found."}), 404
+    data = request.get_json(silent=True) or request.form
+    username = str(data.get('username') or '').strip()
+    if not username:
+        return jsonify({"error": "username is required."}), 400
+    try:
+        session['user_id'] = users.user_id(username)
     except sqlite3.Error as e:
-        print(f"🔴 ERROR occurred connecting to or initializing the DB: {e}")
-
-# --- Run DB Initialization Check Once Before First Request ---
-# This ensures the DB exists and is initialized before any routes are handled
-with app.app_context():
-     init_db_command()
+        log.error("Database error logging in %r: %s", username, e)
+        return jsonify({"error": f"Database error: {e}"}), 500
+    if request.is_json:
+        return jsonify({"user_id": session['user_id'], "username": username})
+    return redirect(url_for('index'))
+
+@route('/logout', methods=['POST'])
+def logout():
+    """Forgets the session's user."""
+    session.pop('user_id', None)
+    return jsonify({"ok": True}) if request.is_json else redirect(url_for('index'))
 
 # app.py - PART 3: Gemini Helper Function
 # ======================================
 # (Append this code below Part 2)
 
 # --- Gemini Helper Function ---
-def generate_gemini_message(prompt_text):
-    """Generates content using the Gemini API."""
-    if not GEMINI_CONFIGURED:
-        print("Cannot generate response: Gemini API not configured.")
-        return "AI features are currently unavailable (API key missing or invalid)."
-
-    try:
-        print(f"🧠 Sending prompt to Gemini (first 100 chars): '{prompt_text[:100]}...'")
-        model = genai.GenerativeModel('gemini-2.5-flash-preview-04-17')
-
-        # Configure safety settings (optional but recommended)
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        ]
-
-        response = model.generate_content(prompt_text, safety_settings=safety_settings)
-        print("✅ Received response from Gemini.")
-
-        # Enhanced response handling
-        if response.parts:
-            # Ensure we get text content safely
-            generated_text = ''.join(part.text for part in response.parts if hasattr(part, 'text'))
-            if generated_text:
-                return generated_text.strip() # Remove leading/trailing whitespace
-            else:
-                print("⚠️ Gemini response parts found, but no text content.")
-                return "AI Coach message unavailable (Empty response received)."
-        # Check for blocking reasons
-        elif response.prompt_feedback and response.prompt_feedback.block_reason:
-            block_reason = response.prompt_feedback.block_reason
-            print(f"⚠️ Gemini content blocked. Reason: {block_reason}")
-            return f"AI Coach message blocked (Reason: {block_reason}). Please check content safety guidelines."
-        else:
-            # Catchall for unknown empty responses
-            print(f"⚠️ Gemini response empty or unexpected format. Response: {response}")
-            # Log the full response object for deeper debugging if needed
-            # print(f"Full Gemini Response Object: {response}")
-            return "AI Coach message unavailable (empty or unknown response)."
+def generate_gemini_message(prompt_text, backend=None, refresh=False, raise_errors=False, json_schema=None):
+    """Generates content with the configured LLM backend, reusing cached responses for repeat prompts.
+
+    ``backend`` overrides the configured one (see llm_backends); ``refresh=True`` skips the
+    cache lookup but still stores the new response. ``raise_errors=True`` lets API errors
+    and timeouts propagate (so a job can retry them) instead of returning a placeholder message.
+    ``json_schema`` requests structured JSON output (see planner.PLAN_SCHEMA). Blocked and
+    empty responses become placeholder messages too, unless ``raise_errors`` is set.
+    """
+    backend = backend or llm_backend
+    cache_key = make_cache_key(prompt_text, backend.model_name, SAFETY_SETTINGS)
+    if not refresh and backend.cacheable:
+        cached = ai_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
+    try:
+        return ai_single_flight.do(cache_key, lambda: _request_gemini_message(prompt_text, backend, cache_key, json_schema))
+    except Exception as e:
+        message = llm_error_message(e)
+        if raise_errors:
+            raise
+        return message
+
+def llm_error_message(error):
+    """Logs a failed LLM call and returns the placeholder message shown in place of its answer."""
+    if isinstance(error, SingleFlightTimeout):
+        log.warning("Gave up waiting for an identical in-flight LLM call: %s", error)
+        return "AI Coach message unavailable (request timed out, please try again)."
+    if isinstance(error, LLMBlockedError):
+        log.warning("LLM response blocked: %s", error.reason)
+        return f"AI Coach message blocked (Reason: {error.reason}). Please check content safety guidelines."
+    if isinstance(error, LLMEmptyResponseError):
+        log.warning("LLM response empty or in an unexpected format: %s", error)
+        return "AI Coach message unavailable (Empty response received)."
+    log.error("LLM call failed: %s", error, exc_info=error)
+    return f"AI Coach message unavailable (API Error: Please check server logs)."
+
+def llm_outcome(error):
+    """Outcome label of a failed LLM call for the llm_request_duration_seconds metric."""
+    if isinstance(error, LLMBlockedError):
+        return 'blocked'
+    if isinstance(error, LLMEmptyResponseError):
+        return 'empty'
+    return 'error'
+
+def _request_gemini_message(prompt_text, backend, cache_key, json_schema=None):
+    """Makes the actual backend call. Runs once per in-flight prompt; errors propagate to every waiter."""
+    prompt_tokens = prompts.estimate_tokens(prompt_text)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Sending prompt to %s (~%d tokens): %r", backend.name, prompt_tokens, prompt_text[:100])
+    started = time.perf_counter()
+    try:
+        generated_text = backend.generate(prompt_text, json_schema)
+    except Exception as e:
+        record_llm_call(backend.name, time.perf_counter() - started, llm_outcome(e), prompt_tokens)
+        raise
+    generated_text = generated_text.strip() # Remove leading/trailing whitespace
+    elapsed = time.perf_counter() - started
+    record_llm_call(backend.name, elapsed, 'ok', prompt_tokens, prompts.estimate_tokens(generated_text))
+    log.info("LLM response from %s in %.2fs.", backend.name, elapsed)
+
+    if backend.cacheable:
+        ai_cache.set(cache_key, generated_text) # Only real answers are cached, never error messages
+    return generated_text
+
+def stream_gemini_message(prompt_text, backend=None, json_schema=None):
+    """Yields the response text chunk by chunk as the backend generates it.
+
+    A cached response is yielded as a single chunk; a stream that completes is cached like
+    generate_gemini_message() would. Errors propagate, so callers can report them mid-stream.
+    """
+    backend = backend or llm_backend
+    cache_key = make_cache_key(prompt_text, backend.model_name, SAFETY_SETTINGS)
+    cached = ai_cache.get(cache_key) if backend.cacheable else None
+    if cached is not None:
+        yield cached
+        return
+
+    prompt_tokens = prompts.estimate_tokens(prompt_text)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Streaming prompt to %s (~%d tokens): %r", backend.name, prompt_tokens, prompt_text[:100])
+    started = time.perf_counter()
+    chunks = []
+    try:
+        for text in backend.stream(prompt_text, json_schema):
+            chunks.append(text)
+            yield text
     except Exception as e:
-        print(f"🔴 ERROR calling Gemini API: {e}")
-        # Uncomment the line below for a detailed stack trace in the console
-        # print(traceback.format_exc())
-        return f"AI Coach message unavailable (API Error: Please check server logs)."
+        record_llm_call(backend.name, time.perf_counter() - started, llm_outcome(e), prompt_tokens)
+        raise
+    generated_text = ''.join(chunks).strip()
+    elapsed = time.perf_counter() - started
+    record_llm_call(backend.name, elapsed, 'ok', prompt_tokens, prompts.estimate_tokens(generated_text))
+    log.info("LLM stream from %s finished in %.2fs (%d chars).", backend.name, elapsed, len(generated_text))
+    if generated_text and backend.cacheable:
+        ai_cache.set(cache_key, generated_text)
+
+# --- Function to count this week's task outcomes for a goal ---
+def get_week_progress(db, goal_id):
+    """Returns (completed, missed) task counts for the goal since Monday of the current week."""
+    week_start = datetime.date.today() - datetime.timedelta(days=datetime.date.today().weekday())
+    # Read from the per-day rollup (kept current by triggers on tasks), not from the tasks themselves
+    completed, missed = db.execute("""
+        SELECT COALESCE(SUM(completed), 0), COALESCE(SUM(missed), 0)
+        FROM goal_progress_daily
+        WHERE goal_id = ?
+        AND day >= ?""",
+        (goal_id, week_start.isoformat())
+    ).fetchone()
+    return completed, missed
+
+# --- Today's task: shared by the generate/regenerate routes and the AI job queue ---
+def generate_today_task(db, user_id, goal_id, refresh=False, raise_errors=False):
+    """Returns a task description for today from the goal, this week's progress and its history.
+
+    Returns None if the user has no such goal. ``refresh`` and ``raise_errors`` are passed on
+    to generate_gemini_message().
+    """
+    prompt = build_today_task_prompt(db, user_id, goal_id)
+    if prompt is None:
+        return None
+    return generate_gemini_message(prompt, refresh=refresh, raise_errors=raise_errors)
+
+def build_today_task_prompt(db, user_id, goal_id):
+    """The today's-task prompt for one of the user's goals, or None if the user has no such goal."""
+    # Fetch the complete goal details
+    goal = get_goal(db, user_id, goal_id, 'goal_id, description, positive_reasons, consequences_of_inaction, status')
+    if not goal:
+        return None
+
+    # Goal context, this week's progress and a budgeted summary of the goal's full history
+    # (success rate, streaks, peak times, a few representative past tasks)
+    goal_id = goal['goal_id']
+    return prompts.today_task_prompt(db, goal, goal_id, get_week_progress(db, goal_id), budget=TASK_PROMPT_BUDGET)
+
+def generate_coach_message(goal, raise_errors=False):
+    """A short motivational message for the goal (a row with description and positive_reasons)."""
+    return generate_gemini_message(prompts.coach_message_prompt(goal), raise_errors=raise_errors) # Cached per goal, so reloads don't call the API again
+
+def precompute_suggestion(db, goal_id):
+    """Today's (task_description, coach_message) for precompute.py, or None if the goal is gone.
+
+    Uses the same prompts as the live routes, and raises on AI failures so that placeholder
+    messages are never stored.
+    """
+    # Runs for every user's goals, so the goal's own user_id is the scope
+    goal = db.execute("SELECT user_id, description, positive_reasons FROM goals WHERE goal_id = ?", (goal_id,)).fetchone()
+    if goal is None:
+        return None
+    task_description = generate_today_task(db, goal['user_id'], goal_id, raise_errors=True)
+    return task_description, generate_coach_message(goal, raise_errors=True)
+
+# --- Batched planning: every day of a plan, for one or more goals, in a single AI call ---
+MAX_PLAN_DAYS = 31
+MAX_PLAN_GOALS = 10
+
+def plan_dates(days, start=None):
+    """ISO dates of the ``days`` days starting at ``start`` (default today)."""
+    start = start or datetime.date.today()
+    return [(start + datetime.timedelta(days=i)).isoformat() for i in range(days)]
+
+def load_plan_goals(db, goal_ids, user_id):
+    """Returns the user's goals among ``goal_ids`` (as dicts), in request order."""
+    placeholders = ','.join('?' * len(goal_ids))
+    rows = {row['goal_id']: row for row in db.execute(
+        f"""SELECT goal_id, description, positive_reasons, consequences_of_inaction
+            FROM goals WHERE user_id = ? AND goal_id IN ({placeholders})""",
+        (user_id, *goal_ids))}
+    return [dict(rows[goal_id]) for goal_id in dict.fromkeys(goal_ids) if goal_id in rows]
+
+def plan_tasks(db, goals, dates):
+    """Plans one task per goal per date with a single AI call.
+
+    Returns (plans, report): plans maps goal_id to its tasks in date order, and days the
+    response did not cover (or the whole plan, if the call fails) come from the offline
+    templates, which the report counts as 'filled'.
+    """
+    prompt = prompts.plan_prompt(db, goals, dates, budget=PLAN_PROMPT_BUDGET)
+    try:
+        text = generate_gemini_message(prompt, raise_errors=True, json_schema=PLAN_SCHEMA)
+    except Exception as e:
+        log.error("Planning tasks with the AI backend failed, using templates: %s", e)
+        text = ''
+    plans, report = parse_plan(text, {goal['goal_id']: goal['description'] for goal in goals}, dates)
+    if report['filled']:
+        log.warning("Plan response covered %d of %d tasks (%s); filled the rest from templates.",
+                    report['parsed'], report['parsed'] + report['filled'], report['format'])
+    return plans, report
+
+# --- Keyset pagination of a goal's tasks ---
+TASK_LIST_COLUMNS = "task_id, description, due_date, status" # Only what goal_detail.html renders
+
+def query_task_page(db, goal_id, after=None, before=None, limit=TASK_PAGE_SIZE):
+    """Returns a cursor over one page of a goal's tasks in (due_date, task_id) order.
+
+    ``after`` and ``before`` are (due_date, task_id) keys of the last/first task already shown.
+    Pages before a key come back newest first, so callers reverse them.
+    """
+    if before is not None:
+        return db.execute(
+            f"""SELECT {TASK_LIST_COLUMNS} FROM tasks
+                WHERE goal_id = ? AND (due_date, task_id) < (?, ?)
+                ORDER BY due_date DESC, task_id DESC LIMIT ?""",
+            (goal_id, before[0], before[1], limit))
+    after = after or ('', 0)
+    return db.execute(
+        f"""SELECT {TASK_LIST_COLUMNS} FROM tasks
+            WHERE goal_id = ? AND (due_date, task_id) > (?, ?)
+            ORDER BY due_date, task_id LIMIT ?""",
+        (goal_id, after[0], after[1], limit))
+
+def task_window_start(today=None):
+    """Keyset position the goal page starts from: the first task due TASK_WINDOW_PAST_DAYS ago."""
+    today = today or datetime.date.today()
+    return ((today - datetime.timedelta(days=TASK_WINDOW_PAST_DAYS)).isoformat(), 0)
 
 # --- Function to get last week's goals descriptions ---
 def get_last_week_goals_descriptions():
@@ -158,34 +458,58 @@ def get_last_week_goals_descriptions():
     try:
         last_week_goals = db.execute(
             "SELECT description FROM goals WHERE user_id = ? AND creation_date >= date('now', '-7 days') AND creation_date < date('now')",
-            (DEFAULT_USER_ID,)
+            (g.user_id,)
         ).fetchall()
         return ", ".join([goal['description'] for goal in last_week_goals]) if last_week_goals else None
     except sqlite3.Error as e:
-        print(f"🔴 Database error fetching last week's goals: {e}")
+        log.error("Database error fetching last week's goals: %s", e)
         flash(f"Error fetching last week's goals: {e}", "error")
         return None
-        # print(traceback.format_exc())
-        return f"AI Coach message unavailable (API Error: Please check server logs)."
 
-@app.route('/')
+# --- Conditional GETs (ETag / Last-Modified) for the HTML pages ---
+def _page_validators(page, versions, *extra):
+    """(etag, last_modified) for a page built from ``versions``, or None when it can't be cached.
+
+    Pages showing flash messages are one-offs and get no validators.
+    """
+    if session.get('_flashes'):
+        return None
+    stamps = [f"{scope}:{id_}:{version}:{updated_at}" for (scope, id_), (version, updated_at) in sorted(versions.items())]
+    today = datetime.date.today()
+    etag = make_etag(current_app.config['TEMPLATES_FINGERPRINT'], page, g.user_id, today, *extra, *stamps)
+    return etag, last_modified(versions, today)
+
+def _not_modified(etag, modified):
+    return _with_validators(current_app.response_class(status=304), (etag, modified))
+
+def _with_validators(response, validators):
+    """Adds the ETag and Last-Modified headers; browsers must revalidate before reusing the page."""
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    if validators:
+        response.set_etag(validators[0])
+        response.last_modified = validators[1]
+    return response
+
+@route('/')
 def index():
-    """Main dashboard showing active goals."""
+    """Main dashboard showing active goals. Conditional on the user's version counter."""
     db = get_db()
+    validators = _page_validators('index', get_versions(db, ('user', g.user_id)))
+    if validators and is_not_modified(request, *validators):
+        return _not_modified(*validators)
+
     goals = []
     try:
-        goals_cursor = db.execute(
-            "SELECT goal_id, description, status FROM goals WHERE user_id = ? AND status = 'Active' ORDER BY creation_date DESC",
-            (DEFAULT_USER_ID,)
-        )
-        goals = goals_cursor.fetchall()
+        goals = user_goals(db, g.user_id, status='Active')
     except sqlite3.Error as e:
-        print(f"🔴 Database error fetching goals: {e}")
+        log.error("Database error fetching goals: %s", e)
         flash(f"Error fetching goals: {e}", "error")
+        validators = None
 
-    return render_template('index.html', goals=goals)
+    return _with_validators(make_response(render_template('index.html', goals=goals)), validators)
 
-@app.route('/setup_goal', methods=['GET', 'POST'])
+@route('/setup_goal', methods=['GET', 'POST'])
 def setup_goal():
     """Displays form to set up a goal and handles submission."""
     if request.method == 'POST':
@@ -198,56 +522,46 @@ def setup_goal():
             flash('Goal description, positive reasons, and consequences are required.', 'error')
         else:
             try:
-                db = get_db()
-                db.execute(
+                # Write functions run on the writer thread, so everything from the request is bound here
+                goal = (g.user_id, description, target_date if target_date else None, positive_reasons, consequences)
+                run_write(lambda db: db.execute(
                     '''INSERT INTO goals (user_id, description, target_date, positive_reasons, consequences_of_inaction)
-                       VALUES (?, ?, ?, ?, ?)''',
-                    (DEFAULT_USER_ID, description, target_date if target_date else None, positive_reasons, consequences)
-                )
-                db.commit()
-                print(f"Goal '{description}' saved successfully.")
+                       VALUES (?, ?, ?, ?, ?)''', goal).lastrowid)
+                log.info("Goal saved: %r", description)
                 flash('Goal saved successfully!', 'success')
                 return redirect(url_for('index')) # Redirect to dashboard after saving
 
             except sqlite3.Error as e:
                 flash(f"Database error saving goal: {e}", "error")
-                print(f"🔴 Database error on goal save: {e}")
+                log.error("Database error saving goal: %s", e)
             except Exception as e:
                 flash(f"An unexpected error occurred: {e}", "error")
-                print(f"🔴 Unexpected error on goal save: {e}")
+                log.exception("Unexpected error saving goal: %s", e)
 
     # Handle GET request (or POST with errors - flash message displayed in template)
     return render_template('goal_setup.html')
 
-@app.route('/goal/<int:goal_id>', methods=['GET', 'POST'])
+@route('/goal/<int:goal_id>', methods=['GET', 'POST'])
 def goal_detail(goal_id):
-    """Shows goal details, lists tasks, handles adding tasks, AND gets AI message."""
-    db = get_db()
-    goal = None
-    tasks = []
-    ai_message = "AI message generation skipped (not a GET request or goal not found)." # Default
-
-    # Fetch the specific goal
-    try:
-        goal_cursor = db.execute(
-            "SELECT * FROM goals WHERE goal_id = ? AND user_id = ?",
-            (goal_id, DEFAULT_USER_ID)
-        )
-        goal = goal_cursor.fetchone()
-    except sqlite3.Error as e:
-        print(f"🔴 Error fetching goal {goal_id}: {e}")
-        flash(f"Could not fetch goal details: {e}", "error")
-        # Redirect immediately if goal fetch fails fundamentally
-        return redirect(url_for('index'))
+    """Shows goal details, lists tasks, handles adding tasks, AND gets AI message.
 
-    if goal is None:
-         # Only flash if no specific DB error was flashed already
-         if not get_flashed_messages(category_filter=["error"]):
-              flash("Goal not found or access denied.", "error")
-         return redirect(url_for('index')) # Redirect if goal is None after fetch attempt
+    GETs are conditional (ETag/Last-Modified from the goal's version counter), and the goal
+    header and task list fragments are rendered once per goal version and day.
+    """
+    db = get_db()
 
     # --- Handle Adding a New Task (POST request) ---
     if request.method == 'POST':
+        try:
+            goal = get_goal(db, g.user_id, goal_id, 'goal_id')
+        except sqlite3.Error as e:
+            log.error("Database error fetching goal %s: %s", goal_id, e)
+            flash(f"Could not fetch goal details: {e}", "error")
+            return redirect(url_for('index'))
+        if goal is None:
+            flash("Goal not found or access denied.", "error")
+            return redirect(url_for('index'))
+
         task_description = request.form.get('task_description')
         task_due_date = request.form.get('task_due_date') # Consider date validation
 
@@ -255,99 +569,167 @@ def goal_detail(goal_id):
             flash("Task description and due date are required.", "error")
         else:
             try:
-                # Ensure DB connection is available (though usually it is from 'db = get_db()' above)
-                # db = get_db() # Redundant if already called
-                db.execute(
-                    "INSERT INTO tasks (goal_id, description, due_date) VALUES (?, ?, ?)",
-                    (goal_id, task_description, task_due_date)
-                )
-                db.commit()
+                run_write(insert_tasks, [{'goal_id': goal_id, 'description': task_description, 'due_date': task_due_date}],
+                          g.user_id)
                 flash("Task added successfully!", "success")
                 # Redirect back to the same page using GET to show the new task and clear form
                 return redirect(url_for('goal_detail', goal_id=goal_id))
+            except TaskValidationError as e:
+                flash(f"Invalid task: {e.errors[0]['error']}", "error")
             except sqlite3.Error as e:
                 flash(f"Database error adding task: {e}", "error")
-                print(f"🔴 Error adding task for goal {goal_id}: {e}")
+                log.error("Database error adding a task to goal %s: %s", goal_id, e)
                 # Fall through to render template again, showing the error message
             except Exception as e:
                  flash(f"An unexpected error occurred while adding task: {e}", "error")
-                 print(f"🔴 Unexpected error adding task for goal {goal_id}: {e}")
+                 log.exception("Unexpected error adding a task to goal %s: %s", goal_id, e)
                  # Fall through to render template
 
-    # --- Fetch existing tasks for this goal (Always done for GET, or after POST if redirect didn't happen) ---
+    # --- Conditional GET: an unchanged goal costs one primary-key lookup and a 304 ---
+    today = datetime.date.today()
+    versions = get_versions(db, ('goal', goal_id))
+    version = versions[('goal', goal_id)][0]
+    validators = _page_validators('goal_detail', versions, goal_id, TASK_PAGE_SIZE)
+    if validators and request.method == 'GET' and is_not_modified(request, *validators):
+        return _not_modified(*validators)
+
+    # --- Goal header: details, motivations and the AI coach message ---
+    header = page_fragments.get_or_render(
+        ('goal_header', g.user_id, goal_id, version, today),
+        lambda: _render_goal_header(db, goal_id))
+    if header is None:
+        # Only flash if no specific DB error was flashed already
+        if not get_flashed_messages(category_filter=["error"]):
+            flash("Goal not found or access denied.", "error")
+        return redirect(url_for('index'))
+    if not header['cacheable']:
+        validators = None # The AI message failed: don't let browsers keep this page
+
+    # --- Task list: the window of tasks around today ---
+    # Only a page of tasks around today is rendered; older and later tasks are fetched by
+    # the page's infinite scroll from /goal/<id>/tasks.
+    tasks_html = page_fragments.get_or_render(
+        ('goal_tasks', g.user_id, goal_id, version, today),
+        lambda: _render_goal_tasks(db, goal_id, today))
+
+    # Flashes are popped from the session, which can't be saved once the response is streaming
+    get_flashed_messages(with_categories=True)
+    # Pass all necessary variables to the template
+    response = current_app.response_class(stream_template(
+        'goal_detail.html', goal={'goal_id': goal_id, 'description': header['description']},
+        header_html=Markup(header['html']), tasks_html=Markup(tasks_html),
+        page_size=TASK_PAGE_SIZE, today_date=today.isoformat()))
+    return _with_validators(response, validators)
+
+def _render_goal_header(db, goal_id):
+    """Renders the goal header fragment. Returns (None, False) if the goal doesn't exist."""
     try:
-         tasks_cursor = db.execute(
-             "SELECT * FROM tasks WHERE goal_id = ? ORDER BY due_date, status, creation_date",
-             (goal_id,)
-         )
-         tasks = tasks_cursor.fetchall()
+        goal = get_goal(db, g.user_id, goal_id)
     except sqlite3.Error as e:
-        flash("Could not fetch tasks.", "error")
-        print(f"🔴 Error fetching tasks for goal {goal_id}: {e}")
-        # Allow template rendering even if task fetch fails, but show error
+        log.error("Database error fetching goal %s: %s", goal_id, e)
+        flash(f"Could not fetch goal details: {e}", "error")
+        return None, False
+    if goal is None:
+        return None, False
 
-    # --- Generate AI Message (Only on GET request AND if goal exists AND API configured) ---
-    if request.method == 'GET': # Crucial: Only call API on GET
-        if goal and GEMINI_CONFIGURED:
-            try:
-                # Construct a prompt using the goal's data
-                prompt = f"""
-                Act as a very brief, supportive coach. Look at the following goal and the user's reasons for achieving it.
-                Goal: "{goal['description']}"
-                User's Reasons Why: "{goal['positive_reasons']}"
-
-                Based ONLY on the information above, provide a short (1-2 sentences maximum) encouraging message to help this user stay motivated towards their goal today. Do not ask questions. Be positive and direct. Address the user ("You...").
-                """
-                # ai_message = generate_gemini_message(prompt)
-                ai_message = "AI features are disabled."
-            except Exception as e:
-                 # Catch potential errors during prompt construction or the call itself
-                 print(f"🔴 Error during AI message generation logic: {e}")
-                 ai_message = "AI Coach message generation failed."
-        elif goal and not GEMINI_CONFIGURED:
-            ai_message = "AI features require API configuration."
+    cacheable = True
+    try:
+        # Precomputed overnight by precompute.py when available, generated live otherwise
+        suggestion = get_suggestion(db, goal_id)
+        if suggestion is not None and suggestion['coach_message']:
+            ai_message = suggestion['coach_message']
         else:
-             # This case shouldn't typically be hit due to checks above, but included for completeness
-             ai_message = "Cannot generate AI message (Goal missing or API issue)."
-
-
-    # Get today's date for the default due date input in the form
-    today_date = datetime.date.today().isoformat()
+            ai_message = generate_coach_message(goal, raise_errors=True)
+    except Exception as e:
+        log.exception("AI message generation failed: %s", e)
+        ai_message = "AI Coach message unavailable right now."
+        cacheable = False
+    html = render_template('_goal_header.html', goal=goal, ai_message=ai_message)
+    return {'description': goal['description'], 'html': html, 'cacheable': cacheable}, cacheable
+
+def _render_goal_tasks(db, goal_id, today):
+    """Renders the task list fragment (a page of tasks from TASK_WINDOW_PAST_DAYS ago onwards)."""
+    window_start = task_window_start(today)
+    try:
+        has_earlier_tasks = db.execute(
+            "SELECT 1 FROM tasks WHERE goal_id = ? AND due_date < ? LIMIT 1",
+            (goal_id, window_start[0])
+        ).fetchone() is not None
+        tasks = query_task_page(db, goal_id, after=window_start).fetchall()
+    except sqlite3.Error as e:
+        flash("Could not fetch tasks.", "error")
+        log.error("Database error fetching tasks of goal %s: %s", goal_id, e)
+        # Render an empty list rather than failing the whole page, but don't cache it
+        return render_template('_goal_tasks.html', goal={'goal_id': goal_id}, tasks=[], has_earlier_tasks=False), False
+    html = render_template('_goal_tasks.html', goal={'goal_id': goal_id}, tasks=tasks,
+                           has_earlier_tasks=has_earlier_tasks)
+    return html, True
+
+@route('/goal/<int:goal_id>/tasks')
+def goal_tasks(goal_id):
+    """Returns one page of a goal's tasks as JSON (the goal page's infinite scroll).
+
+    Query args: after_due & after_id (tasks after that key), or before_due & before_id
+    (tasks before it), and limit. Without a key, the page starts at the default window.
+    """
+    db = get_db()
+    try:
+        limit = min(max(int(request.args.get('limit', TASK_PAGE_SIZE)), 1), MAX_TASK_PAGE_SIZE)
+        after = before = None
+        if request.args.get('before_due') is not None:
+            before = (request.args['before_due'], int(request.args.get('before_id', 0)))
+        elif request.args.get('after_due') is not None:
+            after = (request.args['after_due'], int(request.args.get('after_id', 0)))
+        else:
+            after = task_window_start()
+    except ValueError:
+        return jsonify({"error": "limit, after_id and before_id must be integers."}), 400
 
-    # Pass all necessary variables to the template
-    return render_template('goal_detail.html', goal=goal, tasks=tasks, today_date=today_date, ai_message=ai_message)
+    try:
+        goal = get_goal(db, g.user_id, goal_id, 'goal_id')
+        if not goal:
+            return jsonify({"error": "Goal not found."}), 404
+        rows = query_task_page(db, goal_id, after=after, before=before, limit=limit + 1).fetchall()
+    except sqlite3.Error as e:
+        log.error("Database error fetching tasks of goal %s: %s", goal_id, e)
+        return jsonify({"error": f"Database error: {e}"}), 500
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+    tasks = [dict(row) for row in rows]
+    return jsonify({
+        "tasks": tasks,
+        "has_more": has_more, # More tasks in the requested direction
+        "first": {"due_date": tasks[0]['due_date'], "task_id": tasks[0]['task_id']} if tasks else None,
+        "last": {"due_date": tasks[-1]['due_date'], "task_id": tasks[-1]['task_id']} if tasks else None,
+    })
 
 # app.py - PART 5: Task Action Routes & Main Execution
 # ==================================================
 # (Append this code below Part 4)
 
 # --- Task Action Routes ---
-@app.route('/task/<int:task_id>/complete', methods=['POST'])
-def mark_task_complete(task_id):
-    """Marks a task as Completed."""
-    db = get_db()
+def _change_task_status(task_id, status, message, category, action):
+    """Shared body of the single-task status routes: update through set_task_statuses, flash, redirect."""
     goal_id = None # Initialize goal_id to handle potential errors
     try:
-        # Verify task belongs to the default user before updating
-        task = db.execute("SELECT goal_id FROM tasks WHERE task_id = ? AND goal_id IN (SELECT goal_id FROM goals WHERE user_id = ?)",
-                          (task_id, DEFAULT_USER_ID)).fetchone()
-        if task:
-            goal_id = task['goal_id']
-            completion_time = datetime.datetime.now() # Record precise completion time
-            db.execute("UPDATE tasks SET status = 'Completed', completion_date = ? WHERE task_id = ?",
-                       (completion_time, task_id))
-            db.commit()
-            flash(f"Task marked as Completed!", "success")
-            print(f"Task {task_id} marked complete.")
+        # Ownership is verified against the current user inside set_task_statuses
+        result = run_write(set_task_statuses, [(task_id, status)], g.user_id)[0]
+        if result['ok']:
+            goal_id = result['goal_id']
+            flash(message, category)
+            log.info("Task %s %s.", task_id, action)
         else:
-            flash("Task not found or not accessible.", "error")
+            flash(result['error'], "error")
 
     except sqlite3.Error as e:
         flash(f"Database error updating task: {e}", "error")
-        print(f"🔴 DB error completing task {task_id}: {e}")
+        log.error("Database error setting task %s to %s: %s", task_id, status, e)
     except Exception as e:
          flash(f"An unexpected error occurred: {e}", "error")
-         print(f"🔴 Unexpected error completing task {task_id}: {e}")
+         log.exception("Unexpected error setting task %s to %s: %s", task_id, status, e)
 
     # Redirect logic: Redirects to goal detail if possible, otherwise index
     if goal_id:
@@ -356,71 +738,67 @@ def mark_task_complete(task_id):
         # If goal_id couldn't be determined (task not found or error before fetch)
         return redirect(url_for('index'))
 
-@app.route('/task/<int:task_id>/missed', methods=['POST'])
+@route('/task/<int:task_id>/complete', methods=['POST'])
+def mark_task_complete(task_id):
+    """Marks a task as Completed."""
+    return _change_task_status(task_id, 'Completed', "Task marked as Completed!", "success", "marked complete")
+
+@route('/task/<int:task_id>/missed', methods=['POST'])
 def mark_task_missed(task_id):
     """Marks a task as Missed."""
-    db = get_db()
-    goal_id = None
-    try:
-        # Get the goal_id for redirection and verification
-        task = db.execute("SELECT goal_id FROM tasks WHERE task_id = ? AND goal_id IN (SELECT goal_id FROM goals WHERE user_id = ?)",
-                          (task_id, DEFAULT_USER_ID)).fetchone()
-        if task:
-            goal_id = task['goal_id']
-            # Set status to Missed, clear completion date
-            db.execute("UPDATE tasks SET status = 'Missed', completion_date = NULL WHERE task_id = ?", (task_id,))
-            db.commit()
-            flash(f"Task marked as Missed.", "warning") # Use 'warning' category for missed?
-            print(f"Task {task_id} marked missed.")
-        else:
-            flash("Task not found or not accessible.", "error")
-
-    except sqlite3.Error as e:
-        flash(f"Database error updating task: {e}", "error")
-        print(f"🔴 DB error marking task {task_id} missed: {e}")
-    except Exception as e:
-         flash(f"An unexpected error occurred: {e}", "error")
-         print(f"🔴 Unexpected error marking task {task_id} missed: {e}")
-
-    # Redirect logic
-    if goal_id:
-        return redirect(url_for('goal_detail', goal_id=goal_id))
-    else:
-        return redirect(url_for('index'))
+    return _change_task_status(task_id, 'Missed', "Task marked as Missed.", "warning", "marked missed")
 
-@app.route('/task/<int:task_id>/reset', methods=['POST'])
+@route('/task/<int:task_id>/reset', methods=['POST'])
 def reset_task_status(task_id):
     """Resets a task status back to Planned."""
-    db = get_db()
-    goal_id = None
-    try:
-        # Get the goal_id for redirection and verification
-        task = db.execute("SELECT goal_id FROM tasks WHERE task_id = ? AND goal_id IN (SELECT goal_id FROM goals WHERE user_id = ?)",
-                          (task_id, DEFAULT_USER_ID)).fetchone()
-        if task:
-            goal_id = task['goal_id']
-            # Set status back to Planned, clear completion date
-            db.execute("UPDATE tasks SET status = 'Planned', completion_date = NULL WHERE task_id = ?", (task_id,))
-            db.commit()
-            flash(f"Task status reset to Planned.", "info") # Use 'info' category
-            print(f"Task {task_id} status reset.")
-        else:
-            flash("Task not found or not accessible.", "error")
-
+    return _change_task_status(task_id, 'Planned', "Task status reset to Planned.", "info", "status reset")
+
+@route('/tasks/status', methods=['POST'])
+def bulk_update_task_status():
+    """Applies many status changes in one transaction and returns a result per task.
+
+    Body: {"updates": [{"task_id": 1, "status": "Completed"}, ...]}. Status is one of
+    Planned, Completed or Missed; tasks that are not found are reported, not fatal.
+    """
+    data = request.get_json(silent=True) or {}
+    updates = data.get('updates')
+    if not isinstance(updates, list) or not updates or not all(isinstance(u, dict) for u in updates):
+        return jsonify({'error': 'updates must be a non-empty list of {task_id, status} objects'}), 400
+    try:
+        results = run_write(set_task_statuses, [(u.get('task_id'), u.get('status')) for u in updates], g.user_id)
+    except TaskValidationError as e:
+        return jsonify({'error': str(e), 'errors': e.errors}), 400
     except sqlite3.Error as e:
-        flash(f"Database error updating task: {e}", "error")
-        print(f"🔴 DB error resetting task {task_id}: {e}")
-    except Exception as e:
-         flash(f"An unexpected error occurred: {e}", "error")
-         print(f"🔴 Unexpected error resetting task {task_id}: {e}")
-
-    # Redirect logic
-    if goal_id:
-        return redirect(url_for('goal_detail', goal_id=goal_id))
-    else:
-        return redirect(url_for('index'))
-
-@app.route('/generate_tasks', methods=['POST'])
+        log.error("Database error on bulk status update: %s", e)
+        return jsonify({'error': f"Database error: {e}"}), 500
+    updated = sum(1 for r in results if r['ok'] and r['changed'])
+    log.info("Bulk status update: %d of %d tasks changed.", updated, len(results))
+    return jsonify({'results': results, 'updated': updated,
+                    'failed': sum(1 for r in results if not r['ok'])})
+
+@route('/tasks/sweep_overdue', methods=['POST'])
+def sweep_overdue():
+    """Marks every Planned task due before today as Missed (optionally for one goal only)."""
+    data = request.get_json(silent=True) or request.form
+    if not isinstance(data, dict):
+        return jsonify({'error': 'body must be a JSON object'}), 400
+    goal_id = data.get('goal_id')
+    try:
+        goal_id = int(goal_id) if goal_id else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'goal_id must be an integer'}), 400
+    try:
+        count = run_write(sweep_overdue_tasks, user_id=g.user_id, goal_id=goal_id)
+    except sqlite3.Error as e:
+        log.error("Database error sweeping overdue tasks: %s", e)
+        return jsonify({'error': f"Database error: {e}"}), 500
+    log.info("Overdue sweep marked %d tasks as Missed.", count)
+    if request.is_json:
+        return jsonify({'missed': count})
+    flash(f"Marked {count} overdue tasks as Missed." if count else "No overdue tasks.", "warning" if count else "info")
+    return redirect(url_for('goal_detail', goal_id=goal_id) if goal_id else url_for('index'))
+
+@route('/generate_tasks', methods=['POST'])
 def generate_tasks():
     """Generates 7 tasks for the next 7 days based on the goal description."""
     db = get_db()
@@ -429,31 +807,28 @@ def generate_tasks():
     if not goal_id:
         flash("Goal ID is missing.", "error")
         return redirect(url_for('index'))
+    try:
+        goal_id = int(goal_id)
+    except ValueError:
+        flash("Goal not found.", "error")
+        return redirect(url_for('index'))
 
     try:
-        # Fetch the goal description
-        goal = db.execute("SELECT description FROM goals WHERE goal_id = ?", (goal_id,)).fetchone()
-        if not goal:
+        goals = load_plan_goals(db, [goal_id], g.user_id)
+        if not goals:
             flash("Goal not found.", "error")
             return redirect(url_for('index'))
 
-        goal_description = goal['description']
+        # Plan all 7 days in one AI call
+        plans, _ = plan_tasks(db, goals, plan_dates(7))
+        tasks = [dict(task, goal_id=goal_id) for task in plans[goal_id]]
 
-        # Generate 7 tasks based on the goal description
-        tasks = [
-            f"{goal_description} - Task {i+1}" for i in range(7)
-        ]
-
-        # Insert tasks into the database
-        for i, task in enumerate(tasks):
-            due_date = (datetime.date.today() + datetime.timedelta(days=i)).isoformat()
-            db.execute(
-                "INSERT INTO tasks (goal_id, description, due_date, status) VALUES (?, ?, ?, 'Planned')",
-                (goal_id, task, due_date)
-            )
-        db.commit()
+        # Insert all tasks in one transaction
+        run_write(insert_tasks, tasks, g.user_id)
 
         flash("7 tasks for the next 7 days have been generated successfully!", "success")
+    except TaskValidationError as e:
+        flash(f"Could not save generated tasks: {e.errors[0]['error']}", "error")
     except sqlite3.Error as e:
         flash(f"Database error: {e}", "error")
     except Exception as e:
@@ -462,7 +837,7 @@ def generate_tasks():
     return redirect(url_for('goal_detail', goal_id=goal_id))
 
 # Add a button to generate tasks until the coming Sunday
-@app.route('/generate_tasks_until_sunday', methods=['POST'])
+@route('/generate_tasks_until_sunday', methods=['POST'])
 def generate_tasks_until_sunday():
     """Generates tasks pertinent to the goal, one per day until the coming Sunday."""
     db = get_db()
@@ -471,36 +846,32 @@ def generate_tasks_until_sunday():
     if not goal_id:
         flash("Goal ID is missing.", "error")
         return redirect(url_for('index'))
+    try:
+        goal_id = int(goal_id)
+    except ValueError:
+        flash("Goal not found.", "error")
+        return redirect(url_for('index'))
 
     try:
-        # Fetch the goal description
-        goal = db.execute("SELECT description FROM goals WHERE goal_id = ?", (goal_id,)).fetchone()
-        if not goal:
+        goals = load_plan_goals(db, [goal_id], g.user_id)
+        if not goals:
             flash("Goal not found.", "error")
             return redirect(url_for('index'))
 
-        goal_description = goal['description']
-
         # Calculate the number of days until the coming Sunday
         today = datetime.date.today()
         days_until_sunday = (6 - today.weekday()) % 7
 
-        # Generate tasks for each day until Sunday
-        tasks = [
-            f"{goal_description} - Task for {today + datetime.timedelta(days=i)}"
-            for i in range(days_until_sunday + 1)
-        ]
-
-        # Insert tasks into the database
-        for i, task in enumerate(tasks):
-            due_date = (today + datetime.timedelta(days=i)).isoformat()
-            db.execute(
-                "INSERT INTO tasks (goal_id, description, due_date, status) VALUES (?, ?, ?, 'Planned')",
-                (goal_id, task, due_date)
-            )
-        db.commit()
+        # Plan every day until Sunday in one AI call
+        plans, _ = plan_tasks(db, goals, plan_dates(days_until_sunday + 1, today))
+        tasks = [dict(task, goal_id=goal_id) for task in plans[goal_id]]
+
+        # Insert all tasks in one transaction
+        run_write(insert_tasks, tasks, g.user_id)
 
         flash("Tasks until the coming Sunday have been generated successfully!", "success")
+    except TaskValidationError as e:
+        flash(f"Could not save generated tasks: {e.errors[0]['error']}", "error")
     except sqlite3.Error as e:
         flash(f"Database error: {e}", "error")
     except Exception as e:
@@ -508,7 +879,7 @@ def generate_tasks_until_sunday():
 
     return redirect(url_for('goal_detail', goal_id=goal_id))
 
-@app.route('/generate_tasks_dialog', methods=['POST'])
+@route('/generate_tasks_dialog', methods=['POST'])
 def generate_tasks_dialog():
     """Generates tasks and returns them for display in a dialog box."""
     db = get_db()
@@ -516,20 +887,19 @@ def generate_tasks_dialog():
 
     if not goal_id:
         return {"error": "Goal ID is missing."}, 400
+    try:
+        goal_id = int(goal_id)
+    except ValueError:
+        return {"error": "Goal not found."}, 404
 
     try:
-        # Fetch the goal description
-        goal = db.execute("SELECT description FROM goals WHERE goal_id = ?", (goal_id,)).fetchone()
-        if not goal:
+        goals = load_plan_goals(db, [goal_id], g.user_id)
+        if not goals:
             return {"error": "Goal not found."}, 404
 
-        goal_description = goal['description']
-
-        # Generate 7 tasks based on the goal description
-        tasks = [
-            {"id": i + 1, "description": f"{goal_description} - Task {i + 1}", "due_date": (datetime.date.today() + datetime.timedelta(days=i)).isoformat()}
-            for i in range(7)
-        ]
+        # Plan all 7 days in one AI call
+        plans, _ = plan_tasks(db, goals, plan_dates(7))
+        tasks = [dict(task, id=i + 1) for i, task in enumerate(plans[goal_id])]
 
         return {"tasks": tasks}, 200
 
@@ -538,7 +908,101 @@ def generate_tasks_dialog():
     except Exception as e:
         return {"error": f"An unexpected error occurred: {e}"}, 500
 
-@app.route('/regenerate_task', methods=['POST'])
+@route('/goal/<int:goal_id>/generate_tasks_stream')
+def generate_tasks_stream(goal_id):
+    """Streams an AI plan for the next ``days`` days (default 7) as Server-Sent Events.
+
+    The whole plan comes from one structured (JSON) AI call. Events: 'chunk' (raw text as it
+    arrives), 'task' (each task as soon as its JSON object is complete), then 'done' with
+    the final plan (repaired, one task per day, gaps filled from templates), or 'error'.
+    Nothing is saved; the dialog posts the tasks the user keeps to /save_tasks.
+    """
+    db = get_db()
+    try:
+        days = min(max(int(request.args.get('days', 7)), 1), MAX_PLAN_DAYS)
+    except ValueError:
+        return jsonify({"error": "days must be an integer."}), 400
+
+    goals = load_plan_goals(db, [goal_id], g.user_id)
+    if not goals:
+        return jsonify({"error": "Goal not found."}), 404
+
+    dates = plan_dates(days)
+    prompt = prompts.plan_prompt(db, goals, dates, budget=PLAN_PROMPT_BUDGET)
+    close_db() # Don't hold a pooled connection for the whole stream
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def events():
+        parser = PlanStreamParser(default_goal_id=goal_id)
+        sent = set() # Due dates already streamed; the model may repeat or stray outside the plan
+        try:
+            for text in stream_gemini_message(prompt, json_schema=PLAN_SCHEMA):
+                yield sse('chunk', {'text': text})
+                for task in parser.feed(text):
+                    if task['goal_id'] == goal_id and task['due_date'] in dates and task['due_date'] not in sent:
+                        sent.add(task['due_date'])
+                        yield sse('task', dict(task, id=len(sent)))
+        except Exception as e:
+            log.exception("Streaming tasks from the LLM failed: %s", e)
+            yield sse('error', {'error': "AI task generation failed. Please try again.",
+                                'tasks': [task for task in parser.tasks if task['due_date'] in sent]})
+            return
+        plans, report = parse_plan(parser.text, {goal_id: goals[0]['description']}, dates)
+        tasks = [dict(task, id=i + 1, goal_id=goal_id) for i, task in enumerate(plans[goal_id])]
+        yield sse('done', {'tasks': tasks, 'report': report})
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@route('/plans', methods=['POST'])
+def create_plans():
+    """Plans ``days`` days for several goals with one AI call, optionally saving the tasks.
+
+    Body: {"goal_ids": [1, 2], "days": 7, "save": false, "start_date": "YYYY-MM-DD"}.
+    Returns {"plans": [{"goal_id", "tasks"}], "report": {...}}, plus "task_ids" when saved
+    (honouring an Idempotency-Key header like /tasks/bulk).
+    """
+    db = get_db()
+    data = request.get_json(silent=True) or {}
+    try:
+        goal_ids = [int(goal_id) for goal_id in data.get('goal_ids') or []]
+        days = int(data.get('days', 7))
+        start = datetime.date.fromisoformat(data['start_date']) if data.get('start_date') else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "goal_ids must be integers, days an integer and start_date YYYY-MM-DD."}), 400
+    if not goal_ids or len(goal_ids) > MAX_PLAN_GOALS:
+        return jsonify({"error": f"goal_ids must list 1 to {MAX_PLAN_GOALS} goals."}), 400
+    if not 1 <= days <= MAX_PLAN_DAYS:
+        return jsonify({"error": f"days must be between 1 and {MAX_PLAN_DAYS}."}), 400
+
+    goals = load_plan_goals(db, goal_ids, g.user_id)
+    missing = sorted(set(goal_ids) - {goal['goal_id'] for goal in goals})
+    if missing:
+        return jsonify({"error": f"Goal(s) not found: {', '.join(map(str, missing))}."}), 404
+
+    plans, report = plan_tasks(db, goals, plan_dates(days, start))
+    result = {"plans": [{"goal_id": goal_id, "tasks": tasks} for goal_id, tasks in plans.items()],
+              "report": report}
+    if not data.get('save'):
+        return jsonify(result), 200
+
+    tasks = [dict(task, goal_id=goal_id) for goal_id, goal_tasks in plans.items() for task in goal_tasks]
+    try:
+        task_ids, replayed = run_write(insert_tasks, tasks, g.user_id,
+                                       idempotency_key=request.headers.get('Idempotency-Key'))
+    except TaskValidationError as e:
+        return jsonify({"error": str(e), "errors": e.errors}), 400
+    except IdempotencyConflictError as e:
+        return jsonify({"error": str(e)}), 422
+    except sqlite3.Error as e:
+        log.error("Database error saving planned tasks: %s", e)
+        return jsonify({"error": f"Database error: {e}"}), 500
+    result.update(task_ids=task_ids, replayed=replayed)
+    return jsonify(result), 200 if replayed else 201
+
+@route('/regenerate_task', methods=['POST'])
 def regenerate_task():
     """Regenerates a single task based on the goal description and context."""
     db = get_db()
@@ -550,59 +1014,10 @@ def regenerate_task():
         return jsonify({"error": "Goal ID is missing."}), 400
 
     try:
-        # Fetch the complete goal details
-        goal = db.execute("""
-            SELECT description, positive_reasons, consequences_of_inaction, status 
-            FROM goals WHERE goal_id = ?""", 
-            (goal_id,)
-        ).fetchone()
-        
-        if not goal:
+        task_description = generate_today_task(db, g.user_id, goal_id, refresh=True) # User asked for a different task
+        if task_description is None:
             return jsonify({"error": "Goal not found."}), 404
 
-        # Get tasks from this week and their status
-        week_start = datetime.date.today() - datetime.timedelta(days=datetime.date.today().weekday())
-        week_tasks = db.execute("""
-            SELECT description, status, due_date 
-            FROM tasks 
-            WHERE goal_id = ? 
-            AND due_date >= ? 
-            ORDER BY due_date DESC""",
-            (goal_id, week_start.isoformat())
-        ).fetchall()
-
-        completed_this_week = sum(1 for task in week_tasks if task['status'] == 'Completed')
-        missed_this_week = sum(1 for task in week_tasks if task['status'] == 'Missed')
-
-        # Generate task description based on goal context and progress
-        if GEMINI_CONFIGURED:
-            prompt = f"""
-            Based on this goal and context, generate ONE specific, actionable task for today:
-
-            Goal: {goal['description']}
-            Motivation: {goal['positive_reasons']}
-            Consequences if not achieved: {goal['consequences_of_inaction']}
-
-            Progress this week:
-            - Completed tasks: {completed_this_week}
-            - Missed tasks: {missed_this_week}
-
-            Generate a single, specific task that:
-            1. Directly relates to achieving the goal
-            2. Builds on their progress if they're doing well
-            3. Is more achievable if they've been struggling
-            4. Is concrete and actionable
-            5. Can be completed today
-
-            Return ONLY the task description, nothing else.
-            """
-            
-            task_description = generate_gemini_message(prompt)
-        else:
-            # Fallback if AI is not configured
-            progress_status = "doing well" if completed_this_week > missed_this_week else "working on building consistency"
-            task_description = f"For your goal to {goal['description']}: What's one specific thing you can do today? (You're {progress_status} this week with {completed_this_week} completed tasks)"
-
         today_date = datetime.date.today().isoformat()
 
         # Return the regenerated task
@@ -615,36 +1030,37 @@ def regenerate_task():
         })
 
     except Exception as e:
-        print(f"🔴 Error regenerating task: {e}")
+        log.exception("Regenerating a task failed: %s", e)
         return jsonify({"error": str(e)}), 500
 
-@app.route('/save_tasks', methods=['POST'])
+@route('/save_tasks', methods=['POST'])
 def save_tasks():
     """Saves the generated tasks to the database."""
-    db = get_db()
-    goal_id = request.form.get('goal_id')
-    tasks = request.json.get('tasks')
+    data = request.get_json(silent=True) or {}
+    goal_id = data.get('goal_id') or request.form.get('goal_id')
+    tasks = data.get('tasks')
 
     if not goal_id or not tasks:
         return {"error": "Goal ID or tasks are missing."}, 400
 
     try:
-        # Insert tasks into the database
-        for task in tasks:
-            db.execute(
-                "INSERT INTO tasks (goal_id, description, due_date, status) VALUES (?, ?, ?, 'Planned')",
-                (goal_id, task['description'], task['due_date'])
-            )
-        db.commit()
+        # Insert all tasks in one transaction
+        task_ids, _ = run_write(
+            insert_tasks, [dict(task, goal_id=goal_id) for task in tasks], g.user_id,
+            idempotency_key=request.headers.get('Idempotency-Key') or data.get('idempotency_key'))
 
-        return {"message": "Tasks saved successfully!"}, 200
+        return {"message": "Tasks saved successfully!", "task_ids": task_ids}, 200
 
+    except TaskValidationError as e:
+        return {"error": str(e), "errors": e.errors}, 400
+    except IdempotencyConflictError as e:
+        return {"error": str(e)}, 422
     except sqlite3.Error as e:
         return {"error": f"Database error: {e}"}, 500
     except Exception as e:
         return {"error": f"An unexpected error occurred: {e}"}, 500
 
-@app.route('/generate_task_for_today', methods=['POST'])
+@route('/generate_task_for_today', methods=['POST'])
 def generate_task_for_today():
     """Generates a task for today based on the goal details and progress so far."""
     db = get_db()
@@ -655,58 +1071,16 @@ def generate_task_for_today():
         return jsonify({"error": "Goal ID is missing."}), 400
 
     try:
-        # Fetch the complete goal details
-        goal = db.execute("""
-            SELECT description, positive_reasons, consequences_of_inaction, status 
-            FROM goals WHERE goal_id = ?""", 
-            (goal_id,)
-        ).fetchone()
-        
-        if not goal:
+        goal = get_goal(db, g.user_id, goal_id, 'goal_id')
+        if goal is None:
             return jsonify({"error": "Goal not found."}), 404
-
-        # Get tasks from this week and their status
-        week_start = datetime.date.today() - datetime.timedelta(days=datetime.date.today().weekday())
-        week_tasks = db.execute("""
-            SELECT description, status, due_date 
-            FROM tasks 
-            WHERE goal_id = ? 
-            AND due_date >= ? 
-            ORDER BY due_date DESC""",
-            (goal_id, week_start.isoformat())
-        ).fetchall()
-
-        completed_this_week = sum(1 for task in week_tasks if task['status'] == 'Completed')
-        missed_this_week = sum(1 for task in week_tasks if task['status'] == 'Missed')
-
-        # Generate task description based on goal context and progress
-        if GEMINI_CONFIGURED:
-            prompt = f"""
-            Based on this goal and context, generate ONE specific, actionable task for today:
-
-            Goal: {goal['description']}
-            Motivation: {goal['positive_reasons']}
-            Consequences if not achieved: {goal['consequences_of_inaction']}
-
-            Progress this week:
-            - Completed tasks: {completed_this_week}
-            - Missed tasks: {missed_this_week}
-
-            Generate a single, specific task that:
-            1. Directly relates to achieving the goal
-            2. Builds on their progress if they're doing well
-            3. Is more achievable if they've been struggling
-            4. Is concrete and actionable
-            5. Can be completed today
-
-            Return ONLY the task description, nothing else.
-            """
-            
-            task_description = generate_gemini_message(prompt)
+        suggestion = get_suggestion(db, goal['goal_id'])
+        if suggestion is not None and suggestion['task_description']:
+            task_description = suggestion['task_description'] # Precomputed overnight
         else:
-            # Fallback if AI is not configured
-            progress_status = "doing well" if completed_this_week > missed_this_week else "working on building consistency"
-            task_description = f"For your goal to {goal['description']}: What's one specific thing you can do today? (You're {progress_status} this week with {completed_this_week} completed tasks)"
+            task_description = generate_today_task(db, g.user_id, goal['goal_id'])
+        if task_description is None:
+            return jsonify({"error": "Goal not found."}), 404
 
         today_date = datetime.date.today().isoformat()
         
@@ -715,14 +1089,109 @@ def generate_task_for_today():
             "task": {
                 "description": task_description,
                 "due_date": today_date
-            }
+            },
+            "precomputed": suggestion is not None and bool(suggestion['task_description'])
         })
 
     except Exception as e:
-        print(f"🔴 Error generating task: {e}")
+        log.exception("Generating today's task failed: %s", e)
         return jsonify({"error": str(e)}), 500
 
-@app.route('/save_task', methods=['POST'])
+# --- Background AI jobs ---
+def _today_task_job(user_id, goal_id, task_id=None, refresh=False):
+    """Job body for /jobs/generate_task: runs on a worker thread with its own connection to the user's shard."""
+    def run():
+        pool = db_shards.pool_for(user_id)
+        db = pool.acquire()
+        try:
+            task_description = generate_today_task(db, user_id, goal_id, refresh=refresh, raise_errors=True)
+        except LLMBlockedError as e:
+            raise PermanentJobError(f"The AI provider blocked this request ({e.reason}).") from e
+        finally:
+            pool.release(db)
+        if task_description is None:
+            raise PermanentJobError("Goal not found.")
+        task = {"description": task_description, "due_date": datetime.date.today().isoformat()}
+        if task_id is not None:
+            task["id"] = task_id
+        return {"task": task}
+    return run
+
+@route('/jobs/generate_task', methods=['POST'])
+def submit_generate_task_job():
+    """Queues today's-task generation and returns a job id at once (202).
+
+    Body: {"goal_id", "refresh"?, "task_id"?}. Poll /jobs/<job_id> or subscribe to
+    /jobs/<job_id>/events for the result, which has the same shape as /generate_task_for_today.
+    A precomputed suggestion (unless ``refresh``) is returned straight away as a finished job (200).
+    """
+    data = request.get_json(silent=True) or {}
+    goal_id = data.get('goal_id')
+    if not goal_id:
+        return jsonify({"error": "Goal ID is missing."}), 400
+
+    goal = get_goal(get_db(), g.user_id, goal_id, 'goal_id')
+    if not goal:
+        return jsonify({"error": "Goal not found."}), 404
+
+    suggestion = None if data.get('refresh') else get_suggestion(get_db(), goal['goal_id'])
+    if suggestion is not None and suggestion['task_description']:
+        # Precomputed overnight: answer with an already finished "job" instead of queueing one
+        task = {"description": suggestion['task_description'], "due_date": datetime.date.today().isoformat()}
+        if data.get('task_id') is not None:
+            task["id"] = data['task_id']
+        return jsonify({"job_id": None, "status": "succeeded", "result": {"task": task}, "precomputed": True}), 200
+
+    try:
+        job = ai_jobs.submit('generate_task', _today_task_job(g.user_id, goal['goal_id'], data.get('task_id'),
+                                                              bool(data.get('refresh'))),
+                             owner=g.user_id)
+    except QueueFullError as e:
+        log.warning("Rejected AI job: %s", e)
+        return jsonify({"error": "Too many AI requests right now, please try again shortly."}), 503, {'Retry-After': '5'}
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": url_for('get_job', job_id=job.id),
+        "events_url": url_for('job_events', job_id=job.id),
+    }), 202
+
+@route('/jobs/<job_id>')
+def get_job(job_id):
+    """Returns a job's status, and its result or error once finished."""
+    job = ai_jobs.get(job_id, owner=g.user_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify(job)
+
+@route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-Sent Events stream of a job's status changes; the final event is 'done'."""
+    job = ai_jobs.get(job_id, owner=g.user_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+
+    def event(snapshot):
+        name = 'done' if snapshot['status'] in ('succeeded', 'failed') else 'status'
+        return f"event: {name}\ndata: {json.dumps(snapshot)}\n\n"
+
+    def events():
+        snapshot = job
+        yield event(snapshot)
+        while snapshot['status'] not in ('succeeded', 'failed'):
+            latest = ai_jobs.wait(job_id, seen_version=snapshot['version'], timeout=15)
+            if latest is None:
+                return
+            if latest['version'] == snapshot['version']:
+                yield ": keep-alive\n\n" # Nothing new; stops proxies from closing an idle stream
+                continue
+            snapshot = latest
+            yield event(snapshot)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@route('/save_task', methods=['POST'])
 def save_task():
     data = request.get_json()
     goal_id = data.get('goal_id')
@@ -732,26 +1201,238 @@ def save_task():
         return jsonify({'error': 'Missing required data'}), 400
 
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-
-        # Insert the task
-        cursor.execute('''
-            INSERT INTO tasks (goal_id, description, due_date, status)
-            VALUES (?, ?, ?, ?)
-        ''', (goal_id, task['description'], task['due_date'], task.get('status', 'Planned')))
-        
-        conn.commit()
-        conn.close()
-        
-        return jsonify({'success': True})
+        task_ids, _ = run_write(
+            insert_tasks, [dict(task, goal_id=goal_id)], g.user_id,
+            idempotency_key=request.headers.get('Idempotency-Key'))
+
+        return jsonify({'success': True, 'task_id': task_ids[0]})
+    except TaskValidationError as e:
+        return jsonify({'error': e.errors[0]['error']}), 400
+    except IdempotencyConflictError as e:
+        return jsonify({'error': str(e)}), 422
     except Exception as e:
-        print(f"Error saving task: {str(e)}")
+        log.exception("Saving a task failed: %s", e)
         return jsonify({'error': 'Failed to save task'}), 500
 
+@route('/tasks/bulk', methods=['POST'])
+def bulk_insert_tasks():
+    """Inserts many tasks (across one or more goals) in one transaction and returns their ids.
+
+    Body: {"tasks": [{"goal_id", "description", "due_date", "status"?, "estimated_time"?}, ...]}.
+    An Idempotency-Key header (or "idempotency_key" field) makes client retries safe.
+    """
+    data = request.get_json(silent=True) or {}
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    try:
+        task_ids, replayed = run_write(insert_tasks, data.get('tasks'), g.user_id, idempotency_key)
+        return jsonify({'task_ids': task_ids, 'replayed': replayed}), 200 if replayed else 201
+    except TaskValidationError as e:
+        return jsonify({'error': str(e), 'errors': e.errors}), 400
+    except IdempotencyConflictError as e:
+        return jsonify({'error': str(e)}), 422
+    except sqlite3.Error as e:
+        log.error("Database error on bulk task insert: %s", e)
+        return jsonify({'error': f"Database error: {e}"}), 500
+
+@route('/goal/<int:goal_id>/analytics')
+def goal_analytics(goal_id):
+    """Returns success rates, streaks, weekday/hour distributions and missed-task clusters for a goal."""
+    db = get_db()
+    try:
+        goal = get_goal(db, g.user_id, goal_id, 'goal_id')
+        if not goal:
+            return jsonify({"error": "Goal not found."}), 404
+        stats = analytics.goal_stats(db, goal_id)
+        return jsonify({"goal_id": goal_id, "analytics": stats})
+    except sqlite3.Error as e:
+        log.error("Database error computing analytics for goal %s: %s", goal_id, e)
+        return jsonify({"error": f"Database error: {e}"}), 500
+
+@route('/analytics')
+def user_analytics():
+    """Returns the same analytics computed across all of the user's goals."""
+    db = get_db()
+    try:
+        stats = analytics.user_stats(db, g.user_id)
+        return jsonify({"user_id": g.user_id, "analytics": stats})
+    except sqlite3.Error as e:
+        log.error("Database error computing analytics: %s", e)
+        return jsonify({"error": f"Database error: {e}"}), 500
+
+@route('/search')
+def search_goals_and_tasks():
+    """Full-text search over the user's goals and tasks, best matches first.
+
+    Query args: q, type (all, goals or tasks), limit and offset. Every word of q matches as a
+    prefix; description_html has the matched words wrapped in <mark> (the text is escaped).
+    """
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('type', 'all')
+    if kind not in ('all', 'goals', 'tasks'):
+        return jsonify({"error": "type must be one of all, goals or tasks."}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), search.MAX_RESULTS)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers."}), 400
+
+    db = get_db()
+    results = {"query": query, "goals": [], "tasks": []}
+    try:
+        if kind in ('all', 'goals'):
+            results['goals'] = search.search_goals(db, g.user_id, query, limit, offset)
+        if kind in ('all', 'tasks'):
+            results['tasks'] = search.search_tasks(db, g.user_id, query, limit, offset)
+    except sqlite3.Error as e:
+        log.error("Database error searching for %r: %s", query, e)
+        return jsonify({"error": f"Database error: {e}"}), 500
+    return jsonify(results)
+
+@route('/export')
+def export_data():
+    """Streams all of the user's goals and tasks as NDJSON (default) or CSV (?format=csv).
+
+    Rows are read in fetchmany() batches and sent as a chunked response, so memory stays
+    flat however long the history is. The output can be loaded back with /import.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in data_transfer.FORMATS:
+        return jsonify({"error": "format must be ndjson or csv."}), 400
+
+    def chunks():
+        stats = data_transfer.TransferStats()
+        yield from data_transfer.EXPORTERS[fmt](get_db(), g.user_id, stats)
+        report = stats.as_dict()
+        log.info("Exported %d goals and %d tasks as %s in %ss (%s rows/s).",
+                 report['goals'], report['tasks'], fmt, report['seconds'], report['rows_per_second'])
+
+    filename = f"coach-export-{datetime.date.today().isoformat()}.{fmt}"
+    return Response(stream_with_context(chunks()), mimetype=data_transfer.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+@route('/import', methods=['POST'])
+def import_data():
+    """Imports goals and tasks from an /export body (NDJSON, or CSV with ?format=csv or a text/csv body).
+
+    The body is parsed as it streams in and written in batched transactions; goals and
+    tasks get new ids. Returns counts, skipped records with their line numbers, and throughput.
+    """
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    if fmt not in data_transfer.FORMATS:
+        return jsonify({"error": "format must be ndjson or csv."}), 400
+    lines = (line.decode('utf-8', errors='replace') for line in request.stream)
+    try:
+        stats = data_transfer.import_stream(get_db(), g.user_id, lines, fmt)
+    except data_transfer.ImportFormatError as e:
+        return jsonify({"error": str(e)}), 400
+    except sqlite3.Error as e:
+        log.error("Database error during import: %s", e)
+        return jsonify({"error": f"Database error: {e}"}), 500
+    report = stats.as_dict()
+    log.info("Imported %d goals and %d tasks in %ss (%s rows/s), %d skipped.",
+             report['goals'], report['tasks'], report['seconds'], report['rows_per_second'], report['skipped'])
+    return jsonify(report), 201
+
+@route('/health/ai_cache')
+def ai_cache_health():
+    """Reports AI response cache hit/miss counters."""
+    return jsonify(ai_cache.stats())
+
+@route('/health/ai_single_flight')
+def ai_single_flight_health():
+    """Reports how many Gemini calls were coalesced with an identical in-flight call."""
+    return jsonify(ai_single_flight.stats())
+
+@route('/health/prompts')
+def prompts_health():
+    """Prompts built per kind with their estimated token counts (average/max) and budget trims."""
+    return jsonify({'budgets': {'today_task': TASK_PROMPT_BUDGET, 'plan': PLAN_PROMPT_BUDGET},
+                    'kinds': prompts.usage.stats()})
+
+@route('/health/page_cache')
+def page_cache_health():
+    """Rendered-fragment cache size and hit/miss counters."""
+    return jsonify(page_fragments.stats())
+
+@route('/health/jobs')
+def jobs_health():
+    """Reports AI job queue depth, outcomes and wait/run times."""
+    return jsonify(ai_jobs.stats())
+
+@route('/health/writes')
+def writes_health():
+    """Group-commit counters of each database file's writer: batch sizes, queue wait, batch time."""
+    if db_writers is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, 'writers': {path: writer.stats() for path, writer in db_writers.items()}})
+
+# Cache hit rates, pool, queue and writer counters, read from their stats() at scrape time
+metrics.add_stats('ai_cache', ai_cache.stats, 'AI response cache stats (as in /health/ai_cache).')
+metrics.add_stats('ai_single_flight', ai_single_flight.stats, 'LLM call coalescing stats (as in /health/ai_single_flight).')
+metrics.add_stats('page_cache', page_fragments.stats, 'Rendered-fragment cache stats (as in /health/page_cache).')
+metrics.add_stats('ai_jobs', ai_jobs.stats, 'AI job queue stats (as in /health/jobs).')
+metrics.add_stats('db_pool', lambda: {path: pool.stats() for path, pool in zip(db_shards.paths, db_shards.pools)},
+                  'Connection pool stats (as in /health/db).', label='database')
+if db_writers is not None:
+    metrics.add_stats('db_writer', lambda: {path: writer.stats() for path, writer in db_writers.items()},
+                      'Group-commit writer stats (as in /health/writes).', label='database')
+
+@route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics of this worker process: route, SQL and LLM latencies, cache hit rates."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@route('/health/db')
+def db_health():
+    """Reports connection pool health and usage counters."""
+    health = db_shards.health()
+    return jsonify(health), 200 if health['status'] == 'ok' else 503
+
+# --- Application factory ---
+def create_app(config=None):
+    """Builds the Flask app: configuration, logging, routes, hooks and request instrumentation.
+
+    Serve it with ``gunicorn 'app:create_app()'`` or ``flask --app app run``. Apps built in
+    the same process share its pools, writers and caches. ``config`` overrides ``app.config``.
+    """
+    if REQUIRE_LOGIN and not USER_HEADER:
+        # Nothing else identifies users in production, so every request would be refused
+        raise RuntimeError("REQUIRE_LOGIN is set without USER_HEADER: set the header your authenticating proxy sends.")
+    configure_logging(LOG_LEVEL, LOG_FORMAT)
+    app = Flask(__name__)
+    # Use environment variable for secret key or fallback to random bytes for flash messages
+    app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', os.urandom(24))
+    # Hash of the templates that goes into every ETag, so changed templates change every page's
+    app.config['TEMPLATES_FINGERPRINT'] = templates_fingerprint(os.path.join(app.root_path, 'templates'))
+    app.config.update(config or {})
+
+    # Route latency histograms for /metrics, and cProfile dumps of a PROFILE_SAMPLE_RATE share of requests
+    instrument_app(app, profile_rate=PROFILE_SAMPLE_RATE, profile_dir=PROFILE_DIR)
+    app.before_request(ensure_database_ready)
+    app.before_request(load_request_user)
+    app.teardown_appcontext(close_db)
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+
+    if GEMINI_CONFIGURED:
+        log.info("Gemini API configured.")
+    else:
+        log.warning("Using the '%s' LLM backend (no Gemini calls).", llm_backend.name)
+    return app
+
+_app = None
+
+def __getattr__(name):
+    """``app.app``: one app built on first access, for ``gunicorn app:app`` and older scripts."""
+    global _app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _app is None:
+        _app = create_app()
+    return _app
+
 # --- Main execution ---
 if __name__ == '__main__':
-    print("Starting Flask application...")
-    # Ensure the DB init check runs if using the @app.before_first_request approach,
-    # otherwise, make sure init_db_command() was run manually or via init_db.py
-    app.run(debug=True, host='0.0.0.0', port=5001) # Makes it accessible on local network, debug=True is helpful for development
+    log.info("Starting Flask application...")
+    create_app().run(debug=True, host='0.0.0.0', port=5001) # Makes it accessible on local network, debug=True is helpful for development
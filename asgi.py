@@ -0,0 +1,411 @@
+# asgi.py
+# ASGI serving mode: the AI routes as coroutines, every other route through the Flask app
+#
+# /generate_task_for_today and /regenerate_task spend nearly all of their time waiting on the
+# LLM. Here they await it (the backends' agenerate()) instead of holding a thread for the whole
+# call, so one event loop carries as many of them as ASGI_LLM_CONCURRENCY allows, and requests
+# beyond that wait up to ASGI_LLM_WAIT seconds for a slot before getting a 503. Their SQLite
+# work (user, goal, precomputed suggestion, prompt history, response cache) runs on a small
+# thread pool of ASGI_DB_WORKERS threads. All other routes are the unchanged Flask views, run
+# one request per thread on ASGI_WSGI_THREADS threads, reading the request body as it arrives
+# (an /import upload is never held in memory whole); only the two async routes read their JSON
+# body at once, up to ASGI_MAX_BODY bytes. Requests and responses are the same as under the
+# threaded server.
+#
+#   pip install uvicorn
+#   uvicorn --factory asgi:create_asgi_app --port 5001
+#   hypercorn 'asgi:create_asgi_app()' --bind 0.0.0.0:5001     # or any other ASGI 3 server
+
+import asyncio
+import concurrent.futures
+import datetime
+import functools
+import io
+import logging
+import os
+import sys
+import time
+
+from flask import g, request
+from werkzeug.exceptions import ClientDisconnected, HTTPException
+
+import app as coach
+import prompts
+from ai_cache import make_cache_key
+from instrumentation import http_duration, metrics, record_llm_call
+from precompute import get_suggestion
+from tenancy import get_goal
+
+log = logging.getLogger('coach_agent.asgi')
+
+ASGI_LLM_CONCURRENCY = int(os.getenv('ASGI_LLM_CONCURRENCY', '100')) # LLM calls awaited at once by the async routes
+ASGI_LLM_WAIT = float(os.getenv('ASGI_LLM_WAIT', '30')) # Seconds a request waits for a free LLM slot before a 503
+ASGI_DB_WORKERS = int(os.getenv('ASGI_DB_WORKERS', '4')) # Threads running the async routes' SQLite work
+ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '16')) # Threads serving the (sync) Flask routes
+ASGI_MAX_BODY = int(os.getenv('ASGI_MAX_BODY', str(64 * 1024))) # Largest JSON body the async routes accept
+
+
+class LLMOverloadedError(Exception):
+    """Raised when no LLM slot frees up within ASGI_LLM_WAIT seconds."""
+
+
+class BodyTooLargeError(Exception):
+    """Raised when an async route's request body is longer than ASGI_MAX_BODY bytes."""
+
+
+class ReceiveStream(io.RawIOBase):
+    """wsgi.input of the WSGI bridge: the request body, read from ASGI ``receive`` as it arrives.
+
+    Read on a WSGI thread; each receive() runs on the event loop. A client that goes away
+    mid-body raises ClientDisconnected (a 400), as under the threaded server.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._chunk = memoryview(b'')
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk and self._more:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                self._more = False
+                raise ClientDisconnected()
+            self._chunk = memoryview(message.get('body', b''))
+            self._more = message.get('more_body', False)
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+
+def build_environ(scope, stream):
+    """The WSGI environ of an ASGI HTTP request whose body is read from the binary file ``stream``."""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': stream,
+        'wsgi.input_terminated': True,  # The stream ends with the body, chunked or not
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            if key in environ:  # Repeated header; HTTP/2 clients send each cookie in a header of its own
+                value = f"{environ[key]}{'; ' if key == 'HTTP_COOKIE' else ','}{value}"
+            environ[key] = value
+    return environ
+
+
+async def read_body(receive, max_length):
+    """The whole request body, or None if the client went away first.
+
+    Raises BodyTooLargeError as soon as more than ``max_length`` bytes have arrived.
+    """
+    chunks, length = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        length += len(chunk)
+        if length > max_length:
+            raise BodyTooLargeError(f"Request body is over {max_length} bytes")
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def _encode_headers(headers):
+    return [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers]
+
+
+class AsgiApp:
+    """ASGI 3 application: async handlers for the AI routes, the Flask app for the rest."""
+
+    def __init__(self, flask_app, llm_concurrency=ASGI_LLM_CONCURRENCY, llm_wait=ASGI_LLM_WAIT,
+                 db_workers=ASGI_DB_WORKERS, wsgi_threads=ASGI_WSGI_THREADS, max_body=ASGI_MAX_BODY):
+        self.flask_app = flask_app
+        self.max_body = max_body
+        self.llm_concurrency = llm_concurrency
+        self.llm_wait = llm_wait
+        self.llm_slots = asyncio.Semaphore(llm_concurrency)
+        self.db_executor = concurrent.futures.ThreadPoolExecutor(db_workers, thread_name_prefix='asgi-db')
+        self.wsgi_executor = concurrent.futures.ThreadPoolExecutor(wsgi_threads, thread_name_prefix='asgi-wsgi')
+        self.db_workers = db_workers
+        self.wsgi_threads = wsgi_threads
+        # (method, path) -> (endpoint name for metrics, handler)
+        self.routes = {
+            ('POST', '/generate_task_for_today'): ('generate_task_for_today', self.generate_task_for_today),
+            ('POST', '/regenerate_task'): ('regenerate_task', self.regenerate_task),
+            ('GET', '/health/asgi'): ('asgi_health', self.health),
+        }
+        # Only ever changed on the event loop's thread, so no lock
+        self._counters = {
+            'async_requests': 0,
+            'wsgi_requests': 0,
+            'in_flight': 0,
+            'max_in_flight': 0,
+            'llm_in_flight': 0,
+            'llm_waiting': 0,
+            'overloaded': 0,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, io.BufferedReader(ReceiveStream(receive, loop)))
+        route = self.routes.get((environ['REQUEST_METHOD'], environ['PATH_INFO']))
+        if route is None:
+            self._counters['wsgi_requests'] += 1
+            return await self._run_wsgi(environ, send)
+        await self._run_async(*route, environ, receive, send)
+
+    # --- Async routes ---
+    async def generate_task_for_today(self, environ):
+        """POST /generate_task_for_today, awaiting the LLM: same request and response as the Flask view."""
+        response, plan = await self.run_db(self._prepare_today_task, environ, False)
+        if response is not None:
+            return response
+        precomputed = plan['prompt'] is None
+        description = plan['suggestion'] if precomputed else await self.generate(plan['prompt'])
+        return self._json({"task": {"description": description, "due_date": datetime.date.today().isoformat()},
+                           "precomputed": precomputed})
+
+    async def regenerate_task(self, environ):
+        """POST /regenerate_task, awaiting the LLM: same request and response as the Flask view."""
+        response, plan = await self.run_db(self._prepare_today_task, environ, True)
+        if response is not None:
+            return response
+        description = await self.generate(plan['prompt'], refresh=True)
+        return self._json({"task": {"id": plan['task_id'], "description": description,
+                                    "due_date": datetime.date.today().isoformat()}})
+
+    async def health(self, environ):
+        """GET /health/asgi: the async routes' concurrency counters."""
+        return self._json(self.stats())
+
+    def _prepare_today_task(self, environ, refresh):
+        """On a DB thread: (early response, None), or (None, plan) with the prompt to send.
+
+        Runs the same user resolution and checks as the Flask views, inside a Flask request
+        context so get_db(), g.user_id and the session work as they do there.
+        """
+        with self.flask_app.request_context(environ):
+            try:
+                coach.ensure_database_ready()
+                denied = coach.load_request_user()
+                if denied is not None:
+                    return self._flask_response(denied), None
+                data = request.get_json()
+                goal_id = data.get('goal_id')
+                if not goal_id:
+                    return self._flask_response(({"error": "Goal ID is missing."}, 400)), None
+                db = coach.get_db()
+                if not refresh:
+                    goal = get_goal(db, g.user_id, goal_id, 'goal_id')
+                    if goal is None:
+                        return self._flask_response(({"error": "Goal not found."}, 404)), None
+                    goal_id = goal['goal_id']
+                    suggestion = get_suggestion(db, goal_id)
+                    if suggestion is not None and suggestion['task_description']:
+                        return None, {'prompt': None, 'suggestion': suggestion['task_description']} # Precomputed overnight
+                prompt = coach.build_today_task_prompt(db, g.user_id, goal_id)
+                if prompt is None:
+                    return self._flask_response(({"error": "Goal not found."}, 404)), None
+                return None, {'prompt': prompt, 'task_id': data.get('task_id')}
+            except HTTPException as e: # e.g. a body that is not JSON
+                return self._flask_response(e.get_response()), None
+
+    # --- Awaitable LLM calls ---
+    async def generate(self, prompt_text, refresh=False):
+        """Async generate_gemini_message(): cache, single flight with the sync routes, placeholders on errors."""
+        backend = coach.llm_backend
+        cache_key = make_cache_key(prompt_text, backend.model_name, coach.SAFETY_SETTINGS)
+        if not refresh and backend.cacheable:
+            cached = await self.run_db(coach.ai_cache.get, cache_key)
+            if cached is not None:
+                return cached
+        try:
+            return await coach.ai_single_flight.ado(cache_key, lambda: self._request_llm(prompt_text, backend, cache_key))
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            return coach.llm_error_message(e)
+
+    async def _request_llm(self, prompt_text, backend, cache_key):
+        """The backend call, once a slot is free. Runs once per in-flight prompt."""
+        prompt_tokens = prompts.estimate_tokens(prompt_text)
+        self._counters['llm_waiting'] += 1
+        try:
+            await asyncio.wait_for(self.llm_slots.acquire(), self.llm_wait)
+        except asyncio.TimeoutError:
+            self._counters['overloaded'] += 1
+            raise LLMOverloadedError(f"No LLM slot free within {self.llm_wait}s") from None
+        finally:
+            self._counters['llm_waiting'] -= 1
+
+        self._counters['llm_in_flight'] += 1
+        started = time.perf_counter()
+        try:
+            generated_text = (await backend.agenerate(prompt_text)).strip()
+        except Exception as e:
+            record_llm_call(backend.name, time.perf_counter() - started, coach.llm_outcome(e), prompt_tokens)
+            raise
+        finally:
+            self._counters['llm_in_flight'] -= 1
+            self.llm_slots.release()
+        elapsed = time.perf_counter() - started
+        record_llm_call(backend.name, elapsed, 'ok', prompt_tokens, prompts.estimate_tokens(generated_text))
+        log.info("LLM response from %s in %.2fs.", backend.name, elapsed)
+        if backend.cacheable:
+            await self.run_db(coach.ai_cache.set, cache_key, generated_text)
+        return generated_text
+
+    # --- Plumbing ---
+    async def run_db(self, fn, *args):
+        """Runs ``fn(*args)`` (SQLite work) on the DB thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.db_executor, functools.partial(fn, *args))
+
+    def _json(self, payload, status=200, headers=()):
+        """(status, headers, body) of ``payload`` serialized exactly as jsonify() would."""
+        response = self.flask_app.json.response(payload)
+        return status, [*response.headers.items(), *headers], response.get_data()
+
+    def _flask_response(self, rv):
+        """(status, headers, body) of a Flask view return value (inside its request context)."""
+        response = self.flask_app.make_response(rv)
+        return response.status_code, list(response.headers.items()), response.get_data()
+
+    async def _run_async(self, endpoint, handler, environ, receive, send):
+        started = time.perf_counter()
+        self._counters['async_requests'] += 1
+        self._counters['in_flight'] += 1
+        self._counters['max_in_flight'] = max(self._counters['max_in_flight'], self._counters['in_flight'])
+        try:
+            declared = environ.get('CONTENT_LENGTH', '')
+            if declared.isdigit() and int(declared) > self.max_body:
+                raise BodyTooLargeError(f"Request body is over {self.max_body} bytes")
+            body = await read_body(receive, self.max_body)
+            if body is None:  # The client went away
+                return
+            environ.update({'wsgi.input': io.BytesIO(body), 'CONTENT_LENGTH': str(len(body))})
+            status, headers, body = await handler(environ)
+        except BodyTooLargeError:
+            status, headers, body = self._json({"error": f"Request body too large (at most {self.max_body} bytes)."},
+                                               413)
+        except LLMOverloadedError:
+            status, headers, body = self._json({"error": "Too many AI requests in progress, please retry shortly."},
+                                               503, [('Retry-After', '5')])
+        except Exception as e:
+            log.exception("%s failed: %s", endpoint, e)
+            status, headers, body = self._json({"error": str(e)}, 500)
+        finally:
+            self._counters['in_flight'] -= 1
+        await send({'type': 'http.response.start', 'status': status, 'headers': _encode_headers(headers)})
+        await send({'type': 'http.response.body', 'body': body})
+        http_duration.observe(time.perf_counter() - started, endpoint=endpoint,
+                              method=environ['REQUEST_METHOD'], status=status)
+
+    async def _run_wsgi(self, environ, send):
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        await loop.run_in_executor(self.wsgi_executor, self._serve_wsgi, environ, send_from_thread)
+
+    def _serve_wsgi(self, environ, send):
+        """Runs one Flask request start to finish on this thread, streaming its body to ``send``.
+
+        One thread per request, as under the threaded server: streamed views keep their
+        request context on the thread that pushed it.
+        """
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response_start.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response_start.update(status=int(status.split(' ', 1)[0]), headers=_encode_headers(headers))
+
+        def send_start():
+            if not response_start.get('sent'):
+                send({'type': 'http.response.start', 'status': response_start['status'],
+                      'headers': response_start['headers']})
+                response_start['sent'] = True
+
+        body = self.flask_app(environ, start_response)
+        try:
+            for chunk in body:
+                if chunk:
+                    send_start()
+                    send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            send_start()
+            send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.run_db(coach.ensure_database_ready)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def close(self):
+        """Stops the thread pools once their current work is done."""
+        self.db_executor.shutdown(wait=False)
+        self.wsgi_executor.shutdown(wait=False)
+
+    def stats(self):
+        """Requests served each way, async requests and LLM calls in flight, and 503s for lack of an LLM slot."""
+        return dict(self._counters, llm_concurrency=self.llm_concurrency, db_workers=self.db_workers,
+                    wsgi_threads=self.wsgi_threads)
+
+
+def create_asgi_app(flask_app=None, **options):
+    """The ASGI application around ``flask_app`` (by default app.create_app()); ``options`` go to AsgiApp."""
+    asgi_app = AsgiApp(flask_app or coach.create_app(), **options)
+    metrics.add_stats('asgi', asgi_app.stats, 'Async route concurrency (as in /health/asgi).')
+    return asgi_app
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        print("🔴 Serving over ASGI needs an ASGI server: pip install uvicorn (or run hypercorn 'asgi:create_asgi_app()').")
+        sys.exit(1)
+    uvicorn.run(create_asgi_app(), host='0.0.0.0', port=5001)
@@ -0,0 +1,11 @@
+# bench
+# Benchmarks: synthetic databases, Flask load scenarios, micro-benchmarks and the write bench
+#
+#   python -m bench.datagen --users 50 --goals 3 --years 2 -o big.db   # just build a database
+#   python -m bench                                                    # load + micro suites -> bench-results.json
+#   python -m bench --save-baseline                                    # store this machine's numbers as the baseline
+#   python -m bench --baseline bench/baseline.json                     # fail (exit 1) on a regression against it
+#   python -m bench.writes                                             # per-request commits vs. group commit
+#
+# Everything runs offline: the app's LLM backend is the fake one (LLM_BACKEND=fake) with a
+# small, seeded latency, and each run works on a fresh database in a temporary directory.
@@ -0,0 +1,160 @@
+# bench/__main__.py
+# python -m bench: build a synthetic database, run the load and micro suites, report and
+# compare with a stored baseline
+#
+# Results are JSON: {"meta": {...configuration, versions...}, "results": {name: {count,
+# errors, throughput, p50_ms, p95_ms, p99_ms, max_ms, ...}}}. With --baseline, a load
+# scenario regresses when its p95 grows or its throughput drops by more than --tolerance,
+# a micro-benchmark when its p50 grows by more than that (its tail is mostly scheduler
+# noise), and either when it has errors the baseline did not. Latency changes under
+# MIN_DELTA_MS are ignored. Any regression makes the exit status 1. Baselines only mean
+# something on the same machine and settings: store one per deploy/CI machine with
+# --save-baseline.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+from bench.datagen import build_database
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+SUITES = ('load', 'micro')
+MIN_DELTA_MS = 0.05
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(DEFAULT_BASELINE), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Returns a list of regression messages of ``results`` against the ``baseline`` results."""
+    regressions = []
+    for name, current in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        micro = name.startswith('micro.')
+        latency = 'p50_ms' if micro else 'p95_ms'
+        if base.get(latency) is not None and current.get(latency) is not None \
+                and current[latency] > base[latency] * (1 + tolerance) \
+                and current[latency] - base[latency] > MIN_DELTA_MS:
+            regressions.append(f"{name}: {latency[:3]} {current[latency]} ms vs {base[latency]} ms")
+        if not micro and base.get('throughput') and current.get('throughput') is not None \
+                and current['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput']}/s vs {base['throughput']}/s")
+        if current.get('errors', 0) > base.get('errors', 0):
+            regressions.append(f"{name}: {current['errors']} errors vs {base.get('errors', 0)}")
+    return regressions
+
+
+def print_table(results, baseline=None):
+    print(f"{'benchmark':<28} {'count':>6} {'err':>4} {'per s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+          + (f" {'base p50':>9} {'base p95':>9}" if baseline else ''))
+    for name, r in sorted(results.items()):
+        line = (f"{name:<28} {r['count']:>6} {r['errors']:>4} {r['throughput']!s:>9} {r['p50_ms']!s:>9} "
+                f"{r['p95_ms']!s:>9} {r['p99_ms']!s:>9}")
+        if baseline:
+            base = baseline.get(name, {})
+            line += f" {base.get('p50_ms', '-')!s:>9} {base.get('p95_ms', '-')!s:>9}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Run the load and micro-benchmark suites offline.')
+    parser.add_argument('--suite', choices=SUITES, action='append', dest='suites', help='default: all')
+    parser.add_argument('--scenario', action='append', dest='scenarios', help='load scenario(s) to run (default: all)')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--goals', type=int, default=3, help='goals per user')
+    parser.add_argument('--years', type=float, default=1.0, help='years of daily task history per goal')
+    parser.add_argument('--requests', type=int, default=400, help='requests per load scenario')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent clients in the load scenarios')
+    parser.add_argument('--iterations', type=int, default=300, help='calls per micro-benchmark')
+    parser.add_argument('--llm-latency', type=float, default=0.02, help='median seconds per fake LLM call')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bench-results.json', help='where to write the results')
+    parser.add_argument('--baseline', help=f'compare with this results file (e.g. {DEFAULT_BASELINE})')
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, metavar='FILE',
+                        help='also store the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative latency/throughput change')
+    parser.add_argument('--keep', action='store_true', help='keep the synthetic database instead of removing it')
+    args = parser.parse_args(argv)
+
+    suites = args.suites or SUITES
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    save_path = os.path.abspath(args.save_baseline) if args.save_baseline else None
+    baseline = None
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='bench_')
+    try:
+        path = os.path.join(workdir, 'coach_agent.db')
+        dataset = build_database(path, args.users, args.goals, args.years, args.seed)
+        print(f"Built {dataset['tasks']} tasks for {dataset['users']} users in {dataset['seconds']}s ({workdir}).")
+
+        from bench.micro import run_micro
+        from bench.scenarios import SCENARIOS, Context, load_app, run_scenarios
+        app_module = load_app(workdir, args.llm_latency, args.seed)
+        ctx = Context(path)
+        results = {}
+        if 'micro' in suites:  # First, so the load scenarios' writes don't change what it measures
+            results.update(run_micro(app_module, ctx, path, args.iterations, args.seed))
+        if 'load' in suites:
+            results.update(run_scenarios(app_module, ctx, args.scenarios or tuple(SCENARIOS), args.requests,
+                                         args.threads, args.seed))
+
+        config = {key: value for key, value in vars(args).items()
+                  if key not in ('output', 'baseline', 'save_baseline', 'tolerance', 'keep')}
+        report = {
+            'meta': {
+                'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                'git': git_revision(),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+                'config': config,
+                'dataset': {key: dataset[key] for key in ('users', 'goals', 'tasks', 'days', 'seed')},
+            },
+            'results': results,
+        }
+        for target in filter(None, (output, save_path)):
+            with open(target, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+    finally:
+        os.chdir(cwd)  # load_app() runs the app from the work directory
+        if args.keep:
+            print(f"Kept the benchmark database in {workdir}.")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results, baseline and baseline['results'])
+    print(f"Results written to {output}" + (f" and {save_path}" if save_path else '') + '.')
+    if baseline is None:
+        return 0
+    if baseline['meta'].get('config') != config:
+        print("⚠️ The baseline was recorded with different settings; the comparison may be meaningless.")
+    regressions = compare(results, baseline['results'], args.tolerance)
+    for message in regressions:
+        print(f"🔴 {message}")
+    if regressions:
+        return 1
+    print(f"✅ No regressions against {baseline_path} (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+# bench/asgi.py
+# Concurrent AI-request capacity: the threaded Flask server vs. the ASGI mode (asgi.py)
+#
+# Every request is POST /regenerate_task (always an LLM call: it skips the response cache) for
+# a different goal, against the fake backend with --llm-latency seconds per call. Each mode runs
+# in a process of its own so their memory can be compared:
+#
+#   threaded  one thread per in-flight request through the Flask app, as the threaded server
+#             (or gunicorn's gthread workers) runs it; DB_POOL_SIZE is raised to match, since
+#             each of those requests holds a connection while it waits on the LLM
+#   async     one event loop awaiting the same number of in-flight requests through asgi.py
+#
+# and reports throughput, latency, threads and the peak memory the load added, then how many
+# in-flight requests each mode fits in the same memory.
+#
+#   python -m bench.asgi                                   # 50, 200 and 500 in-flight requests
+#   python -m bench.asgi --concurrency 1000 --llm-latency 1 --json asgi.json
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench.datagen import build_database
+from bench.driver import run_load, summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('threaded', 'async')
+ROUNDS = 4  # Requests per in-flight slot, so each run sees several waves of LLM calls
+WARMUP = 20
+
+
+def peak_rss_mb():
+    """This process's peak resident memory so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+async def asgi_request(app, method, path, payload=None):
+    """Sends one request straight to an ASGI app (no sockets); returns (status, body)."""
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+             'scheme': 'http', 'path': path, 'raw_path': path.encode('utf-8'), 'query_string': b'',
+             'root_path': '', 'headers': [(b'content-type', b'application/json')],
+             'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', 5001)}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    response = {'status': None, 'body': []}
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        else:
+            response['body'].append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    return response['status'], b''.join(response['body'])
+
+
+class ThreadCounter:
+    """Samples threading.active_count() in the background; ``peak`` is the highest seen."""
+
+    def __init__(self, interval=0.01):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(mode, workdir, concurrency, llm_latency, seed):
+    """One mode at one concurrency, in this process; returns its result dict."""
+    if mode == 'threaded':
+        os.environ['DB_POOL_SIZE'] = str(concurrency + 1)
+    from bench.scenarios import USER_HEADER, Context, load_app
+    app_module = load_app(workdir, llm_latency, seed)
+    ctx = Context(os.path.join(workdir, 'coach_agent.db'))
+    goals = [(ctx.usernames[user_id], goal_id) for user_id in ctx.user_ids for goal_id in ctx.goals[user_id]]
+    numbers = itertools.count()
+    total = concurrency * ROUNDS
+
+    def next_request():
+        username, goal_id = goals[next(numbers) % len(goals)]  # Distinct goals: no coalesced calls
+        return {USER_HEADER: username}, {'goal_id': goal_id}
+
+    if mode == 'threaded':
+        flask_app = app_module.create_app()
+
+        def request(client, i):
+            headers, payload = next_request()
+            return client.post('/regenerate_task', json=payload, headers=headers).status_code == 200
+
+        run_load(request, WARMUP, 4, flask_app.test_client)
+        baseline = peak_rss_mb()
+        with ThreadCounter() as threads:
+            result = run_load(request, total, concurrency, flask_app.test_client)
+    else:
+        import asgi
+        asgi_app = asgi.create_asgi_app(llm_concurrency=concurrency)
+
+        async def drive(count, clients):
+            latencies, errors = [], 0
+
+            async def client():
+                nonlocal errors
+                while next(remaining, None) is not None:
+                    headers, payload = next_request()
+                    started = time.perf_counter()
+                    status, _ = await asgi_request(
+                        _with_headers(asgi_app, headers), 'POST', '/regenerate_task', payload)
+                    if status == 200:
+                        latencies.append(time.perf_counter() - started)
+                    else:
+                        errors += 1
+
+            remaining = iter(range(count))
+            started = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(clients)))
+            return summarize(latencies, time.perf_counter() - started, errors)
+
+        asyncio.run(drive(WARMUP, 4))
+        baseline = peak_rss_mb()
+        with ThreadCounter() as threads:
+            result = asyncio.run(drive(total, concurrency))
+        asgi_app.close()
+    return dict(result, mode=mode, concurrency=concurrency, peak_threads=threads.peak,
+                added_mb=round(max(peak_rss_mb() - baseline, 0.0), 1))
+
+
+def _with_headers(asgi_app, headers):
+    """``asgi_app`` with ``headers`` added to every request's scope."""
+    extra = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+
+    async def app(scope, receive, send):
+        await asgi_app(dict(scope, headers=[*scope['headers'], *extra]), receive, send)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare concurrent AI-request capacity of the threaded and ASGI modes.')
+    parser.add_argument('--concurrency', type=int, action='append', dest='levels',
+                        help='in-flight requests (default: 50, 200 and 500)')
+    parser.add_argument('--mode', choices=MODES, action='append', dest='modes', help='default: both')
+    parser.add_argument('--llm-latency', type=float, default=0.25, help='median seconds per fake LLM call')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', metavar='FILE', help='also write the results here')
+    parser.add_argument('--keep', action='store_true', help='keep the synthetic database instead of removing it')
+    parser.add_argument('--worker', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    levels = args.levels or [50, 200, 500]
+
+    if args.worker:  # A child run: one mode at one concurrency, result as JSON on stdout
+        print(json.dumps(run_worker(args.worker, args.workdir, levels[0], args.llm_latency, args.seed)))
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix='bench_asgi_')
+    try:
+        dataset = build_database(os.path.join(workdir, 'coach_agent.db'), users=max(levels) // 3 + 1,
+                                 goals_per_user=3, years=0.05, seed=args.seed)
+        print(f"Built {dataset['goals']} goals for {dataset['users']} users ({workdir}); "
+              f"fake LLM latency {args.llm_latency}s.")
+        print(f"{'mode':<9} {'in flight':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'errors':>6} {'threads':>7} {'added MB':>8}")
+        results = []
+        for concurrency in levels:
+            for mode in args.modes or MODES:
+                child = subprocess.run(
+                    [sys.executable, '-W', 'ignore', '-m', 'bench.asgi', '--worker', mode, '--workdir', workdir,
+                     '--concurrency', str(concurrency), '--llm-latency', str(args.llm_latency),
+                     '--seed', str(args.seed)],
+                    cwd=ROOT, capture_output=True, text=True)
+                if child.returncode:
+                    print(f"🔴 {mode} at {concurrency} failed:\n{child.stderr}")
+                    return 1
+                r = json.loads(child.stdout.strip().splitlines()[-1])
+                results.append(r)
+                print(f"{mode:<9} {concurrency:>9} {r['throughput']!s:>8} {r['p50_ms']!s:>8} {r['p95_ms']!s:>8} "
+                      f"{r['p99_ms']!s:>8} {r['errors']:>6} {r['peak_threads']:>7} {r['added_mb']:>8}")
+    finally:
+        if args.keep:
+            print(f"Kept the benchmark database in {workdir}.")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    by_mode = {mode: [r for r in results if r['mode'] == mode] for mode in MODES}
+    if all(by_mode.values()):
+        threaded, async_ = by_mode['threaded'][-1], by_mode['async'][-1]
+        per_thread = threaded['added_mb'] / threaded['concurrency']
+        if per_thread > 0:
+            print(f"At {async_['added_mb']} MB, the memory the async mode added for {async_['concurrency']} "
+                  f"in-flight requests, the threaded server fits about {int(async_['added_mb'] / per_thread)} "
+                  f"({per_thread * 1024:.0f} KB each).")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Results written to {args.json}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
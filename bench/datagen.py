@@ -0,0 +1,118 @@
+# bench/datagen.py
+# Synthetic databases of configurable size: users x goals x years of daily tasks
+#
+# The database is created by migrate.py (so it is exactly what the app runs on) and filled
+# in one transaction with the triggers on, so rollups, search indexes and content versions
+# are as they would be after the same history of real use. Each goal has its own success
+# rate and preferred completion hour; past tasks are Completed or Missed, today's and the
+# next week's are Planned. The same seed always produces the same database.
+
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import time
+
+import migrate
+
+ACTIVITIES = ('run', 'walk', 'read', 'write', 'practice', 'stretch', 'study', 'review', 'plan', 'meditate',
+              'cook', 'clean', 'call', 'draft', 'sketch', 'journal', 'swim', 'cycle', 'lift', 'learn')
+SUBJECTS = ('Spanish vocabulary', 'the novel', 'guitar scales', 'five kilometres', 'budget', 'portfolio',
+            'chapter notes', 'core workout', 'emails', 'garden', 'piano piece', 'algorithms', 'sketchbook',
+            'meal plan', 'marathon training', 'blog post', 'daily steps', 'French grammar', 'photos', 'resume')
+GOAL_STATUSES = ('Active', 'Active', 'Active', 'Paused', 'Achieved')
+FUTURE_DAYS = 7  # Planned tasks after today
+
+
+def goal_text(rng):
+    return f"{rng.choice(ACTIVITIES).capitalize()} {rng.choice(SUBJECTS)} every day"
+
+
+def task_rows(rng, goal_id, start, days, today):
+    """Daily tasks of one goal from ``start`` for ``days`` days plus the coming week."""
+    success_rate = rng.uniform(0.35, 0.9)
+    peak_hour = rng.randint(6, 21)
+    for offset in range(days + FUTURE_DAYS):
+        due = start + datetime.timedelta(days=offset)
+        description = f"{rng.choice(ACTIVITIES).capitalize()} {rng.choice(SUBJECTS)} for {rng.choice((10, 15, 20, 30, 45))} minutes"
+        completed = None
+        if due >= today:
+            status = 'Planned'
+        elif rng.random() < success_rate:
+            status = 'Completed'
+            hour = min(max(int(rng.gauss(peak_hour, 2)), 0), 23)
+            completed = f"{due.isoformat()} {hour:02d}:{rng.randint(0, 59):02d}:00"
+        else:
+            status = 'Missed'
+        yield goal_id, description, due.isoformat(), status, completed, f"{rng.choice((10, 15, 20, 30))} minutes"
+
+
+def build_database(path, users=20, goals_per_user=3, years=1.0, seed=1, today=None):
+    """Creates ``path`` (which must not exist yet) and fills it; returns a summary dict.
+
+    User ids are 1..users with usernames ``user_<id>`` (user 1 keeps the default username).
+    """
+    started = time.perf_counter()
+    migrate.migrate(path, verbose=False)
+    rng = random.Random(seed)
+    today = today or datetime.date.today()
+    days = max(int(years * 365), 1)
+    start = today - datetime.timedelta(days=days)
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = OFF")  # Nothing to lose: a failed build is simply rebuilt
+        conn.execute("BEGIN")
+        conn.executemany("INSERT OR IGNORE INTO users (user_id, username, preferences) VALUES (?, ?, '{}')",
+                         ((user_id, f"user_{user_id}") for user_id in range(1, users + 1)))
+        for user_id in range(1, users + 1):
+            for _ in range(goals_per_user):
+                goal_id = conn.execute(
+                    """INSERT INTO goals (user_id, description, status, positive_reasons,
+                                          consequences_of_inaction, creation_date)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    (user_id, goal_text(rng), rng.choice(GOAL_STATUSES),
+                     'More energy, better focus and keeping a promise to myself',
+                     'Five years from now I would regret not having started', f"{start.isoformat()} 08:00:00"),
+                ).lastrowid
+                conn.executemany(
+                    """INSERT INTO tasks (goal_id, description, due_date, status, completion_date, estimated_time)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    task_rows(rng, goal_id, start, days, today))
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+        tasks = conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+    finally:
+        conn.close()
+    return {'path': path, 'users': users, 'goals': users * goals_per_user, 'tasks': tasks, 'days': days,
+            'seed': seed, 'seconds': round(time.perf_counter() - started, 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build a synthetic database (users x goals x years of daily tasks).')
+    parser.add_argument('-o', '--output', default='bench.db')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--goals', type=int, default=3, help='goals per user')
+    parser.add_argument('--years', type=float, default=1.0, help='years of daily task history per goal')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--force', action='store_true', help='replace the output file if it exists')
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.output):
+        if not args.force:
+            print(f"🔴 {args.output} already exists (use --force to replace it).")
+            return 1
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.output + suffix):
+                os.remove(args.output + suffix)
+    summary = build_database(args.output, args.users, args.goals, args.years, args.seed)
+    print(f"✅ Built {args.output}: {summary['users']} users, {summary['goals']} goals, "
+          f"{summary['tasks']} tasks in {summary['seconds']}s.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# bench/driver.py
+# Thread-pool load driver and latency summaries shared by the benchmark suites
+
+import concurrent.futures
+import threading
+import time
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list (None when empty)."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Count, error count, throughput and p50/p95/p99/max latency (ms) of one run."""
+    latencies = sorted(latencies)
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'count': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1] if latencies else None),
+    }
+
+
+def time_calls(fn, iterations, warmup=10, rounds=3):
+    """Calls ``fn()`` ``iterations`` times on this thread, after ``warmup`` untimed calls, in
+    ``rounds`` rounds; summarizes the round with the lowest median (like timeit's best-of-N,
+    so a noisy neighbour slows one round, not the result)."""
+    for _ in range(warmup):
+        fn()
+    best = None
+    for _ in range(rounds):
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            call_started = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - call_started)
+        summary = summarize(latencies, time.perf_counter() - started)
+        if best is None or summary['p50_ms'] < best['p50_ms']:
+            best = summary
+    return best
+
+
+def run_load(request, total, threads, setup=None):
+    """Runs ``request(state, i)`` ``total`` times from ``threads`` threads and summarizes.
+
+    ``setup()`` builds each thread's state once (e.g. its own test client). ``request``
+    returns True on success; a False return or an exception counts as an error and its
+    latency is left out.
+    """
+    local = threading.local()
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        if not hasattr(local, 'state'):
+            local.state = setup() if setup else None
+        started = time.perf_counter()
+        try:
+            ok = request(local.state, i)
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        if not ok:
+            with lock:
+                errors += 1
+            return None
+        return elapsed
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = [latency for latency in pool.map(one, range(total)) if latency is not None]
+    return summarize(latencies, time.perf_counter() - started, errors)
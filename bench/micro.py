@@ -0,0 +1,65 @@
+# bench/micro.py
+# Micro-benchmarks of the DB helpers and prompt construction behind the hot routes
+#
+# Each benchmark calls one function many times on a single pooled connection (same
+# pragmas and row factory as the app) for a goal of the biggest user, so the numbers
+# track the query or builder itself, not the request around it.
+
+import random
+
+import analytics
+import prompts
+import search
+from bench.driver import time_calls
+from db_pool import ConnectionPool
+from page_cache import get_versions
+from task_store import set_task_statuses
+from tenancy import get_goal, user_goals
+
+GOAL_COLUMNS = 'goal_id, description, positive_reasons, consequences_of_inaction, status'
+
+
+def benchmarks(app_module, db, user_id, goal_id, task_ids, rng):
+    """{name: zero-argument callable} of everything measured."""
+    goal = get_goal(db, user_id, goal_id, GOAL_COLUMNS)
+    plan_goals = [dict(row) for row in user_goals(db, user_id, columns=GOAL_COLUMNS)[:3]]
+    dates = app_module.plan_dates(7)
+    week_start = app_module.task_window_start()
+
+    def task_page():
+        return app_module.query_task_page(db, goal_id, after=week_start).fetchall()
+
+    def toggle_status():
+        return set_task_statuses(db, [(rng.choice(task_ids), rng.choice(('Planned', 'Completed', 'Missed')))], user_id)
+
+    return {
+        'db.get_goal': lambda: get_goal(db, user_id, goal_id),
+        'db.user_goals': lambda: user_goals(db, user_id, 'Active'),
+        'db.task_page': task_page,
+        'db.week_progress': lambda: app_module.get_week_progress(db, goal_id),
+        'db.content_versions': lambda: get_versions(db, ('goal', goal_id), ('user', user_id)),
+        'db.set_task_status': toggle_status,
+        'db.goal_analytics': lambda: analytics.goal_stats(db, goal_id),
+        'db.search_tasks': lambda: search.search_tasks(db, user_id, 'study no'),
+        'prompt.today_task': lambda: prompts.today_task_prompt(db, goal, goal_id, app_module.get_week_progress(db, goal_id)),
+        'prompt.plan': lambda: prompts.plan_prompt(db, plan_goals, dates),
+        'prompt.estimate_tokens': lambda: prompts.estimate_tokens(goal['positive_reasons'] * 20),
+    }
+
+
+def run_micro(app_module, ctx, path, iterations=300, seed=1):
+    """Runs every micro-benchmark ``iterations`` times; returns {name: summary}."""
+    pool = ConnectionPool(path, max_size=1)
+    db = pool.acquire()
+    try:
+        user_id = max(ctx.user_ids, key=lambda u: len(ctx.goals[u]))
+        goal_id = ctx.goals[user_id][0]
+        rng = random.Random(seed)
+        task_ids = ctx.tasks[goal_id] or [0]
+        results = {}
+        for name, fn in benchmarks(app_module, db, user_id, goal_id, task_ids, rng).items():
+            results[f"micro.{name}"] = time_calls(fn, iterations)
+        return results
+    finally:
+        pool.release(db)
+        pool.close_all()
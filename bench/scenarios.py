@@ -0,0 +1,128 @@
+# bench/scenarios.py
+# Flask test-client load scenarios against a synthetic database
+#
+# Requests go through the whole app (routing, user lookup, pool, writer, templates, fake
+# LLM) in this process, from a thread pool with one test client per thread, as random
+# synthetic users (USER_HEADER). No sockets, so the numbers are the app's own cost.
+
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import threading
+
+from bench.driver import run_load
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER_HEADER = 'X-Bench-User'
+STATUS_ACTIONS = ('complete', 'missed', 'reset')
+
+
+def load_app(workdir, llm_latency=0.02, seed=1):
+    """Imports app.py configured for benchmarking, on ``workdir``/coach_agent.db.
+
+    The module reads its configuration at import time, so this works once per process.
+    The Flask app itself is ``app.create_app()``, built by run_scenarios().
+    """
+    os.environ.update({
+        'LLM_BACKEND': 'fake',
+        'LLM_FAKE_LATENCY': str(llm_latency),
+        'LLM_FAKE_LATENCY_SIGMA': '0.3',
+        'LLM_FAKE_SEED': str(seed),
+        'AI_CACHE_DB': os.path.join(workdir, 'ai_cache.db'),
+        'USER_HEADER': USER_HEADER,
+        'LOG_LEVEL': os.getenv('BENCH_LOG_LEVEL', 'WARNING'),
+        'PROFILE_SAMPLE_RATE': '0',
+    })
+    os.chdir(workdir)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)  # The app's modules, wherever the run started
+    import app
+    return app
+
+
+class Context:
+    """Who the synthetic users are: their usernames, goals and tasks around today."""
+
+    def __init__(self, path, tasks_per_goal=20):
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        try:
+            self.usernames = {row['user_id']: row['username'] for row in conn.execute("SELECT user_id, username FROM users")}
+            self.goals = {}
+            for row in conn.execute("SELECT user_id, goal_id FROM goals ORDER BY goal_id"):
+                self.goals.setdefault(row['user_id'], []).append(row['goal_id'])
+            self.tasks = {}
+            for goal_ids in self.goals.values():
+                for goal_id in goal_ids:
+                    self.tasks[goal_id] = [row[0] for row in conn.execute(
+                        """SELECT task_id FROM tasks WHERE goal_id = ? AND due_date >= date('now', '-14 days')
+                           ORDER BY due_date LIMIT ?""", (goal_id, tasks_per_goal))]
+        finally:
+            conn.close()
+        self.user_ids = sorted(user_id for user_id in self.goals if user_id in self.usernames)
+
+    def pick(self, rng):
+        """(headers, goal_id) of a random user and one of their goals."""
+        user_id = rng.choice(self.user_ids)
+        return {USER_HEADER: self.usernames[user_id]}, rng.choice(self.goals[user_id])
+
+
+def dashboard(client, ctx, rng):
+    headers, _ = ctx.pick(rng)
+    return client.get('/', headers=headers).status_code == 200
+
+
+def goal_detail(client, ctx, rng):
+    headers, goal_id = ctx.pick(rng)
+    response = client.get(f'/goal/{goal_id}', headers=headers)
+    response.get_data()  # The page is streamed: render all of it
+    response.close()
+    return response.status_code == 200
+
+
+def status_toggle(client, ctx, rng):
+    headers, goal_id = ctx.pick(rng)
+    if not ctx.tasks[goal_id]:
+        return True
+    task_id = rng.choice(ctx.tasks[goal_id])
+    return client.post(f'/task/{task_id}/{rng.choice(STATUS_ACTIONS)}', headers=headers).status_code == 302
+
+
+def bulk_generation(client, ctx, rng):
+    headers, goal_id = ctx.pick(rng)
+    response = client.post('/plans', json={'goal_ids': [goal_id], 'days': 7, 'save': True}, headers=headers)
+    return response.status_code in (200, 201)
+
+
+SCENARIOS = {
+    'dashboard': dashboard,
+    'goal_detail': goal_detail,
+    'status_toggle': status_toggle,
+    'bulk_generation': bulk_generation,
+}
+
+
+def run_scenarios(app_module, ctx, names=tuple(SCENARIOS), requests=500, threads=8, seed=1):
+    """Runs each scenario for ``requests`` requests from ``threads`` threads; returns {name: summary}."""
+    flask_app = app_module.create_app()
+    results = {}
+    for name in names:
+        scenario = SCENARIOS[name]
+        thread_numbers = itertools.count()
+        lock = threading.Lock()
+
+        def setup():
+            with lock:
+                number = next(thread_numbers)
+            return flask_app.test_client(), random.Random(f"{seed}:{name}:{number}")
+
+        def request(state, i):
+            client, rng = state
+            return scenario(client, ctx, rng)
+
+        # Bulk generation waits on the (fake) LLM, so it gets fewer requests
+        total = max(requests // 10, threads) if name == 'bulk_generation' else requests
+        results[f"load.{name}"] = dict(run_load(request, total, threads, setup), threads=threads)
+    return results
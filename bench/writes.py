@@ -0,0 +1,152 @@
+# bench/writes.py
+# Write throughput/latency benchmark: per-request commits vs. the group-committing writer
+#
+# Runs the task_store write functions the routes use from many threads at once, either the
+# way WRITE_QUEUE=0 does (each thread commits on a pooled connection of its own) or through
+# one WriteQueue, against a fresh database (bench.datagen) per run. Reports writes/s,
+# p50/p95/p99 latency, lock errors and, for the queue, the average batch size.
+#
+#   python -m bench.writes                                  # 16 threads, status + insert, NORMAL and FULL sync
+#   python -m bench.writes --threads 64 --ops 200 --workload status --sync FULL
+#   python -m bench.writes --busy-timeout 100 --json results.json   # short lock waits expose 'database is locked'
+
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from bench.datagen import build_database
+from bench.driver import summarize
+from db_pool import DEFAULT_PRAGMAS, ConnectionPool
+from task_store import insert_tasks, set_task_statuses
+from write_queue import WriteQueue
+
+STATUSES = ('Planned', 'Completed', 'Missed')
+HISTORY_YEARS = 0.1  # About a month of daily tasks per user to toggle
+
+
+def make_operation(workload, user_id, goal_id, task_ids, rng):
+    """(function, args) of one write like the routes issue: a status toggle or a one-task insert."""
+    if workload == 'status':
+        return set_task_statuses, ([(rng.choice(task_ids), rng.choice(STATUSES))], user_id)
+    task = {'goal_id': goal_id, 'description': 'Benchmark insert', 'due_date': datetime.date.today().isoformat()}
+    return insert_tasks, ([task], user_id)
+
+
+def run(mode, workload, sync, threads, ops, users, busy_timeout, seed):
+    """One benchmark run on a fresh database; returns its result dict."""
+    workdir = tempfile.mkdtemp(prefix='bench_writes_')
+    path = os.path.join(workdir, 'bench.db')
+    build_database(path, users, goals_per_user=1, years=HISTORY_YEARS, seed=seed)
+    conn = sqlite3.connect(path)
+    goal_ids = dict(conn.execute("SELECT user_id, goal_id FROM goals").fetchall())
+    user_tasks = {user_id: [row[0] for row in conn.execute("SELECT task_id FROM tasks WHERE goal_id = ?", (goal_id,))]
+                  for user_id, goal_id in goal_ids.items()}
+    conn.close()
+    pragmas = dict(DEFAULT_PRAGMAS, synchronous=sync, busy_timeout=busy_timeout)
+
+    pool = writer = None
+    if mode == 'direct':
+        pool = ConnectionPool(path, max_size=threads, pragmas=pragmas)
+    else:
+        writer = WriteQueue(path, pragmas=pragmas, max_queue=threads * 2)
+
+    latencies, errors = [], {}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(threads + 1)
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        user_id = index % users + 1
+        mine, failures = [], {}
+        start_barrier.wait()
+        for _ in range(ops):
+            fn, args = make_operation(workload, user_id, goal_ids[user_id], user_tasks[user_id], rng)
+            started = time.perf_counter()
+            try:
+                if writer is not None:
+                    writer.execute(fn, *args)
+                else:
+                    conn = pool.acquire()
+                    try:
+                        fn(conn, *args)  # The task_store functions commit (or roll back) themselves
+                    finally:
+                        pool.release(conn)
+            except sqlite3.Error as e:
+                key = 'database is locked' if 'locked' in str(e) else type(e).__name__
+                failures[key] = failures.get(key, 0) + 1
+                continue
+            mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+            for key, count in failures.items():
+                errors[key] = errors.get(key, 0) + count
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    summary = summarize(latencies, elapsed)
+    result = {
+        'mode': mode, 'workload': workload, 'synchronous': sync, 'threads': threads,
+        'writes': summary['count'], 'errors': errors, 'seconds': summary['seconds'],
+        'writes_per_second': summary['throughput'],
+        'p50_ms': summary['p50_ms'], 'p95_ms': summary['p95_ms'], 'p99_ms': summary['p99_ms'],
+    }
+    if writer is not None:
+        result['avg_batch'] = writer.stats()['avg_batch']
+        writer.close()
+    else:
+        pool.close_all()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare per-request commits with group commit under concurrent writes.')
+    parser.add_argument('--threads', type=int, default=16, help='concurrent writers (request threads)')
+    parser.add_argument('--ops', type=int, default=100, help='writes per thread')
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--workload', choices=('status', 'insert'), action='append', dest='workloads',
+                        help='status toggles or one-task inserts (default: both)')
+    parser.add_argument('--sync', choices=('NORMAL', 'FULL'), action='append', dest='syncs',
+                        help='PRAGMA synchronous (default: both)')
+    parser.add_argument('--busy-timeout', type=int, default=DEFAULT_PRAGMAS['busy_timeout'],
+                        help="ms a writer waits on the lock before 'database is locked'")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', metavar='FILE', help='also write the results here')
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'workload':<8} {'sync':<6} {'mode':<7} {'writes/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7} {'batch':>6}")
+    for workload in args.workloads or ['status', 'insert']:
+        for sync in args.syncs or ['NORMAL', 'FULL']:
+            for mode in ('direct', 'queue'):
+                r = run(mode, workload, sync, args.threads, args.ops, args.users, args.busy_timeout, args.seed)
+                results.append(r)
+                print(f"{workload:<8} {sync:<6} {mode:<7} {r['writes_per_second']:>9} {r['p50_ms']!s:>8} "
+                      f"{r['p95_ms']!s:>8} {r['p99_ms']!s:>8} {sum(r['errors'].values()):>7} "
+                      f"{r.get('avg_batch') or '-':>6}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Results written to {args.json}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# check_import_time.py
+# Cold-start regression check for app.py, from python -X importtime.
+#
+# Imports app in fresh interpreters (in an empty directory, best of --runs) and exits non-zero if:
+#   - the whole import takes longer than --budget ms, or this repo's own modules (their
+#     self time, without Flask and other dependencies) take longer than --own-budget ms;
+#   - a module that must load lazily (NumPy, the Gemini SDK, asyncio) is imported;
+#   - the import creates files (the database is only checked on the first request).
+#
+#   python check_import_time.py
+#   python check_import_time.py --budget 250 --own-budget 10 --runs 10 --top 20
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MODULE = 'app'
+# Modules app.py must not import eagerly, and what loads them on first use
+LAZY_MODULES = {
+    'numpy': 'analytics.py functions',
+    'google.generativeai': 'GeminiBackend._client()',
+    'asyncio': 'the async LLM backend methods',
+}
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def own_modules():
+    """Top-level module names of this repository."""
+    return {name[:-3] for name in os.listdir(ROOT) if name.endswith('.py')}
+
+
+def measure(module=MODULE):
+    """One cold import in a fresh interpreter: ({name: (self_us, cumulative_us)}, files created)."""
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.environ.get('PYTHONPATH')))))
+        env.pop('PYTHONDONTWRITEBYTECODE', None)  # Deployed code starts from .pyc files, not by compiling
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=workdir, env=env, capture_output=True, text=True, timeout=120)
+        if result.returncode:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+        created = sorted(os.listdir(workdir))
+    timings = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            timings[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return timings, created
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the cold-start import time of app.py against a budget.')
+    parser.add_argument('--budget', type=float, default=float(os.getenv('IMPORT_TIME_BUDGET_MS', '350')),
+                        help='ms for the whole import, dependencies included')
+    parser.add_argument('--own-budget', type=float, default=float(os.getenv('IMPORT_TIME_OWN_BUDGET_MS', '25')),
+                        help="ms for this repository's own modules")
+    parser.add_argument('--runs', type=int, default=5, help='cold imports to take the fastest of')
+    parser.add_argument('--top', type=int, default=10, help='slowest modules (by self time) to list')
+    args = parser.parse_args(argv)
+
+    mine = own_modules()
+    best = None
+    for _ in range(args.runs):
+        timings, created = measure()
+        total = timings[MODULE][1] / 1000
+        own = sum(self_us for name, (self_us, _) in timings.items() if name.split('.')[0] in mine) / 1000
+        if best is None or total < best[0]:
+            best = (total, own, timings, created)
+    total, own, timings, created = best
+
+    print(f"import {MODULE}: {total:.1f} ms (budget {args.budget:.0f}), own modules {own:.1f} ms "
+          f"(budget {args.own_budget:.0f}), best of {args.runs}")
+    for name, (self_us, cumulative_us) in sorted(timings.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"     {self_us / 1000:8.1f} ms self {cumulative_us / 1000:8.1f} ms cumulative  {name}")
+
+    failures = []
+    if total > args.budget:
+        failures.append(f"import {MODULE} takes {total:.1f} ms, over the {args.budget:.0f} ms budget.")
+    if own > args.own_budget:
+        failures.append(f"This repository's modules take {own:.1f} ms, over the {args.own_budget:.0f} ms budget.")
+    for name, loader in LAZY_MODULES.items():
+        if name in timings:
+            failures.append(f"{name} is imported eagerly; it should only be loaded by {loader}.")
+    if created:
+        failures.append(f"Importing {MODULE} created {', '.join(created)}; startup work belongs in create_app() "
+                        f"or the first request.")
+    for message in failures:
+        print(f"🔴 {message}")
+    if failures:
+        return 1
+    print(f"✅ import {MODULE} is within budget and free of eager heavy imports and side effects.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# check_query_plans.py
+# Query-plan regression check for the route queries in app.py.
+#
+# Builds a synthetic database from schema.sql, runs EXPLAIN QUERY PLAN
+# for every hot query and exits non-zero if any of them scans goals, tasks or a rollup table in full.
+#
+#   python check_query_plans.py                 # default size (~150k tasks)
+#   python check_query_plans.py --users 50 --days 1095 --keep big.db
+
+import argparse
+import datetime
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+
+SCHEMA = 'schema.sql'
+
+# (route, sql, params) - keep in sync with the queries in app.py
+ROUTE_QUERIES = [
+    ("index: user_goals(status='Active')",
+     "SELECT goal_id, description, status FROM goals WHERE user_id = ? AND status = 'Active' ORDER BY creation_date DESC",
+     (1,)),
+    ("user_goals",
+     "SELECT goal_id, description, status FROM goals WHERE user_id = ? ORDER BY creation_date DESC",
+     (1,)),
+    ("get_last_week_goals_descriptions",
+     "SELECT description FROM goals WHERE user_id = ? AND creation_date >= date('now', '-7 days') AND creation_date < date('now')",
+     (1,)),
+    ("get_goal",
+     "SELECT * FROM goals WHERE user_id = ? AND goal_id = ?",
+     (1, 1)),
+    ("goal_detail / goal_tasks: next page",
+     """SELECT task_id, description, due_date, status FROM tasks
+        WHERE goal_id = ? AND (due_date, task_id) > (?, ?) ORDER BY due_date, task_id LIMIT ?""",
+     (1, '2024-01-01', 0, 51)),
+    ("goal_tasks: previous page",
+     """SELECT task_id, description, due_date, status FROM tasks
+        WHERE goal_id = ? AND (due_date, task_id) < (?, ?) ORDER BY due_date DESC, task_id DESC LIMIT ?""",
+     (1, '2024-01-01', 0, 51)),
+    ("goal_detail: earlier tasks exist",
+     "SELECT 1 FROM tasks WHERE goal_id = ? AND due_date < ? LIMIT 1",
+     (1, '2024-01-01')),
+    ("set_task_statuses: ownership join",
+     """SELECT t.task_id, t.goal_id, t.status
+        FROM tasks t JOIN goals g ON g.goal_id = t.goal_id
+        WHERE g.user_id = ? AND t.task_id IN (?, ?, ?)""",
+     (1, 1, 2, 3)),
+    ("set_task_statuses: grouped update",
+     "UPDATE tasks SET status = ?, completion_date = ? WHERE task_id IN (?, ?, ?)",
+     ('Missed', None, 1, 2, 3)),
+    ("sweep_overdue_tasks: all users",
+     "UPDATE tasks SET status = 'Missed', completion_date = NULL WHERE status = 'Planned' AND due_date < ?",
+     ('2024-01-01',)),
+    ("sweep_overdue_tasks: user",
+     """UPDATE tasks SET status = 'Missed', completion_date = NULL WHERE status = 'Planned' AND due_date < ?
+        AND goal_id IN (SELECT goal_id FROM goals WHERE user_id = ?)""",
+     ('2024-01-01', 1)),
+    ("sweep_overdue_tasks: goal",
+     """UPDATE tasks SET status = 'Missed', completion_date = NULL WHERE status = 'Planned' AND due_date < ?
+        AND goal_id = ? AND goal_id IN (SELECT goal_id FROM goals WHERE user_id = ?)""",
+     ('2024-01-01', 1, 1)),
+    ("load_plan_goals",
+     """SELECT goal_id, description, positive_reasons, consequences_of_inaction
+        FROM goals WHERE user_id = ? AND goal_id IN (?, ?)""",
+     (1, 1, 2)),
+    ("get_suggestion",
+     """SELECT task_description, coach_message, model, computed_at
+        FROM precomputed_suggestions WHERE goal_id = ? AND day = ?""",
+     (1, '2024-01-01')),
+    ("precompute: pending goals",
+     """SELECT g.goal_id FROM goals g
+        WHERE g.status = 'Active' AND g.goal_id > ?
+          AND NOT EXISTS (SELECT 1 FROM precomputed_suggestions s WHERE s.goal_id = g.goal_id AND s.day = ?)
+        ORDER BY g.goal_id LIMIT ?""",
+     (0, '2024-01-01', 200)),
+    ("recent_task_examples",
+     """SELECT status, description FROM tasks
+        WHERE goal_id = ? AND status IN ('Completed', 'Missed')
+        ORDER BY due_date DESC LIMIT ?""",
+     (1, 30)),
+    ("get_versions",
+     "SELECT scope, id, version, updated_at FROM content_versions WHERE (scope = ? AND id = ?)",
+     ('goal', 1)),
+    ("search_goals",
+     """SELECT g.goal_id, g.status, g.description, bm25(goals_fts, 2.0, 1.0) AS score
+        FROM goals_fts JOIN goals g ON g.goal_id = goals_fts.rowid
+        WHERE goals_fts MATCH ? AND g.user_id = ? ORDER BY score LIMIT ? OFFSET ?""",
+     ('"goal"*', 1, 20, 0)),
+    ("search_tasks",
+     """SELECT t.task_id, t.goal_id, t.due_date, t.status, t.description, g.description, bm25(tasks_fts) AS score
+        FROM tasks_fts JOIN tasks t ON t.task_id = tasks_fts.rowid JOIN goals g ON g.goal_id = t.goal_id
+        WHERE tasks_fts MATCH ? AND g.user_id = ? ORDER BY score, t.due_date DESC LIMIT ? OFFSET ?""",
+     ('"task"*', 1, 20, 0)),
+    ("get_week_progress",
+     "SELECT COALESCE(SUM(completed), 0), COALESCE(SUM(missed), 0) FROM goal_progress_daily WHERE goal_id = ? AND day >= ?",
+     (1, '2024-01-01')),
+]
+
+# A plan line like "SCAN tasks" or "SCAN goals USING INDEX ..." walks the whole table/index
+FULL_SCAN = re.compile(r'^SCAN (goals|tasks|goal_progress_daily|goal_completion_hours|precomputed_suggestions|content_versions)\b')
+
+
+def build_synthetic_db(path, users, goals_per_user, days):
+    """Creates a database with users x goals x days daily tasks and runs ANALYZE."""
+    conn = sqlite3.connect(path)
+    with open(SCHEMA, 'r') as f:
+        conn.executescript(f.read())
+
+    statuses = ('Completed', 'Completed', 'Missed', 'Planned')
+    start = datetime.date.today() - datetime.timedelta(days=days)
+    conn.executemany(
+        "INSERT OR IGNORE INTO users (user_id, username, preferences) VALUES (?, ?, '{}')",
+        ((u, f"user_{u}") for u in range(1, users + 1)),
+    )
+    goal_id = 0
+    for user_id in range(1, users + 1):
+        for g in range(goals_per_user):
+            goal_id += 1
+            created = start + datetime.timedelta(days=g)
+            conn.execute(
+                """INSERT INTO goals (goal_id, user_id, description, status, positive_reasons,
+                                      consequences_of_inaction, creation_date)
+                   VALUES (?, ?, ?, ?, 'reasons', 'consequences', ?)""",
+                (goal_id, user_id, f"Goal {goal_id}", 'Active' if g % 3 else 'Paused', created.isoformat()),
+            )
+            conn.executemany(
+                "INSERT INTO tasks (goal_id, description, due_date, status) VALUES (?, ?, ?, ?)",
+                ((goal_id, f"Task {d}", (start + datetime.timedelta(days=d)).isoformat(), statuses[d % 4])
+                 for d in range(days)),
+            )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.commit()
+    return conn
+
+
+def check_plans(conn):
+    """Returns a list of (route, plan_lines, ok) for every route query."""
+    results = []
+    for route, sql, params in ROUTE_QUERIES:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        ok = not any(FULL_SCAN.match(line) for line in plan)
+        results.append((route, plan, ok))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--goals', type=int, default=10, help='goals per user')
+    parser.add_argument('--days', type=int, default=730, help='daily tasks per goal')
+    parser.add_argument('--keep', metavar='PATH', help='build (and keep) the synthetic database at PATH')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.keep or os.path.join(tmp, 'query_plans.db')
+        if os.path.exists(path):
+            os.remove(path)
+        started = time.perf_counter()
+        conn = build_synthetic_db(path, args.users, args.goals, args.days)
+        task_count = conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+        print(f"Built synthetic database with {task_count} tasks in {time.perf_counter() - started:.1f}s")
+
+        failures = 0
+        for route, plan, ok in check_plans(conn):
+            print(f"{'✅' if ok else '🔴'} {route}")
+            for line in plan:
+                print(f"     {line}")
+            failures += not ok
+        conn.close()
+
+    if failures:
+        print(f"🔴 {failures} route queries fall back to a full table scan.")
+        return 1
+    print("✅ No route query scans a full table.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,374 @@
+# data_transfer.py
+# Streaming export and import of a user's goals and tasks (NDJSON or CSV)
+#
+# Both directions work in bounded batches, so memory stays flat however many tasks a user
+# has: exports read cursors with fetchmany() and yield the output in chunks (the app sends
+# them as a chunked HTTP response), and imports parse their input line by line and insert
+# in one short transaction per batch. Imported goals and tasks get new ids; task goal_ids
+# are remapped to the new goals, which is why an export lists every goal before its tasks.
+#
+#   python data_transfer.py export --user 1 > backup.ndjson
+#   python data_transfer.py export --user 1 --format csv -o backup.csv
+#   python data_transfer.py import backup.ndjson --user 2
+
+import argparse
+import csv
+import datetime
+import io
+import json
+import sqlite3
+import sys
+import time
+
+from task_store import VALID_STATUSES
+
+DATABASE = 'coach_agent.db'
+FORMAT_VERSION = 1
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+GOAL_STATUSES = ('Active', 'Achieved', 'Paused')
+BATCH_SIZE = 1000  # Rows per fetchmany() on export, and per transaction on import
+MAX_REPORTED_ERRORS = 20
+
+GOAL_COLUMNS = ('goal_id', 'description', 'target_date', 'status', 'positive_reasons',
+                'consequences_of_inaction', 'creation_date')
+TASK_COLUMNS = ('task_id', 'goal_id', 'description', 'due_date', 'status', 'completion_date',
+                'estimated_time', 'creation_date')
+CSV_COLUMNS = ('type',) + GOAL_COLUMNS + tuple(c for c in TASK_COLUMNS if c not in GOAL_COLUMNS)
+
+
+class ImportFormatError(ValueError):
+    """Raised when an import stream is not in the expected format at all (e.g. wrong CSV header)."""
+
+
+class TransferStats:
+    """Row counts and throughput of one export or import."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.goals = 0
+        self.tasks = 0
+        self.skipped = 0
+        self.errors = []  # First MAX_REPORTED_ERRORS problems: {'line': n, 'error': message}
+
+    def error(self, line, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+
+    def as_dict(self):
+        rows = self.goals + self.tasks
+        return {
+            'goals': self.goals,
+            'tasks': self.tasks,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(rows / self.seconds) if self.seconds else None,
+        }
+
+
+def _text(value):
+    # Pooled connections parse TIMESTAMP columns into datetimes; export them as SQLite stores them
+    return str(value) if isinstance(value, (datetime.datetime, datetime.date)) else value
+
+
+# --- Export ---
+def export_records(db, user_id, stats=None, batch_size=BATCH_SIZE):
+    """Yields lists of up to ``batch_size`` records: the user's goals, then each goal's tasks.
+
+    Records are dicts with a 'type' of 'goal' or 'task' and the table's columns.
+    """
+    stats = stats or TransferStats()
+    goal_ids = []
+    cursor = db.execute(
+        f"SELECT {', '.join(GOAL_COLUMNS)} FROM goals WHERE user_id = ? ORDER BY creation_date, goal_id",
+        (user_id,))
+    while rows := cursor.fetchmany(batch_size):
+        goal_ids.extend(row[0] for row in rows)
+        stats.goals += len(rows)
+        yield [dict(zip(GOAL_COLUMNS, map(_text, row)), type='goal') for row in rows]
+    for goal_id in goal_ids:
+        # One goal at a time walks idx_tasks_goal_due in order, so there is nothing to sort
+        cursor = db.execute(
+            f"SELECT {', '.join(TASK_COLUMNS)} FROM tasks WHERE goal_id = ? ORDER BY due_date, task_id",
+            (goal_id,))
+        while rows := cursor.fetchmany(batch_size):
+            stats.tasks += len(rows)
+            yield [dict(zip(TASK_COLUMNS, map(_text, row)), type='task') for row in rows]
+    stats.finish()
+
+
+def _header(user_id):
+    return {'type': 'export', 'format_version': FORMAT_VERSION, 'user_id': user_id,
+            'exported_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')}
+
+
+def export_ndjson(db, user_id, stats=None, batch_size=BATCH_SIZE):
+    """Yields the export as NDJSON text chunks: a header line, then one JSON object per goal/task."""
+    yield json.dumps(_header(user_id)) + '\n'
+    for records in export_records(db, user_id, stats, batch_size):
+        yield ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+
+
+def export_csv(db, user_id, stats=None, batch_size=BATCH_SIZE):
+    """Yields the export as CSV text chunks with CSV_COLUMNS; each row fills its type's columns."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, CSV_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for records in export_records(db, user_id, stats, batch_size):
+        writer.writerows(records)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+EXPORTERS = {'ndjson': export_ndjson, 'csv': export_csv}
+
+
+# --- Import ---
+def read_ndjson(lines):
+    """Yields (line_number, record or ValueError) from NDJSON text lines."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("each line must be a JSON object")
+        except ValueError as e:
+            yield number, ValueError(f"invalid JSON: {e}")
+            continue
+        yield number, record
+
+
+def read_csv(lines):
+    """Yields (line_number, record) from CSV text lines written by export_csv()."""
+    reader = csv.DictReader(lines)
+    if not reader.fieldnames or 'type' not in reader.fieldnames:
+        raise ImportFormatError("CSV import needs a header row with a 'type' column")
+    for record in reader:
+        # Empty cells stand for NULL, since CSV cannot tell them apart
+        yield reader.line_num, {key: (value if value != '' else None) for key, value in record.items()}
+
+
+READERS = {'ndjson': read_ndjson, 'csv': read_csv}
+
+
+def _date(record, field, kind, required=False):
+    """``record[field]`` as a YYYY-MM-DD string, or None when it is empty and not ``required``."""
+    value = record.get(field)
+    if value in (None, '') and not required:
+        return None
+    if isinstance(value, str) and len(value) == 10:
+        try:
+            return datetime.date.fromisoformat(value).isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f"{kind} {field} {value!r} is not a YYYY-MM-DD date")
+
+
+def _timestamp(record, field, kind):
+    """``record[field]`` if it is an ISO date or timestamp as SQLite stores them, None when empty."""
+    value = record.get(field)
+    if value in (None, ''):
+        return None
+    if isinstance(value, str):
+        try:
+            datetime.datetime.fromisoformat(value)
+            return value
+        except ValueError:
+            pass
+    raise ValueError(f"{kind} {field} {value!r} is not a timestamp")
+
+
+def _goal_row(record, user_id):
+    for field in ('description', 'positive_reasons', 'consequences_of_inaction'):
+        if not isinstance(record.get(field), str) or not record[field].strip():
+            raise ValueError(f"goal {field} is required")
+    status = record.get('status') or 'Active'
+    if status not in GOAL_STATUSES:
+        raise ValueError(f"goal status must be one of {', '.join(GOAL_STATUSES)}")
+    return (user_id, record['description'].strip(), _date(record, 'target_date', 'goal'), status,
+            record['positive_reasons'], record['consequences_of_inaction'],
+            _timestamp(record, 'creation_date', 'goal'))
+
+
+def _task_row(record, goal_map):
+    try:
+        goal_id = goal_map[int(record.get('goal_id'))]
+    except (TypeError, ValueError):
+        raise ValueError("task goal_id must be an integer")
+    except KeyError:
+        raise ValueError(f"task refers to goal {record.get('goal_id')}, which was not imported before it")
+    description = record.get('description')
+    if not isinstance(description, str) or not description.strip():
+        raise ValueError("task description is required")
+    due_date = _date(record, 'due_date', 'task', required=True)
+    status = record.get('status') or 'Planned'
+    if status not in VALID_STATUSES:
+        raise ValueError(f"task status must be one of {', '.join(VALID_STATUSES)}")
+    estimated_time = record.get('estimated_time')
+    if estimated_time is not None and (isinstance(estimated_time, bool)
+                                       or not isinstance(estimated_time, (str, int, float))):
+        raise ValueError("task estimated_time must be text or a number")
+    return (goal_id, description.strip(), due_date, status, _timestamp(record, 'completion_date', 'task'),
+            estimated_time,
+            _timestamp(record, 'creation_date', 'task'))
+
+
+class _BatchWriter:
+    """Inserts goals right away and tasks in executemany() batches, committing every
+    ``batch_size`` rows so no transaction (or its lock) outlives one batch."""
+
+    def __init__(self, db, batch_size):
+        self.db = db
+        self.batch_size = batch_size
+        self.tasks = []
+        self.rows = 0  # Rows written in the open transaction
+
+    def _begin(self):
+        if not self.db.in_transaction:
+            self.db.execute("BEGIN IMMEDIATE")
+
+    def add_goal(self, row):
+        self._begin()
+        goal_id = self.db.execute(
+            """INSERT INTO goals (user_id, description, target_date, status, positive_reasons,
+                                  consequences_of_inaction, creation_date)
+               VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))""", row).lastrowid
+        self.rows += 1
+        return goal_id
+
+    def add_task(self, row):
+        self.tasks.append(row)
+        if self.rows + len(self.tasks) >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        if self.tasks:
+            self._begin()
+            self.db.executemany(
+                """INSERT INTO tasks (goal_id, description, due_date, status, completion_date,
+                                      estimated_time, creation_date)
+                   VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))""", self.tasks)
+        self.db.commit()
+        self.rows = 0
+        self.tasks.clear()
+
+
+def import_records(db, user_id, records, batch_size=BATCH_SIZE, stats=None):
+    """Imports (line_number, record) pairs for ``user_id`` and returns the TransferStats.
+
+    Goals get new ids and their tasks follow them; the old-to-new goal id map is the only
+    thing kept across batches. Invalid records are skipped and reported with their line.
+    A database error stops the import; batches committed before it stay imported.
+    """
+    stats = stats or TransferStats()
+    goal_map = {}  # Exported goal_id -> new goal_id
+    writer = _BatchWriter(db, batch_size)
+    try:
+        for line, record in records:
+            if isinstance(record, Exception):
+                stats.error(line, str(record))
+                continue
+            kind = record.get('type')
+            try:
+                if kind == 'export':
+                    try:
+                        version = int(record.get('format_version') or 0)
+                    except (TypeError, ValueError):
+                        raise ValueError(f"export format_version {record.get('format_version')!r} is not an integer")
+                    if version > FORMAT_VERSION:
+                        raise ImportFormatError(
+                            f"export format version {record['format_version']} is newer than this app")
+                elif kind == 'goal':
+                    row = _goal_row(record, user_id)
+                    try:
+                        old_id = int(record.get('goal_id'))
+                    except (TypeError, ValueError):
+                        raise ValueError("goal goal_id must be an integer")
+                    goal_map[old_id] = writer.add_goal(row)
+                    stats.goals += 1
+                elif kind == 'task':
+                    writer.add_task(_task_row(record, goal_map))
+                    stats.tasks += 1
+                else:
+                    raise ValueError(f"unknown record type {kind!r}")
+            except ImportFormatError:
+                raise
+            except ValueError as e:
+                stats.error(line, str(e))
+        writer.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        stats.finish()
+    return stats
+
+
+def import_stream(db, user_id, lines, fmt='ndjson', batch_size=BATCH_SIZE):
+    """Parses text ``lines`` in format ``fmt`` and imports them; returns the TransferStats."""
+    return import_records(db, user_id, READERS[fmt](lines), batch_size)
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30.0)
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import a user's goals and tasks.")
+    parser.add_argument('--db', default=DATABASE)
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='write NDJSON or CSV to stdout or --output')
+    export.add_argument('--user', type=int, default=1)
+    export.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+    export.add_argument('-o', '--output', help='file to write (default: stdout)')
+    load = commands.add_parser('import', help='read an export file into a user')
+    load.add_argument('file')
+    load.add_argument('--user', type=int, default=1)
+    load.add_argument('--format', choices=sorted(FORMATS), help='default: from the file extension')
+    load.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='rows per transaction')
+    args = parser.parse_args(argv)
+
+    conn = _connect(args.db)
+    try:
+        if args.command == 'export':
+            stats = TransferStats()
+            out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+            try:
+                for chunk in EXPORTERS[args.format](conn, args.user, stats):
+                    out.write(chunk)
+            finally:
+                if args.output:
+                    out.close()
+            report = stats.as_dict()
+            print(f"✅ Exported {report['goals']} goals and {report['tasks']} tasks in {report['seconds']}s "
+                  f"({report['rows_per_second']} rows/s).", file=sys.stderr)
+            return 0
+
+        fmt = args.format or ('csv' if args.file.lower().endswith('.csv') else 'ndjson')
+        with open(args.file, 'r', newline='', encoding='utf-8') as f:
+            report = import_stream(conn, args.user, f, fmt, args.batch_size).as_dict()
+        print(f"✅ Imported {report['goals']} goals and {report['tasks']} tasks in {report['seconds']}s "
+              f"({report['rows_per_second']} rows/s), {report['skipped']} skipped.", file=sys.stderr)
+        for error in report['errors']:
+            print(f"⚠️ Line {error['line']}: {error['error']}", file=sys.stderr)
+        return 0
+    except (sqlite3.Error, ImportFormatError, OSError) as e:
+        print(f"🔴 {args.command.capitalize()} failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
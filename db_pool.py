@@ -0,0 +1,199 @@
+# db_pool.py
+# Reusable SQLite connection pool used by app.get_db()
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# Pragmas applied to every new pooled connection.
+# WAL lets readers keep going while a writer commits, and NORMAL sync is safe in WAL mode
+# (only the last transactions can be lost on power failure, never corrupted).
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,      # Negative means KiB -> ~16 MB page cache per connection
+    'mmap_size': 134217728,    # 128 MB of memory-mapped reads
+    'busy_timeout': 5000,      # ms to wait on a lock instead of failing with 'database is locked'
+    'temp_store': 'MEMORY',
+}
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Raised when no pooled connection became free within the pool timeout."""
+
+
+class ConnectionPool:
+    """A bounded pool of SQLite connections that are reused across requests.
+
+    Connections are created lazily up to ``max_size`` and handed out to one
+    request (thread) at a time, so they are opened with ``check_same_thread=False``.
+    Each connection keeps its own prepared-statement cache (``cached_statements``),
+    which now survives between requests instead of being thrown away on close.
+    ``factory`` is the connection class (e.g. instrumentation.TimedConnection).
+    """
+
+    def __init__(self, database, max_size=8, timeout=10.0, pragmas=None, cached_statements=256,
+                 factory=sqlite3.Connection):
+        self.database = database
+        self.factory = factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.cached_statements = cached_statements
+        self._lock = threading.Lock()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()  # LIFO keeps the hottest connections (warm caches) in use
+        self._size = 0
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'acquired': 0,
+            'reused': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'rollbacks': 0,
+            'discarded': 0,
+        }
+        self._in_use = 0
+        self._wait_time = 0.0
+
+    def _check_pid(self):
+        """Drops connections inherited from a parent process (e.g. a pre-forking server)."""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset_state()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=self.factory,
+            timeout=self.pragmas.get('busy_timeout', 5000) / 1000.0,
+        )
+        # Return rows that behave like dicts (access columns by name)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def acquire(self):
+        """Checks a connection out of the pool, creating one if the pool is not full yet."""
+        self._check_pid()
+        try:
+            conn = self._idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._size < self.max_size:
+                    self._size += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._size -= 1
+                    raise
+                reused = False
+                with self._lock:
+                    self._stats['created'] += 1
+            else:
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available after {self.timeout}s (pool size {self.max_size})"
+                    ) from None
+                reused = True
+                with self._lock:
+                    self._stats['waits'] += 1
+                    self._wait_time += time.perf_counter() - started
+
+        with self._lock:
+            self._stats['acquired'] += 1
+            if reused:
+                self._stats['reused'] += 1
+            self._in_use += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        """Returns a connection to the pool, rolling back anything left uncommitted."""
+        if self._pid != os.getpid():
+            return  # Belongs to the parent process's pool; nothing to return it to
+        with self._lock:
+            self._in_use -= 1
+        if not discard and conn.in_transaction:
+            try:
+                conn.rollback()
+                with self._lock:
+                    self._stats['rollbacks'] += 1
+            except sqlite3.Error:
+                discard = True
+        if discard:
+            self._close(conn)
+            with self._lock:
+                self._stats['discarded'] += 1
+            return
+        self._idle.put(conn)
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._size -= 1
+            self._stats['closed'] += 1
+
+    def close_all(self):
+        """Closes every idle connection (connections in use are closed when released with discard=True)."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+
+    def stats(self):
+        """Returns pool usage counters as a plain dict."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'total_wait_seconds': round(self._wait_time, 6),
+            })
+        return stats
+
+    def health(self):
+        """Runs a trivial query on a pooled connection and reports pool status."""
+        try:
+            conn = self.acquire()
+        except sqlite3.Error as e:
+            return {'status': 'error', 'error': str(e), 'stats': self.stats()}
+        try:
+            conn.execute("SELECT 1").fetchone()
+            journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            status = {'status': 'ok', 'journal_mode': journal_mode}
+        except sqlite3.Error as e:
+            status = {'status': 'error', 'error': str(e)}
+        finally:
+            self.release(conn)
+        status['stats'] = self.stats()
+        return status
@@ -1,43 +1,31 @@
 # init_db.py
-import sqlite3
+import argparse
 import os
 
+import migrate
+
 DATABASE = 'coach_agent.db' # Name of your database file
-SCHEMA = 'schema.sql'
 
-def init_db():
-    print(f"Looking for database '{DATABASE}' and schema '{SCHEMA}'...")
-    db_exists = os.path.exists(DATABASE)
+def init_db(reset=False):
+    """Creates the database or applies any pending migrations; never drops data unless reset=True."""
+    print(f"Looking for database '{DATABASE}'...")
+    if reset and os.path.exists(DATABASE):
+        print(f"--reset given: deleting '{DATABASE}' and starting from an empty database.")
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(DATABASE + suffix):
+                os.remove(DATABASE + suffix)
 
     try:
-        # Connect to the database (creates the file if it doesn't exist)
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        print(f"Connected to '{DATABASE}'.")
-
-        # Read the schema file
-        print(f"Reading schema from '{SCHEMA}'...")
-        with open(SCHEMA, 'r') as f:
-            sql_script = f.read()
-
-        # Execute the SQL script (can contain multiple statements)
-        print("Executing schema script...")
-        cursor.executescript(sql_script)
-
-        print("Database schema applied successfully.")
-
-        # Commit changes and close connection
-        conn.commit()
-        conn.close()
-        print("Database connection closed.")
-
-    except sqlite3.Error as e:
-        print(f"An SQLite error occurred: {e}")
-    except FileNotFoundError:
-        print(f"Error: {SCHEMA} not found in the current directory.")
-        print("Please ensure schema.sql is in the same folder as this script.")
+        report = migrate.migrate(DATABASE)
+        if report:
+            print(f"Database schema applied successfully ({len(report)} steps, "
+                  f"{sum(r['seconds'] for r in report):.2f}s).")
+    except migrate.MigrationError as e:
+        print(f"An error occurred while migrating: {e}")
     except Exception as e:
          print(f"An unexpected error occurred: {e}")
 
 if __name__ == '__main__':
-    init_db()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Create or upgrade the database.')
+    parser.add_argument('--reset', action='store_true', help='delete the existing database first (destroys all data)')
+    init_db(reset=parser.parse_args().reset)
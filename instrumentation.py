@@ -0,0 +1,304 @@
+# instrumentation.py
+# Logging, Prometheus metrics and sampled request profiling
+#
+# Logging: everything logs to the 'coach_agent' logger (modules use children of it) with
+# %-style arguments, so a message below LOG_LEVEL is dropped before it is formatted.
+# configure_logging() writes one line per record, as text or JSON (LOG_FORMAT=json), with
+# any ``extra={...}`` fields appended.
+#
+# Metrics: a small in-process registry (counters and histograms with labels, plus
+# collectors that turn the existing stats() dicts into gauges), rendered in the Prometheus
+# text format by /metrics. Metrics are per process: scrape every worker, or run one.
+#
+#   http_request_duration_seconds{endpoint,method,status}   route latency (streamed bodies: until the first byte)
+#   db_statement_duration_seconds{statement}                SQL execute() time per statement shape, e.g. "SELECT tasks"
+#   llm_request_duration_seconds{backend,outcome}           LLM calls, plus llm_*_tokens_total (estimated)
+#
+# Profiling: with PROFILE_SAMPLE_RATE > 0 that share of requests runs under cProfile and
+# leaves a .prof file in PROFILE_DIR (open with `python -m pstats FILE` or snakeviz).
+
+import bisect
+import cProfile
+import datetime
+import functools
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+from flask import g, request
+
+log = logging.getLogger('coach_agent')
+
+# Seconds; wide enough for both SQL statements and LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Attributes every LogRecord has; anything else on a record came from ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class StructuredFormatter(logging.Formatter):
+    """One line per record: ``time LEVEL logger: message key=value ...`` or a JSON object."""
+
+    def __init__(self, json_lines=False):
+        super().__init__()
+        self.json_lines = json_lines
+
+    def format(self, record):
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+        timestamp = datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds')
+        if self.json_lines:
+            entry = {'time': timestamp, 'level': record.levelname, 'logger': record.name,
+                     'message': record.getMessage(), **fields}
+            if record.exc_info:
+                entry['exception'] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+        line = f"{timestamp} {record.levelname} {record.name}: {record.getMessage()}"
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value!r}" for key, value in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging(level='INFO', fmt='text'):
+    """Sends the app's log records to stderr at ``level`` and above (idempotent)."""
+    log.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    if not any(getattr(handler, '_coach_agent', False) for handler in log.handlers):
+        handler = logging.StreamHandler()
+        handler._coach_agent = True
+        log.addHandler(handler)
+        log.propagate = False
+    for handler in log.handlers:
+        if getattr(handler, '_coach_agent', False):
+            handler.setFormatter(StructuredFormatter(json_lines=fmt == 'json'))
+
+
+# --- Metrics ---
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels_text(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f"{self.name}{_labels_text(self.labels, key)} {value}" for key, value in values]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)  # First bucket with value <= bound, or +Inf
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels_text(self.labels, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labels, key)} {round(values[-1], 6)}")
+            lines.append(f"{self.name}_count{_labels_text(self.labels, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Counters and histograms, plus stats collectors read at scrape time."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_stats(self, prefix, stats, help_text, label=None):
+        """Exposes the numeric values of ``stats()`` as gauges named ``prefix_<key>``.
+
+        ``stats`` returns a dict, or with ``label`` a {label value: dict} mapping (one series
+        per shard, per cache, ...). Called on every scrape, so it must be cheap.
+        """
+        self._collectors.append((prefix, stats, help_text, label))
+
+    def _render_stats(self, prefix, stats, help_text, label):
+        try:
+            result = stats()
+        except Exception as e:  # A broken collector must not take /metrics down with it
+            log.warning("Metrics collector %s failed: %s", prefix, e)
+            return []
+        groups = result.items() if label else [(None, result)]
+        series = {}
+        for label_value, values in groups:
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', key)}"
+                labels = _labels_text((label,), (label_value,)) if label else ''
+                series.setdefault(name, []).append(f"{name}{labels} {value}")
+        lines = []
+        for name, samples in sorted(series.items()):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"] + samples
+        return lines
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for collector in self._collectors:
+            lines += self._render_stats(*collector)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+http_duration = metrics.histogram('http_request_duration_seconds', 'Request latency by route.',
+                                  ('endpoint', 'method', 'status'))
+sql_duration = metrics.histogram('db_statement_duration_seconds', 'SQL statement execute() time by statement shape.',
+                                 ('statement',))
+llm_duration = metrics.histogram('llm_request_duration_seconds', 'LLM call duration.', ('backend', 'outcome'))
+llm_prompt_tokens = metrics.counter('llm_prompt_tokens_total', 'Estimated prompt tokens sent to the LLM.', ('backend',))
+llm_response_tokens = metrics.counter('llm_response_tokens_total', 'Estimated tokens received from the LLM.',
+                                      ('backend',))
+
+
+def record_llm_call(backend, seconds, outcome='ok', prompt_tokens=0, response_tokens=0):
+    """Records one LLM call: its duration by outcome and its (estimated) token counts."""
+    llm_duration.observe(seconds, backend=backend, outcome=outcome)
+    if prompt_tokens:
+        llm_prompt_tokens.inc(prompt_tokens, backend=backend)
+    if response_tokens:
+        llm_response_tokens.inc(response_tokens, backend=backend)
+
+
+# --- SQL statement timing ---
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN|TABLE)\s+([A-Za-z_]\w*)', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=2048)
+def statement_label(sql):
+    """Low-cardinality label of a statement: its verb and first table, e.g. 'UPDATE tasks'."""
+    words = sql.split(None, 1)
+    if not words:
+        return ''
+    verb = words[0].upper()
+    table = _TABLE.search(sql)
+    return f"{verb} {table.group(1)}" if table else verb
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            sql_duration.observe(time.perf_counter() - started, statement=statement_label(sql))
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            sql_duration.observe(time.perf_counter() - started, statement=statement_label(sql))
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection factory (``sqlite3.connect(..., factory=TimedConnection)``) that times every statement.
+
+    Only execute() is timed, which covers the first step of a query; rows fetched later
+    are not included.
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# --- Per-request timing and profiling ---
+def instrument_app(app, profile_rate=0.0, profile_dir='profiles'):
+    """Times every request into http_request_duration_seconds and profiles a sample of them."""
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = time.perf_counter()
+        if profile_rate and random.random() < profile_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:  # Another profiler is active (on Python 3.12+ profiling is process-wide)
+                return
+            g.profiler = profiler
+
+    @app.after_request
+    def _record_status(response):
+        g.response_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _record_request(exc=None):
+        started = g.pop('request_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        http_duration.observe(elapsed, endpoint=request.endpoint or 'unmatched', method=request.method,
+                              status=g.pop('response_status', 500))
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            path = os.path.join(profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unmatched'}"
+                                             f"-{elapsed * 1000:.0f}ms-{os.getpid()}.prof")
+            profiler.dump_stats(path)
+            log.info("Profiled %s %s (%.1f ms) to %s", request.method, request.path, elapsed * 1000, path)
@@ -0,0 +1,234 @@
+# jobs.py
+# Background job queue for slow work (AI generation) so request threads return immediately
+#
+# Jobs run on a fixed pool of worker threads fed by a bounded queue: the pool size is the
+# concurrency limit (e.g. on simultaneous Gemini calls) and a full queue rejects new work
+# instead of piling it up. Failed jobs are retried with exponential backoff and jitter.
+
+import itertools
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+
+log = logging.getLogger('coach_agent.jobs')
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+
+class QueueFullError(RuntimeError):
+    """Raised by submit() when the queue already holds ``max_queue`` jobs."""
+
+
+class PermanentJobError(Exception):
+    """Raised by a job function for failures that retrying cannot fix (e.g. a missing goal)."""
+
+
+class Job:
+    """One unit of work and its lifecycle. Read state through to_dict() or JobQueue.wait()."""
+
+    def __init__(self, kind, fn, owner=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner  # e.g. the user_id, checked by the routes
+        self.fn = fn
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        self.version = 0  # Bumped on every state change, so subscribers can tell what they've seen
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'attempts': self.attempts,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobQueue:
+    """Bounded queue of jobs executed by ``workers`` threads, with retries and usage metrics.
+
+    Workers start on the first submit (and again after a fork, like the connection pool).
+    Finished jobs stay queryable for ``retention`` seconds.
+    """
+
+    def __init__(self, workers=4, max_queue=100, max_attempts=3, backoff=0.5, max_backoff=8.0,
+                 retention=600.0):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retention = retention
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}  # job_id -> Job
+        self._changed = threading.Condition()  # Notified on every job state change
+        self._threads = []
+        self._pid = None
+        self._counters = {
+            'submitted': 0,
+            'rejected': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'retries': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'run_seconds_total': 0.0,
+            'run_seconds_max': 0.0,
+        }
+        self._running = 0
+
+    def _ensure_workers(self):
+        if self._pid == os.getpid() and self._threads:
+            return
+        with self._changed:
+            if self._pid == os.getpid() and self._threads:
+                return
+            self._pid = os.getpid()
+            self._threads = []
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{n}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind, fn, owner=None):
+        """Queues ``fn()`` and returns its Job right away. Raises QueueFullError when saturated."""
+        self._ensure_workers()
+        job = Job(kind, fn, owner)
+        with self._changed:
+            self._prune()
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self._counters['rejected'] += 1
+                raise QueueFullError(f"Job queue is full ({self._queue.maxsize} jobs waiting)") from None
+            self._jobs[job.id] = job
+            self._counters['submitted'] += 1
+        return job
+
+    def get(self, job_id, owner=None):
+        """Returns a snapshot dict of the job, or None if it is unknown, expired or not ``owner``'s."""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None or (owner is not None and job.owner != owner):
+                return None
+            return self._snapshot(job)
+
+    def wait(self, job_id, seen_version=-1, timeout=None):
+        """Blocks until the job changes past ``seen_version`` (or finishes, or ``timeout`` passes).
+
+        Returns the latest snapshot (with its 'version'), or None for unknown jobs.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return None
+                if job.version > seen_version or job.status in FINISHED_STATES:
+                    return self._snapshot(job)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return self._snapshot(job)
+                self._changed.wait(remaining)
+
+    def stats(self):
+        """Queue depth, job counts and wait/run time counters as a plain dict."""
+        with self._changed:
+            stats = dict(self._counters)
+            stats['queue_depth'] = self._queue.qsize()
+            stats['running'] = self._running
+            stats['workers'] = self.workers
+            stats['max_queue'] = self._queue.maxsize
+            stats['tracked_jobs'] = len(self._jobs)
+            finished = stats['succeeded'] + stats['failed']
+            started = finished + self._running
+        stats['wait_seconds_avg'] = round(stats['wait_seconds_total'] / started, 4) if started else 0.0
+        stats['run_seconds_avg'] = round(stats['run_seconds_total'] / finished, 4) if finished else 0.0
+        return stats
+
+    @staticmethod
+    def _snapshot(job):
+        snapshot = job.to_dict()
+        snapshot['version'] = job.version
+        return snapshot
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _update(self, job, **changes):
+        with self._changed:
+            for name, value in changes.items():
+                setattr(job, name, value)
+            job.version += 1
+            self._changed.notify_all()
+
+    def _delay(self, attempt):
+        """Exponential backoff with jitter before retry number ``attempt``."""
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            started = time.time()
+            wait = started - job.created_at
+            with self._changed:
+                self._running += 1
+                self._counters['wait_seconds_total'] += wait
+                self._counters['wait_seconds_max'] = max(self._counters['wait_seconds_max'], wait)
+            self._update(job, status=RUNNING, started_at=started)
+            try:
+                self._run(job)
+            finally:
+                run = time.time() - started
+                with self._changed:
+                    self._running -= 1
+                    self._counters['run_seconds_total'] += run
+                    self._counters['run_seconds_max'] = max(self._counters['run_seconds_max'], run)
+                self._queue.task_done()
+
+    def _run(self, job):
+        for attempt in itertools.count(1):
+            self._update(job, attempts=attempt)
+            try:
+                result = job.fn()
+            except PermanentJobError as e:
+                self._finish(job, FAILED, error=str(e))
+                return
+            except Exception as e:
+                if attempt >= self.max_attempts:
+                    log.error("Job %s (%s) failed after %d attempts: %s", job.id, job.kind, attempt, e)
+                    self._finish(job, FAILED, error=str(e))
+                    return
+                delay = self._delay(attempt)
+                log.warning("Job %s (%s) attempt %d failed: %s; retrying in %.1fs", job.id, job.kind, attempt, e, delay)
+                with self._changed:
+                    self._counters['retries'] += 1
+                # The retry keeps its worker, so a failing backend never sees more than `workers` calls
+                time.sleep(delay)
+            else:
+                self._finish(job, SUCCEEDED, result=result)
+                return
+
+    def _finish(self, job, status, result=None, error=None):
+        with self._changed:
+            self._counters[status] += 1
+        self._update(job, status=status, result=result, error=error, finished_at=time.time())
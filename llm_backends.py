@@ -0,0 +1,324 @@
+# llm_backends.py
+# Interchangeable text-generation backends behind one interface (sync, async and streaming)
+#
+#   gemini    Google Gemini; the client is configured and built once, then reused
+#   template  Deterministic offline generator (no network); the default without an API key
+#   fake      Template replies after a simulated, configurable latency with injected errors,
+#             for load tests and benchmarks of the AI paths
+#
+# create_backend() picks one from configuration (LLM_BACKEND and friends, see README).
+# asyncio is imported by the async methods themselves (it is loaded anyway once an event
+# loop runs them), so sync-only processes do not pay for it.
+
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import prompts
+
+
+class LLMError(Exception):
+    """Base class for backend failures."""
+
+
+class LLMBlockedError(LLMError):
+    """The provider refused to answer the prompt (e.g. a safety block)."""
+
+    def __init__(self, reason):
+        super().__init__(f"Response blocked: {reason}")
+        self.reason = reason
+
+
+class LLMEmptyResponseError(LLMError):
+    """The provider answered without any text."""
+
+
+class LLMTransientError(LLMError):
+    """A retryable failure such as a timeout or an overloaded provider."""
+
+
+class LLMBackend:
+    """Interface shared by every backend.
+
+    Subclasses implement generate() and usually stream(); the async variants default to
+    running the sync ones on a worker thread. ``json_schema`` asks for JSON output matching
+    the schema (enforced by providers that support it; the prompt must ask for it as well).
+    ``model_name`` is part of the AI cache key, and ``cacheable`` says whether responses
+    are worth caching at all.
+    """
+
+    name = 'base'
+    model_name = 'base'
+    cacheable = True
+
+    def generate(self, prompt, json_schema=None):
+        """Returns the full response text for ``prompt``."""
+        raise NotImplementedError
+
+    def stream(self, prompt, json_schema=None):
+        """Yields the response text in chunks as it is produced."""
+        yield self.generate(prompt, json_schema)
+
+    async def agenerate(self, prompt, json_schema=None):
+        import asyncio
+        return await asyncio.to_thread(self.generate, prompt, json_schema)
+
+    async def astream(self, prompt, json_schema=None):
+        import asyncio
+        chunks = self.stream(prompt, json_schema)
+        done = object()
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, done)
+            if chunk is done:
+                return
+            yield chunk
+
+
+def _response_text(response):
+    """Text of a Gemini response (or streamed chunk); raises for blocked or empty responses."""
+    parts = getattr(response, 'parts', None)
+    if parts:
+        return ''.join(part.text for part in parts if hasattr(part, 'text'))
+    feedback = getattr(response, 'prompt_feedback', None)
+    if feedback and getattr(feedback, 'block_reason', None):
+        raise LLMBlockedError(feedback.block_reason)
+    return ''
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini. ``model`` may be any object with a Gemini-style generate_content() (tests)."""
+
+    name = 'gemini'
+
+    def __init__(self, model_name, safety_settings=None, api_key=None, model=None):
+        self.model_name = getattr(model, 'model_name', model_name)
+        self.safety_settings = safety_settings
+        self.api_key = api_key
+        self._model = model
+        self._lock = threading.Lock()
+
+    def _client(self):
+        # Built once on first use and shared by every request thread
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai  # Only paid for when Gemini is actually used
+                    if self.api_key:
+                        genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def _options(self, json_schema):
+        options = {'safety_settings': self.safety_settings}
+        if json_schema is not None:
+            options['generation_config'] = {'response_mime_type': 'application/json', 'response_schema': json_schema}
+        return options
+
+    def generate(self, prompt, json_schema=None):
+        response = self._client().generate_content(prompt, **self._options(json_schema))
+        text = _response_text(response).strip()
+        if not text:
+            raise LLMEmptyResponseError(f"Empty response: {response}")
+        return text
+
+    def stream(self, prompt, json_schema=None):
+        for chunk in self._client().generate_content(prompt, stream=True, **self._options(json_schema)):
+            text = _response_text(chunk)
+            if text:
+                yield text
+
+    async def agenerate(self, prompt, json_schema=None):
+        client = self._client()
+        if not hasattr(client, 'generate_content_async'):
+            return await super().agenerate(prompt, json_schema)
+        response = await client.generate_content_async(prompt, **self._options(json_schema))
+        text = _response_text(response).strip()
+        if not text:
+            raise LLMEmptyResponseError(f"Empty response: {response}")
+        return text
+
+
+# --- Deterministic offline generation ---
+TASK_TEMPLATES = (
+    "Spend 20 focused minutes on {goal}",
+    "Write down one obstacle to {goal} and a plan to get past it",
+    "Do the smallest possible step towards {goal} before noon",
+    "Review what worked this week for {goal} and repeat it",
+    "Spend 30 minutes practising for {goal} without distractions",
+    "Prepare everything you need for tomorrow's work on {goal}",
+    "Tell someone about your progress on {goal}",
+)
+MESSAGE_TEMPLATES = (
+    "You're building momentum on {goal}. One focused step today keeps it going.",
+    "Every day you show up for {goal} makes the next one easier. Make today count.",
+    "You already know why {goal} matters to you. Take one concrete step towards it today.",
+)
+
+
+def _pick(options, *seed_parts):
+    digest = hashlib.sha256('|'.join(map(str, seed_parts)).encode('utf-8')).digest()
+    return options[digest[0] % len(options)]
+
+
+def _goal_phrase(goal):
+    return goal.strip().rstrip('.').replace('\n', ' ') or 'your goal'
+
+
+def template_task(goal, due_date):
+    """A deterministic, goal-specific task for ``due_date``."""
+    template = _pick(TASK_TEMPLATES, goal, due_date)
+    return template.format(goal=_goal_phrase(goal))
+
+
+def template_tasks(goal, dates):
+    """One template task per date, as dicts ready for insert_tasks (without goal_id)."""
+    return [{'description': template_task(goal, str(due_date)), 'due_date': str(due_date)} for due_date in dates]
+
+
+_PROMPT_GOAL = re.compile(r'^\s*Goal:\s*"?(.+?)"?\s*$', re.MULTILINE)
+_PROMPT_DATES = re.compile(r'^\s*(\d{4}-\d{2}-\d{2})\s*$', re.MULTILINE)
+_PROMPT_GOAL_IDS = re.compile(r'^\s*\[goal_id=(\d+)\]\s*(.+?)\s*$', re.MULTILINE)
+
+
+class TemplateBackend(LLMBackend):
+    """Offline generator that answers the app's prompts from fixed templates.
+
+    It reads the "Goal:" line of the prompt. Prompts that list dates (one per line) get one
+    "YYYY-MM-DD: task" line per date, or a JSON plan when they also list "[goal_id=N] goal"
+    lines (the planner's format); today's-task prompts (by prompts.prompt_kind(), never by
+    the goal's own words) get today's task, and anything else gets a short motivational
+    message. Output depends only on the prompt.
+    """
+
+    name = 'template'
+    model_name = 'template'
+    cacheable = False  # Instant and deterministic: nothing to save
+
+    def generate(self, prompt, json_schema=None):
+        match = _PROMPT_GOAL.search(prompt)
+        goal = match.group(1) if match else 'your goal'
+        dates = _PROMPT_DATES.findall(prompt)
+        goals = _PROMPT_GOAL_IDS.findall(prompt)
+        if dates and goals:
+            plans = [{'goal_id': int(goal_id), 'tasks': [
+                {'due_date': due_date, 'description': template_task(description, due_date)} for due_date in dates]}
+                for goal_id, description in goals]
+            return json.dumps({'plans': plans}, indent=1)
+        if dates:
+            return '\n'.join(f"{due_date}: {template_task(goal, due_date)}" for due_date in dates)
+        if prompts.prompt_kind(prompt) == 'today_task':
+            return template_task(goal, datetime.date.today().isoformat())
+        return _pick(MESSAGE_TEMPLATES, goal).format(goal=_goal_phrase(goal))
+
+    def stream(self, prompt, json_schema=None):
+        for line in self.generate(prompt, json_schema).splitlines(keepends=True):
+            yield line
+
+
+class FakeBackend(LLMBackend):
+    """Template replies delivered with simulated provider latency and failures.
+
+    Latency is log-normal with the given median (seconds) and shape ``latency_sigma``;
+    streams deliver the first chunk after ``first_chunk`` of that latency and spread the rest
+    evenly. ``error_rate`` raises LLMTransientError and ``block_rate`` LLMBlockedError, with
+    the failure drawn before any delay is spent. ``seed`` makes a run reproducible.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency=0.8, latency_sigma=0.5, first_chunk=0.25, chunk_size=24,
+                 error_rate=0.0, block_rate=0.0, seed=None, reply=None):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.first_chunk = first_chunk
+        self.chunk_size = chunk_size
+        self.error_rate = error_rate
+        self.block_rate = block_rate
+        self.reply = reply  # Fixed reply text, or None for template replies
+        self.model_name = f'fake-{latency}s'
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._template = TemplateBackend()
+
+    def _draw(self):
+        """Samples (latency, outcome) for one call."""
+        with self._lock:
+            delay = self.latency * self._random.lognormvariate(0, self.latency_sigma) if self.latency else 0.0
+            roll = self._random.random()
+        if roll < self.error_rate:
+            return delay, 'error'
+        if roll < self.error_rate + self.block_rate:
+            return delay, 'blocked'
+        return delay, 'ok'
+
+    def _reply(self, prompt, json_schema, outcome):
+        if outcome == 'error':
+            raise LLMTransientError("Simulated provider error (503)")
+        if outcome == 'blocked':
+            raise LLMBlockedError('SIMULATED')
+        return self.reply if self.reply is not None else self._template.generate(prompt, json_schema)
+
+    def _chunks(self, text):
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or ['']
+
+    def generate(self, prompt, json_schema=None):
+        delay, outcome = self._draw()
+        time.sleep(delay)
+        return self._reply(prompt, json_schema, outcome)
+
+    def stream(self, prompt, json_schema=None):
+        delay, outcome = self._draw()
+        time.sleep(delay * self.first_chunk)
+        chunks = self._chunks(self._reply(prompt, json_schema, outcome))
+        step = delay * (1 - self.first_chunk) / max(len(chunks) - 1, 1)
+        for n, chunk in enumerate(chunks):
+            if n:
+                time.sleep(step)
+            yield chunk
+
+    async def agenerate(self, prompt, json_schema=None):
+        import asyncio
+        delay, outcome = self._draw()
+        await asyncio.sleep(delay)
+        return self._reply(prompt, json_schema, outcome)
+
+    async def astream(self, prompt, json_schema=None):
+        import asyncio
+        delay, outcome = self._draw()
+        await asyncio.sleep(delay * self.first_chunk)
+        chunks = self._chunks(self._reply(prompt, json_schema, outcome))
+        step = delay * (1 - self.first_chunk) / max(len(chunks) - 1, 1)
+        for n, chunk in enumerate(chunks):
+            if n:
+                await asyncio.sleep(step)
+            yield chunk
+
+
+BACKENDS = ('gemini', 'template', 'fake')
+
+
+def create_backend(name=None, model_name=None, safety_settings=None, api_key=None):
+    """Builds the configured backend. Without an explicit ``name``, uses LLM_BACKEND, else
+    Gemini when an API key is available and the template generator otherwise."""
+    name = (name or os.getenv('LLM_BACKEND') or ('gemini' if api_key else 'template')).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}' (expected one of {', '.join(BACKENDS)})")
+    if name == 'gemini':
+        if not api_key:
+            raise ValueError("The gemini backend needs GOOGLE_API_KEY")
+        return GeminiBackend(model_name, safety_settings=safety_settings, api_key=api_key)
+    if name == 'fake':
+        seed = os.getenv('LLM_FAKE_SEED')
+        return FakeBackend(
+            latency=float(os.getenv('LLM_FAKE_LATENCY', '0.8')),
+            latency_sigma=float(os.getenv('LLM_FAKE_LATENCY_SIGMA', '0.5')),
+            error_rate=float(os.getenv('LLM_FAKE_ERROR_RATE', '0')),
+            block_rate=float(os.getenv('LLM_FAKE_BLOCK_RATE', '0')),
+            seed=int(seed) if seed else None,
+        )
+    return TemplateBackend()
@@ -0,0 +1,339 @@
+# migrate.py
+# Versioned, non-destructive schema migrations tracked with PRAGMA user_version
+#
+#   python migrate.py                 # bring coach_agent.db up to date, with a timing report
+#   python migrate.py --dry-run       # list pending migrations and their steps, change nothing
+#   python migrate.py --check         # verify schema.sql matches the migrations (used after editing either)
+#
+# Migrations live in migrations/NNNN_name.sql and are applied in order. By default a
+# migration runs inside one transaction together with its user_version bump. Two
+# comment directives change that for work on large tables:
+#
+#   -- migrate:online
+#       (anywhere in the file header) Each statement commits on its own, so locks are
+#       only held for one statement at a time. Statements must be idempotent
+#       (IF NOT EXISTS / INSERT OR IGNORE ...), since a crash re-runs the migration.
+#
+#   -- migrate:batch table=tasks key=task_id size=5000
+#       (directly above a statement, online migrations only) Runs the statement once
+#       per key range, binding :lo and :hi, and commits after each batch.
+
+import argparse
+import collections
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+
+log = logging.getLogger('coach_agent.migrate')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA = os.path.join(BASE_DIR, 'schema.sql')
+MIGRATIONS_DIR = os.path.join(BASE_DIR, 'migrations')
+BASELINE_VERSION = 1  # Databases that pre-date migrations match 0001_initial.sql
+
+Step = collections.namedtuple('Step', 'sql batch')
+Migration = collections.namedtuple('Migration', 'version name path online steps')
+
+_FILENAME = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+
+class MigrationError(Exception):
+    """Raised for malformed migration files or a failed migration."""
+
+
+def _parse_directive(line):
+    """Parses '-- migrate:batch key=value ...' into a dict."""
+    options = {}
+    for token in line.split()[2:]:
+        key, _, value = token.partition('=')
+        options[key] = value
+    for required in ('table', 'key', 'size'):
+        if required not in options:
+            raise MigrationError(f"Batch directive is missing '{required}=': {line}")
+    options['size'] = int(options['size'])
+    return options
+
+
+def parse_steps(sql_text):
+    """Splits a migration script into statements, keeping any batch directive attached to each."""
+    steps = []
+    buffer = []
+    batch = None
+    for line in sql_text.splitlines(keepends=True):
+        stripped = line.strip()
+        if not buffer:
+            if stripped.startswith('-- migrate:batch'):
+                batch = _parse_directive(stripped)
+                continue
+            if not stripped or stripped.startswith('--'):
+                continue
+        buffer.append(line)
+        statement = ''.join(buffer)
+        if sqlite3.complete_statement(statement):
+            steps.append(Step(statement.strip(), batch))
+            buffer = []
+            batch = None
+    if ''.join(buffer).strip():
+        raise MigrationError(f"Incomplete SQL statement at end of script: {''.join(buffer)[:80]!r}")
+    return steps
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """Returns every migration in ``directory`` ordered by version."""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME.match(filename)
+        if not match:
+            continue
+        path = os.path.join(directory, filename)
+        with open(path, 'r') as f:
+            text = f.read()
+        online = any(line.strip() == '-- migrate:online' for line in text.splitlines())
+        steps = parse_steps(text)
+        if not online and any(step.batch for step in steps):
+            raise MigrationError(f"{filename}: batch steps are only allowed in '-- migrate:online' migrations")
+        migrations.append(Migration(int(match.group(1)), match.group(2), path, online, steps))
+
+    versions = [m.version for m in migrations]
+    if versions != list(range(1, len(versions) + 1)):
+        raise MigrationError(f"Migration versions must be 1..N without gaps, found {versions}")
+    return migrations
+
+
+def latest_version(directory=MIGRATIONS_DIR):
+    """Highest migration version available, from the file names alone."""
+    versions = [int(m.group(1)) for m in map(_FILENAME.match, os.listdir(directory)) if m]
+    return max(versions, default=0)
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _connect(path):
+    # Autocommit mode: transactions are opened and closed explicitly below
+    conn = sqlite3.connect(path, isolation_level=None, timeout=30.0)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    return conn
+
+
+def _timed(report, version, label, fn):
+    started = time.perf_counter()
+    rows = fn()
+    report.append({'version': version, 'step': label, 'rows': rows,
+                   'seconds': round(time.perf_counter() - started, 4)})
+
+
+def _label(step):
+    first_line = step.sql.splitlines()[0]
+    return first_line if len(first_line) <= 90 else first_line[:87] + '...'
+
+
+def _run_batched(conn, step):
+    """Runs a batch step over key ranges, one short transaction per range."""
+    table, key, size = step.batch['table'], step.batch['key'], step.batch['size']
+    low, high = conn.execute(f"SELECT MIN({key}), MAX({key}) FROM {table}").fetchone()
+    if low is None:
+        return 0
+    rows = 0
+    start = low
+    while start <= high:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows += conn.execute(step.sql, {'lo': start, 'hi': start + size - 1}).rowcount
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        start += size
+    return rows
+
+
+def _apply(conn, migration, report):
+    if not migration.online:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(conn) >= migration.version:
+                conn.execute("ROLLBACK")  # Another process applied it while we waited for the lock
+                return
+            for step in migration.steps:
+                _timed(report, migration.version, _label(step), lambda: conn.execute(step.sql).rowcount)
+            conn.execute(f"PRAGMA user_version = {migration.version}")
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        return
+
+    for step in migration.steps:
+        if step.batch:
+            _timed(report, migration.version, f"[batched by {step.batch['size']}] {_label(step)}",
+                   lambda: _run_batched(conn, step))
+        else:
+            def run_one():
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    rows = conn.execute(step.sql).rowcount
+                    conn.execute("COMMIT")
+                except sqlite3.Error:
+                    conn.execute("ROLLBACK")
+                    raise
+                return rows
+            _timed(report, migration.version, _label(step), run_one)
+    conn.execute(f"PRAGMA user_version = {max(migration.version, current_version(conn))}")
+
+
+def _create_fresh(conn, version, report):
+    """Creates an empty database straight from schema.sql and stamps it with ``version``."""
+    with open(SCHEMA, 'r') as f:
+        steps = parse_steps(f.read())
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for step in steps:
+            _timed(report, version, _label(step), lambda: conn.execute(step.sql).rowcount)
+        conn.execute(f"PRAGMA user_version = {version}")
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _starting_version(conn):
+    """user_version, or the baseline for databases created before migrations existed."""
+    version = current_version(conn)
+    if version == 0:
+        # Only ever probed once per database: afterwards user_version is non-zero
+        legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'").fetchone()
+        if legacy:
+            return BASELINE_VERSION, True
+    return version, False
+
+
+def migrate(path, dry_run=False, verbose=True):
+    """Brings the database at ``path`` up to the latest version and returns the timing report."""
+    migrations = load_migrations()
+    target = migrations[-1].version if migrations else 0
+    report = []
+    conn = _connect(path)
+    try:
+        version, legacy = _starting_version(conn)
+        if version > target:
+            raise MigrationError(f"Database is at version {version}, newer than the latest migration {target}")
+
+        if version == 0:
+            if verbose:
+                print(f"{'[dry run] ' if dry_run else ''}Creating fresh database '{path}' from schema.sql (version {target}).")
+            if not dry_run:
+                _create_fresh(conn, target, report)
+            return report
+
+        if legacy and not dry_run:
+            conn.execute(f"PRAGMA user_version = {BASELINE_VERSION}")
+        pending = [m for m in migrations if m.version > version]
+        if verbose:
+            if not pending:
+                print(f"Database '{path}' is up to date (version {version}).")
+            for m in pending:
+                mode = 'online' if m.online else 'transactional'
+                print(f"{'[dry run] ' if dry_run else ''}Migration {m.version:04d}_{m.name} ({mode}, {len(m.steps)} steps)")
+                if dry_run:
+                    for step in m.steps:
+                        print(f"    {'[batched] ' if step.batch else ''}{_label(step)}")
+        if dry_run:
+            return report
+
+        for m in pending:
+            try:
+                _apply(conn, m, report)
+            except sqlite3.Error as e:
+                raise MigrationError(f"Migration {m.version:04d}_{m.name} failed: {e}") from e
+        return report
+    finally:
+        conn.close()
+
+
+def ensure_current(path):
+    """Cheap startup check: one user_version read, migrating only when the database is behind."""
+    conn = sqlite3.connect(path)
+    try:
+        version = current_version(conn)
+    finally:
+        conn.close()
+    if version == latest_version():
+        return []
+    log.info("Database '%s' is at version %d, migrating to %d...", path, version, latest_version())
+    report = migrate(path, verbose=False)
+    log.info("Database '%s' migrated (%d steps, %.2fs).", path, len(report), sum(r['seconds'] for r in report))
+    return report
+
+
+def _schema_shape(conn):
+    """Tables, columns, indexes and triggers of a database, in a comparable form."""
+    shape = {}
+    for kind, name, table in conn.execute(
+            "SELECT type, name, tbl_name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' ORDER BY name"):
+        if kind == 'table':
+            shape[('table', name)] = [tuple(row[1:]) for row in conn.execute(f"PRAGMA table_info({name})")]
+        elif kind == 'index':
+            columns = [row[2] for row in conn.execute(f"PRAGMA index_info({name})")]
+            shape[('index', name)] = (table, columns)
+        else:
+            shape[(kind, name)] = table
+    return shape
+
+
+def check_schema():
+    """Returns a list of differences between schema.sql and the result of running every migration."""
+    from_schema = _connect(':memory:')
+    with open(SCHEMA, 'r') as f:
+        for step in parse_steps(f.read()):
+            from_schema.execute(step.sql)
+    from_migrations = _connect(':memory:')
+    for m in load_migrations():
+        for step in m.steps:
+            if step.batch:
+                _run_batched(from_migrations, step)
+            else:
+                from_migrations.execute(step.sql)
+
+    expected, actual = _schema_shape(from_migrations), _schema_shape(from_schema)
+    problems = []
+    for key in sorted(set(expected) | set(actual)):
+        if expected.get(key) != actual.get(key):
+            problems.append(f"{key[0]} {key[1]}: migrations give {expected.get(key)}, schema.sql gives {actual.get(key)}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply pending schema migrations.')
+    parser.add_argument('--db', default='coach_agent.db', help='database file (default: coach_agent.db)')
+    parser.add_argument('--dry-run', action='store_true', help='show pending migrations without applying them')
+    parser.add_argument('--check', action='store_true', help='verify schema.sql matches the migrations')
+    args = parser.parse_args(argv)
+
+    if args.check:
+        problems = check_schema()
+        for problem in problems:
+            print(f"🔴 {problem}")
+        if not problems:
+            print(f"✅ schema.sql matches migrations 1..{latest_version()}.")
+        return 1 if problems else 0
+
+    try:
+        report = migrate(args.db, dry_run=args.dry_run)
+    except MigrationError as e:
+        print(f"🔴 {e}")
+        return 1
+    if report:
+        print(f"{'Version':>7}  {'Seconds':>8}  {'Rows':>8}  Step")
+        for row in report:
+            print(f"{row['version']:>7}  {row['seconds']:>8.3f}  {row['rows']:>8}  {row['step']}")
+        print(f"Total: {sum(r['seconds'] for r in report):.3f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
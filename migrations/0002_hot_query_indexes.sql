@@ -0,0 +1,11 @@
+-- 0002_hot_query_indexes.sql
+-- Secondary indexes for the dashboard, goal detail and weekly progress queries.
+-- Online: each index is built in its own short transaction (readers are never
+-- blocked in WAL mode; writers only wait for the index currently being built).
+-- migrate:online
+
+CREATE INDEX IF NOT EXISTS idx_goals_user_status_created ON goals (user_id, status, creation_date);
+
+CREATE INDEX IF NOT EXISTS idx_goals_user_created ON goals (user_id, creation_date);
+
+CREATE INDEX IF NOT EXISTS idx_tasks_goal_due_status ON tasks (goal_id, due_date, status, creation_date);
@@ -0,0 +1,98 @@
+-- 0003_goal_progress_rollups.sql
+-- Per-goal, per-day task counts by status (with the Monday of each day's ISO week) and a
+-- per-goal histogram of completion hours. Triggers on tasks keep both current in the same
+-- transaction as every task insert, status change and delete.
+-- Online: triggers go in first, then the backfill overwrites each goal range with exact
+-- counts from tasks, so writes that land during the backfill are never lost.
+-- migrate:online
+
+CREATE TABLE IF NOT EXISTS goal_progress_daily (
+    goal_id INTEGER NOT NULL,
+    day TEXT NOT NULL, -- tasks.due_date (YYYY-MM-DD)
+    week_start TEXT NOT NULL, -- Monday of the ISO week containing day
+    planned INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    missed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (goal_id, day)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_goal_progress_week ON goal_progress_daily (goal_id, week_start);
+
+CREATE TABLE IF NOT EXISTS goal_completion_hours (
+    goal_id INTEGER NOT NULL,
+    hour INTEGER NOT NULL, -- 0-23, hour of tasks.completion_date
+    completed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (goal_id, hour)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_progress_insert AFTER INSERT ON tasks
+BEGIN
+    INSERT INTO goal_progress_daily (goal_id, day, week_start, planned, completed, missed)
+    VALUES (NEW.goal_id, NEW.due_date, COALESCE(date(NEW.due_date, 'weekday 0', '-6 days'), ''),
+            NEW.status = 'Planned', NEW.status = 'Completed', NEW.status = 'Missed')
+    ON CONFLICT (goal_id, day) DO UPDATE SET
+        planned = planned + excluded.planned,
+        completed = completed + excluded.completed,
+        missed = missed + excluded.missed;
+    INSERT INTO goal_completion_hours (goal_id, hour, completed)
+    SELECT NEW.goal_id, CAST(strftime('%H', NEW.completion_date) AS INTEGER), 1
+    WHERE NEW.status = 'Completed' AND strftime('%H', NEW.completion_date) IS NOT NULL
+    ON CONFLICT (goal_id, hour) DO UPDATE SET completed = completed + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_progress_update
+AFTER UPDATE OF goal_id, due_date, status, completion_date ON tasks
+BEGIN
+    UPDATE goal_progress_daily SET
+        planned = planned - (OLD.status = 'Planned'),
+        completed = completed - (OLD.status = 'Completed'),
+        missed = missed - (OLD.status = 'Missed')
+    WHERE goal_id = OLD.goal_id AND day = OLD.due_date;
+    INSERT INTO goal_progress_daily (goal_id, day, week_start, planned, completed, missed)
+    VALUES (NEW.goal_id, NEW.due_date, COALESCE(date(NEW.due_date, 'weekday 0', '-6 days'), ''),
+            NEW.status = 'Planned', NEW.status = 'Completed', NEW.status = 'Missed')
+    ON CONFLICT (goal_id, day) DO UPDATE SET
+        planned = planned + excluded.planned,
+        completed = completed + excluded.completed,
+        missed = missed + excluded.missed;
+    UPDATE goal_completion_hours SET completed = completed - 1
+    WHERE OLD.status = 'Completed' AND goal_id = OLD.goal_id
+      AND hour = CAST(strftime('%H', OLD.completion_date) AS INTEGER);
+    INSERT INTO goal_completion_hours (goal_id, hour, completed)
+    SELECT NEW.goal_id, CAST(strftime('%H', NEW.completion_date) AS INTEGER), 1
+    WHERE NEW.status = 'Completed' AND strftime('%H', NEW.completion_date) IS NOT NULL
+    ON CONFLICT (goal_id, hour) DO UPDATE SET completed = completed + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_progress_delete AFTER DELETE ON tasks
+BEGIN
+    UPDATE goal_progress_daily SET
+        planned = planned - (OLD.status = 'Planned'),
+        completed = completed - (OLD.status = 'Completed'),
+        missed = missed - (OLD.status = 'Missed')
+    WHERE goal_id = OLD.goal_id AND day = OLD.due_date;
+    UPDATE goal_completion_hours SET completed = completed - 1
+    WHERE OLD.status = 'Completed' AND goal_id = OLD.goal_id
+      AND hour = CAST(strftime('%H', OLD.completion_date) AS INTEGER);
+END;
+
+-- migrate:batch table=goals key=goal_id size=500
+INSERT INTO goal_progress_daily (goal_id, day, week_start, planned, completed, missed)
+SELECT goal_id, due_date, COALESCE(date(due_date, 'weekday 0', '-6 days'), ''),
+       SUM(status = 'Planned'), SUM(status = 'Completed'), SUM(status = 'Missed')
+FROM tasks
+WHERE goal_id BETWEEN :lo AND :hi
+GROUP BY goal_id, due_date
+ON CONFLICT (goal_id, day) DO UPDATE SET
+    planned = excluded.planned,
+    completed = excluded.completed,
+    missed = excluded.missed;
+
+-- migrate:batch table=goals key=goal_id size=500
+INSERT INTO goal_completion_hours (goal_id, hour, completed)
+SELECT goal_id, CAST(strftime('%H', completion_date) AS INTEGER), COUNT(*)
+FROM tasks
+WHERE goal_id BETWEEN :lo AND :hi
+  AND status = 'Completed' AND strftime('%H', completion_date) IS NOT NULL
+GROUP BY goal_id, CAST(strftime('%H', completion_date) AS INTEGER)
+ON CONFLICT (goal_id, hour) DO UPDATE SET completed = excluded.completed;
@@ -0,0 +1,14 @@
+-- 0004_idempotency_keys.sql
+-- Remembers the task_ids created for each client-supplied idempotency key so that
+-- retried bulk inserts return the original result instead of inserting duplicates.
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id INTEGER NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    request_hash TEXT NOT NULL, -- SHA-256 of the normalized task list, to reject key reuse for a different request
+    task_ids TEXT NOT NULL, -- JSON array of the task_ids created by the original request
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, idempotency_key)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at);
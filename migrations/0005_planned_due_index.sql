@@ -0,0 +1,6 @@
+-- 0005_planned_due_index.sql
+-- Partial index over Planned tasks only, so the overdue sweep (Planned and due before today)
+-- reads just the open tasks instead of the whole history.
+-- migrate:online
+
+CREATE INDEX IF NOT EXISTS idx_tasks_planned_due ON tasks (due_date) WHERE status = 'Planned';
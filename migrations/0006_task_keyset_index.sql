@@ -0,0 +1,7 @@
+-- 0006_task_keyset_index.sql
+-- Goal detail pages tasks by the keyset (due_date, task_id). SQLite appends the rowid
+-- (task_id) to every index, so (goal_id, due_date) serves both the range seek and the
+-- ORDER BY without a temp b-tree.
+-- migrate:online
+
+CREATE INDEX IF NOT EXISTS idx_tasks_goal_due ON tasks (goal_id, due_date);
@@ -0,0 +1,33 @@
+-- 0007_precomputed_suggestions.sql
+-- Today's task suggestion and coaching message per goal, generated off-peak by
+-- precompute.py so the goal page and /generate_task_for_today can answer without an AI call.
+-- The triggers drop a goal's entries as soon as its task outcomes change (a status change,
+-- a non-Planned insert or a delete), since the suggestion was based on the old progress.
+
+CREATE TABLE IF NOT EXISTS precomputed_suggestions (
+    goal_id INTEGER NOT NULL,
+    day TEXT NOT NULL, -- YYYY-MM-DD the suggestion is for
+    task_description TEXT,
+    coach_message TEXT,
+    model TEXT NOT NULL, -- llm backend model_name that produced it
+    computed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (goal_id, day)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_suggestions_update AFTER UPDATE OF goal_id, status ON tasks
+WHEN NEW.status IS NOT OLD.status OR NEW.goal_id IS NOT OLD.goal_id
+BEGIN
+    DELETE FROM precomputed_suggestions WHERE goal_id IN (OLD.goal_id, NEW.goal_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_suggestions_insert AFTER INSERT ON tasks
+WHEN NEW.status <> 'Planned'
+BEGIN
+    DELETE FROM precomputed_suggestions WHERE goal_id = NEW.goal_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_suggestions_delete AFTER DELETE ON tasks
+WHEN OLD.status <> 'Planned'
+BEGIN
+    DELETE FROM precomputed_suggestions WHERE goal_id = OLD.goal_id;
+END;
@@ -0,0 +1,66 @@
+-- 0008_content_versions.sql
+-- Version counters for HTTP conditional caching (ETags) and the rendered-fragment cache.
+-- ('goal', goal_id) changes with the goal, its tasks and its precomputed suggestion;
+-- ('user', user_id) changes with the user's goals. Triggers bump them in the same
+-- transaction as every write, whichever route or script makes it. A missing row means version 0.
+
+CREATE TABLE IF NOT EXISTS content_versions (
+    scope TEXT NOT NULL, -- 'goal' or 'user'
+    id INTEGER NOT NULL, -- goal_id or user_id
+    version INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (scope, id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_version_insert AFTER INSERT ON tasks
+BEGIN
+    INSERT INTO content_versions (scope, id, version) VALUES ('goal', NEW.goal_id, 1)
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_version_update AFTER UPDATE ON tasks
+BEGIN
+    INSERT INTO content_versions (scope, id, version)
+    SELECT 'goal', goal_id, 1 FROM (SELECT NEW.goal_id AS goal_id UNION SELECT OLD.goal_id)
+    WHERE true
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_version_delete AFTER DELETE ON tasks
+BEGIN
+    INSERT INTO content_versions (scope, id, version) VALUES ('goal', OLD.goal_id, 1)
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_goals_version_insert AFTER INSERT ON goals
+BEGIN
+    INSERT INTO content_versions (scope, id, version) VALUES ('goal', NEW.goal_id, 1), ('user', NEW.user_id, 1)
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_goals_version_update AFTER UPDATE ON goals
+BEGIN
+    INSERT INTO content_versions (scope, id, version)
+    SELECT scope, id, 1 FROM (SELECT 'goal' AS scope, NEW.goal_id AS id UNION SELECT 'goal', OLD.goal_id
+                              UNION SELECT 'user', NEW.user_id UNION SELECT 'user', OLD.user_id)
+    WHERE true
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_goals_version_delete AFTER DELETE ON goals
+BEGIN
+    INSERT INTO content_versions (scope, id, version) VALUES ('goal', OLD.goal_id, 1), ('user', OLD.user_id, 1)
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_suggestions_version_insert AFTER INSERT ON precomputed_suggestions
+BEGIN
+    INSERT INTO content_versions (scope, id, version) VALUES ('goal', NEW.goal_id, 1)
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_suggestions_version_update AFTER UPDATE ON precomputed_suggestions
+BEGIN
+    INSERT INTO content_versions (scope, id, version) VALUES ('goal', NEW.goal_id, 1)
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
@@ -0,0 +1,61 @@
+-- 0009_search_index.sql
+-- FTS5 full-text indexes over goals (description, positive_reasons) and tasks (description),
+-- keyed by goal_id/task_id as rowid. Triggers keep them current in the same transaction as
+-- every insert, text edit and delete; status changes don't touch them. The indexes keep
+-- their own copy of the text, so a row can be (re)indexed with INSERT OR REPLACE without
+-- knowing what was indexed before: that is what makes the backfill and search.py's
+-- rebuild safe to re-run and to interleave with live writes.
+-- Online: triggers go in first, then the batched backfill indexes the existing rows.
+-- migrate:online
+
+CREATE VIRTUAL TABLE IF NOT EXISTS goals_fts USING fts5(
+    description, positive_reasons,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+    description,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_goals_fts_insert AFTER INSERT ON goals
+BEGIN
+    INSERT OR REPLACE INTO goals_fts (rowid, description, positive_reasons)
+    VALUES (NEW.goal_id, NEW.description, NEW.positive_reasons);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_goals_fts_update AFTER UPDATE OF goal_id, description, positive_reasons ON goals
+BEGIN
+    DELETE FROM goals_fts WHERE rowid = OLD.goal_id;
+    INSERT OR REPLACE INTO goals_fts (rowid, description, positive_reasons)
+    VALUES (NEW.goal_id, NEW.description, NEW.positive_reasons);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_goals_fts_delete AFTER DELETE ON goals
+BEGIN
+    DELETE FROM goals_fts WHERE rowid = OLD.goal_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_insert AFTER INSERT ON tasks
+BEGIN
+    INSERT OR REPLACE INTO tasks_fts (rowid, description) VALUES (NEW.task_id, NEW.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_update AFTER UPDATE OF task_id, description ON tasks
+BEGIN
+    DELETE FROM tasks_fts WHERE rowid = OLD.task_id;
+    INSERT OR REPLACE INTO tasks_fts (rowid, description) VALUES (NEW.task_id, NEW.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_delete AFTER DELETE ON tasks
+BEGIN
+    DELETE FROM tasks_fts WHERE rowid = OLD.task_id;
+END;
+
+-- migrate:batch table=goals key=goal_id size=2000
+INSERT OR REPLACE INTO goals_fts (rowid, description, positive_reasons)
+SELECT goal_id, description, positive_reasons FROM goals WHERE goal_id BETWEEN :lo AND :hi;
+
+-- migrate:batch table=tasks key=task_id size=5000
+INSERT OR REPLACE INTO tasks_fts (rowid, description)
+SELECT task_id, description FROM tasks WHERE task_id BETWEEN :lo AND :hi;
@@ -0,0 +1,110 @@
+# page_cache.py
+# Conditional GETs and rendered-fragment caching for the HTML pages
+#
+# Pages are keyed on the content_versions counters, which triggers bump on every write to
+# a goal, its tasks or a user's goals (see migrations/0008_content_versions.sql). A page
+# whose versions haven't changed gets a 304 from its ETag without any other query, and the
+# expensive fragments (goal header, task list) are rendered once per version. Entries for
+# old versions are never read again and age out of the LRU, so nothing is ever invalidated
+# by hand.
+
+import collections
+import datetime
+import hashlib
+import os
+import threading
+
+
+class FragmentCache:
+    """Thread-safe in-process LRU of rendered fragments, with hit/miss counters."""
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_render(self, key, render):
+        """Returns the cached value for ``key``, or ``render()``'s (value, cacheable) after storing it."""
+        value = self.get(key)
+        if value is None:
+            value, cacheable = render()
+            if cacheable:
+                self.set(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else None,
+            }
+
+
+def get_versions(db, *keys):
+    """Returns {(scope, id): (version, updated_at)} for the (scope, id) keys; missing ones are (0, None)."""
+    versions = {key: (0, None) for key in keys}
+    clauses = ' OR '.join('(scope = ? AND id = ?)' for _ in keys)
+    params = [part for key in keys for part in key]
+    for scope, id_, version, updated_at in db.execute(
+            f"SELECT scope, id, version, updated_at FROM content_versions WHERE {clauses}", params):
+        versions[(scope, id_)] = (version, updated_at)
+    return versions
+
+
+def templates_fingerprint(folder):
+    """Hash of every template file, so a deploy with changed templates changes every ETag."""
+    digest = hashlib.sha256()
+    for root, _, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(name.encode('utf-8'))
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def make_etag(*parts):
+    """Strong ETag value over ``parts`` (without quotes)."""
+    return hashlib.sha256('|'.join(map(str, parts)).encode('utf-8')).hexdigest()[:32]
+
+
+def last_modified(versions, today=None):
+    """Latest updated_at of ``versions`` (UTC), but not before the start of ``today``, since
+    the pages also change with the date."""
+    today = today or datetime.date.today()
+    stamp = datetime.datetime.combine(today, datetime.time()).astimezone(datetime.timezone.utc)
+    for _, updated_at in versions.values():
+        if isinstance(updated_at, str):  # Connections without PARSE_DECLTYPES return the raw text
+            updated_at = datetime.datetime.fromisoformat(updated_at)
+        if updated_at:
+            stamp = max(stamp, updated_at.replace(tzinfo=datetime.timezone.utc))
+    return stamp
+
+
+def is_not_modified(request, etag, modified):
+    """Whether the request's validators match: If-None-Match wins over If-Modified-Since."""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    return request.if_modified_since is not None and modified.replace(microsecond=0) <= request.if_modified_since
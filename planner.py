@@ -0,0 +1,242 @@
+# planner.py
+# Batched multi-day planning: one LLM call plans N days for one or more goals
+#
+# The prompt asks for JSON matching PLAN_SCHEMA (providers that support structured output
+# enforce it). PlanStreamParser hands out each task the moment its JSON object closes, and
+# parse_plan() repairs the usual damage (code fences, trailing commas, truncated output)
+# before falling back to "YYYY-MM-DD: task" lines. Dates the model skipped are filled from
+# the offline templates, so a plan always has one task per goal per requested date.
+
+import datetime
+import json
+import re
+
+from llm_backends import template_task
+
+MAX_DESCRIPTION_LENGTH = 500
+# "2024-05-01: Run 3 km", tolerating list markers and markdown bold around the date
+TASK_LINE = re.compile(
+    r'^\s*(?:[-*•]|\d+[.)])?\s*(?:\*\*)?(\d{4}-\d{2}-\d{2})(?:\*\*)?\s*(?::|\||-|–|—)\s*(.+?)\s*$')
+
+PLAN_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'plans': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'goal_id': {'type': 'integer'},
+                    'tasks': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'due_date': {'type': 'string'},
+                                'description': {'type': 'string'},
+                            },
+                            'required': ['due_date', 'description'],
+                        },
+                    },
+                },
+                'required': ['goal_id', 'tasks'],
+            },
+        },
+    },
+    'required': ['plans'],
+}
+
+
+class PlanStreamParser:
+    """Incremental scanner over streamed JSON that returns each task object as soon as it closes.
+
+    A task is any JSON object with due_date and description; its goal_id comes from the
+    enclosing plan object when that has already been seen (or from ``default_goal_id``).
+    The complete text is kept for parse_plan() at the end of the stream.
+    """
+
+    def __init__(self, default_goal_id=None):
+        self.default_goal_id = default_goal_id
+        self.text = ''
+        self._pos = 0
+        self._stack = []  # Open containers: (char, start offset)
+        self._in_string = False
+        self._escaped = False
+        self.tasks = []
+
+    def feed(self, chunk):
+        """Adds streamed text and returns the tasks completed by it."""
+        self.text += chunk
+        found = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif c == '\\':
+                    self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in '{[':
+                self._stack.append((c, i))
+            elif c in '}]' and self._stack:
+                opener, start = self._stack.pop()
+                if opener == '{' and c == '}':
+                    task = self._task_from(text[start:i + 1])
+                    if task:
+                        found.append(task)
+        self._pos = len(text)
+        return found
+
+    def _task_from(self, fragment):
+        try:
+            data = json.loads(_strip_trailing_commas(fragment))
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or 'due_date' not in data or 'description' not in data:
+            return None
+        task = _clean_task(data)
+        if task is None:
+            return None
+        task['goal_id'] = self._enclosing_goal_id()
+        self.tasks.append(task)
+        return task
+
+    def _enclosing_goal_id(self):
+        # Innermost open object that has already stated its goal_id
+        for opener, start in reversed(self._stack):
+            if opener == '{':
+                match = re.search(r'"goal_id"\s*:\s*"?(\d+)', self.text[start:])
+                if match:
+                    return int(match.group(1))
+        return self.default_goal_id
+
+
+def _strip_code_fences(text):
+    return re.sub(r'^\s*```[a-zA-Z]*\s*|\s*```\s*$', '', text.strip())
+
+
+def _strip_trailing_commas(text):
+    return re.sub(r',(\s*[}\]])', r'\1', text)
+
+
+def _close_truncated(text):
+    """Closes an unterminated string and any open objects/arrays of truncated JSON."""
+    stack = []
+    in_string = escaped = False
+    for c in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == '\\':
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in '{[':
+            stack.append('}' if c == '{' else ']')
+        elif c in '}]' and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = re.sub(r',\s*$', '', text.rstrip())
+    text = re.sub(r'"[^"]*"\s*:\s*$', '', text).rstrip().rstrip(',')  # Drop a dangling key
+    return text + ''.join(reversed(stack))
+
+
+def _repair_json(text):
+    """Parses JSON from a model response, repairing common defects. Returns None on failure."""
+    text = _strip_code_fences(text)
+    starts = [i for i in (text.find('{'), text.find('[')) if i >= 0]
+    if not starts:
+        return None
+    text = text[min(starts):]
+    for candidate in (text, _strip_trailing_commas(text), _strip_trailing_commas(_close_truncated(text))):
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    return None
+
+
+def _clean_task(data):
+    try:
+        due_date = datetime.date.fromisoformat(str(data.get('due_date', '')).strip()[:10]).isoformat()
+    except ValueError:
+        return None
+    description = ' '.join(str(data.get('description') or '').split())[:MAX_DESCRIPTION_LENGTH]
+    if not description:
+        return None
+    return {'due_date': due_date, 'description': description}
+
+
+def _plans_from(data, default_goal_id):
+    """Yields (goal_id, task_dict) from any of the shapes models return in practice."""
+    if isinstance(data, dict) and 'plans' in data:
+        data = data['plans']
+    elif isinstance(data, dict) and 'tasks' in data:
+        data = [data]
+    if not isinstance(data, list):
+        return
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        if 'tasks' in item:
+            try:
+                goal_id = int(item.get('goal_id', default_goal_id))
+            except (TypeError, ValueError):
+                goal_id = default_goal_id
+            for task in item['tasks'] if isinstance(item['tasks'], list) else []:
+                if isinstance(task, dict):
+                    yield goal_id, task
+        elif 'due_date' in item:  # A bare list of tasks
+            yield default_goal_id, item
+
+
+def parse_plan(text, goals, dates):
+    """Turns a model response into {goal_id: [task, ...]} with exactly one task per requested date.
+
+    ``goals`` maps goal_id to its description (used for template fill-ins). Returns
+    (plans, report) where report counts parsed, repaired-away and filled-in tasks.
+    """
+    goal_ids = list(goals)
+    default_goal_id = goal_ids[0] if len(goal_ids) == 1 else None
+    wanted_dates = [str(d) for d in dates]
+    parsed = {}
+    report = {'parsed': 0, 'dropped': 0, 'filled': 0, 'format': 'json'}
+
+    data = _repair_json(text)
+    pairs = list(_plans_from(data, default_goal_id)) if data is not None else []
+    if not pairs:
+        # Not JSON at all: accept "YYYY-MM-DD: description" lines (single-goal plans only)
+        report['format'] = 'lines'
+        pairs = [(default_goal_id, {'due_date': m.group(1), 'description': m.group(2)})
+                 for m in map(TASK_LINE.match, text.splitlines()) if m]
+
+    for goal_id, raw in pairs:
+        task = _clean_task(raw)
+        if task is None or goal_id not in goals or task['due_date'] not in wanted_dates:
+            report['dropped'] += 1
+            continue
+        if (goal_id, task['due_date']) in parsed:
+            report['dropped'] += 1  # Keep the first task per goal and day
+            continue
+        parsed[(goal_id, task['due_date'])] = task
+        report['parsed'] += 1
+
+    if not parsed:
+        report['format'] = 'unusable' if text.strip() else 'empty'
+    plans = {}
+    for goal_id in goal_ids:
+        plans[goal_id] = []
+        for due_date in wanted_dates:
+            task = parsed.get((goal_id, due_date))
+            if task is None:
+                task = {'due_date': due_date, 'description': template_task(goals[goal_id], due_date)}
+                report['filled'] += 1
+            plans[goal_id].append(task)
+    return plans, report
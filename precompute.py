@@ -0,0 +1,196 @@
+# precompute.py
+# Off-peak precomputation of today's task suggestion and coaching message for every Active goal
+#
+# Users tend to open their goals at the same time each morning; generating the suggestions
+# beforehand turns that spike into a steady overnight trickle. Results go to the
+# precomputed_suggestions table, which the goal page, /generate_task_for_today and
+# /jobs/generate_task read first. Triggers on tasks drop a goal's entry whenever one of its
+# task statuses changes, and the next request for that goal generates it live.
+#
+#   python precompute.py                          # precompute today's suggestions once, then exit
+#   python precompute.py --daemon --at 04:30      # worker: run every day at 04:30 local time
+#   python precompute.py --concurrency 2 --rate 30  # at most 2 calls in flight, 30 goals/minute
+#
+# With SHARD_COUNT > 1 (see tenancy.py) every shard file is processed in turn.
+
+import argparse
+import concurrent.futures
+import datetime
+import logging
+import sqlite3
+import sys
+import threading
+import time
+
+log = logging.getLogger('coach_agent.precompute')
+
+DATABASE = 'coach_agent.db'
+GOAL_BATCH_SIZE = 200
+
+
+def get_suggestion(db, goal_id, day=None):
+    """Returns today's (or ``day``'s) precomputed suggestion row for the goal, or None."""
+    day = (day or datetime.date.today()).isoformat()
+    return db.execute(
+        """SELECT task_description, coach_message, model, computed_at
+           FROM precomputed_suggestions WHERE goal_id = ? AND day = ?""",
+        (goal_id, day)).fetchone()
+
+
+def store_suggestion(db, goal_id, day, task_description, coach_message, model):
+    """Upserts one goal's suggestion for ``day``."""
+    try:
+        db.execute(
+            """INSERT INTO precomputed_suggestions (goal_id, day, task_description, coach_message, model, computed_at)
+               VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+               ON CONFLICT (goal_id, day) DO UPDATE SET
+                   task_description = excluded.task_description,
+                   coach_message = excluded.coach_message,
+                   model = excluded.model,
+                   computed_at = excluded.computed_at""",
+            (goal_id, day.isoformat(), task_description, coach_message, model))
+        db.commit()
+    except sqlite3.Error:
+        db.rollback()
+        raise
+
+
+def prune_suggestions(db, today=None):
+    """Deletes suggestions for days before ``today``. Returns the number removed."""
+    today = (today or datetime.date.today()).isoformat()
+    try:
+        count = db.execute("DELETE FROM precomputed_suggestions WHERE day < ?", (today,)).rowcount
+        db.commit()
+    except sqlite3.Error:
+        db.rollback()
+        raise
+    return count
+
+
+def pending_goal_ids(db, day, after=0, limit=GOAL_BATCH_SIZE):
+    """Next batch of Active goals (by goal_id, after ``after``) without a suggestion for ``day``."""
+    return [row[0] for row in db.execute(
+        """SELECT g.goal_id FROM goals g
+           WHERE g.status = 'Active' AND g.goal_id > ?
+             AND NOT EXISTS (SELECT 1 FROM precomputed_suggestions s WHERE s.goal_id = g.goal_id AND s.day = ?)
+           ORDER BY g.goal_id LIMIT ?""",
+        (after, day.isoformat(), limit))]
+
+
+class Precomputer:
+    """Walks the Active goals and stores a suggestion for each one.
+
+    ``suggest(db, goal_id)`` returns (task_description, coach_message), or None for a goal
+    that disappeared; it raises on AI failures, which are counted and skipped so a bad goal
+    never stops the run. Calls are spread out to at most ``rate`` goals per minute (0 for no
+    limit) with ``concurrency`` in flight, to stay clear of the provider's quota.
+    """
+
+    def __init__(self, path, suggest, model, concurrency=2, rate=60.0):
+        self.path = path
+        self.suggest = suggest
+        self.model = model
+        self.concurrency = concurrency
+        self.interval = 60.0 / rate if rate else 0.0
+        self._local = threading.local()
+        self._pace_lock = threading.Lock()
+        self._next_start = 0.0
+
+    def _connection(self):
+        # One connection per worker thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA foreign_keys = ON")
+            self._local.conn = conn
+        return conn
+
+    def _pace(self):
+        with self._pace_lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def _precompute_goal(self, goal_id, day):
+        self._pace()
+        db = self._connection()
+        suggestion = self.suggest(db, goal_id)
+        if suggestion is None:
+            return False
+        store_suggestion(db, goal_id, day, *suggestion, self.model)
+        return True
+
+    def run(self, day=None):
+        """Precomputes ``day`` (default today) for every Active goal still missing one; returns counts."""
+        day = day or datetime.date.today()
+        stats = {'day': day.isoformat(), 'stored': 0, 'skipped': 0, 'failed': 0, 'pruned': 0}
+        started = time.perf_counter()
+        db = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            stats['pruned'] = prune_suggestions(db, day)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                after = 0
+                while True:
+                    goal_ids = pending_goal_ids(db, day, after)
+                    if not goal_ids:
+                        break
+                    after = goal_ids[-1]
+                    futures = {pool.submit(self._precompute_goal, goal_id, day): goal_id for goal_id in goal_ids}
+                    for future in concurrent.futures.as_completed(futures):
+                        try:
+                            stats['stored' if future.result() else 'skipped'] += 1
+                        except Exception as e:
+                            stats['failed'] += 1
+                            log.error("Could not precompute goal %s: %s", futures[future], e)
+        finally:
+            db.close()
+        stats['seconds'] = round(time.perf_counter() - started, 1)
+        return stats
+
+
+def seconds_until(at, now=None):
+    """Seconds from ``now`` until the next local time ``at`` (a datetime.time)."""
+    now = now or datetime.datetime.now()
+    target = datetime.datetime.combine(now.date(), at)
+    if target <= now:
+        target += datetime.timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute today's task suggestion and coaching message per Active goal.")
+    parser.add_argument('--db', default=DATABASE, help='database file (default: every shard of the app database)')
+    parser.add_argument('--daemon', action='store_true', help='keep running and precompute once a day')
+    parser.add_argument('--at', default='04:30', help='local time of the daily run in daemon mode (HH:MM)')
+    parser.add_argument('--concurrency', type=int, default=2, help='AI calls in flight at once')
+    parser.add_argument('--rate', type=float, default=60.0, help='goals per minute at most (0: unlimited)')
+    args = parser.parse_args(argv)
+    at = datetime.time.fromisoformat(args.at)
+
+    import app  # The prompts, AI backend, response cache and shard layout are the web app's
+    from instrumentation import configure_logging
+    configure_logging(app.LOG_LEVEL, app.LOG_FORMAT)
+    app.ensure_database_ready()
+    paths = app.db_shards.paths if args.db == app.DATABASE else [args.db]
+    precomputers = [Precomputer(path, app.precompute_suggestion, app.llm_backend.model_name,
+                                concurrency=args.concurrency, rate=args.rate) for path in paths]
+    while True:
+        stored = failed = 0
+        for path, precomputer in zip(paths, precomputers):
+            stats = precomputer.run()
+            stored += stats['stored']
+            failed += stats['failed']
+            print(f"✅ Precomputed {stats['stored']} suggestions for {stats['day']} in {path} in {stats['seconds']}s "
+                  f"({stats['failed']} failed, {stats['skipped']} skipped, {stats['pruned']} old entries pruned).")
+        if not args.daemon:
+            return 1 if failed and not stored else 0
+        delay = seconds_until(at)
+        print(f"💤 Next run at {args.at} (in {delay / 3600:.1f}h).")
+        time.sleep(delay)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+# prompts.py
+# Prompt templates for every AI call, with whitespace compaction and a token budget
+#
+# Prompt size would otherwise grow with each goal's history. Here the history is a few
+# summary statistics plus a handful of representative past tasks, and the parts that do
+# not fit the budget are dropped, least important first. Token counts are estimates
+# (about 4 characters per token, close enough for English prompts). They are recorded per
+# prompt kind in ``usage``; the app serves those counts at /health/prompts.
+
+import itertools
+import re
+import threading
+
+import analytics
+
+CHARS_PER_TOKEN = 4
+TASK_PROMPT_BUDGET = 400  # Tokens for a today's-task prompt, goal and history included
+PLAN_PROMPT_BUDGET = 1500  # Tokens for a multi-day plan prompt, across all of its goals
+EXAMPLE_TASKS = 6  # Representative past tasks offered to the history summary
+EXAMPLE_LENGTH = 80  # Characters kept of each example task
+FIELD_LENGTH = 300  # Characters kept of each free-text goal field
+
+
+def estimate_tokens(text):
+    """Rough token count of ``text``."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def compact(text):
+    """Strips indentation and trailing spaces and collapses runs of blank lines."""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines))
+
+
+def _clip(text, length):
+    text = ' '.join(str(text or '').split())
+    return text if len(text) <= length else text[:length - 1].rstrip() + '…'
+
+
+class PromptUsage:
+    """Thread-safe per-kind counters of built prompts and their estimated tokens."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kinds = {}
+
+    def record(self, kind, tokens, trimmed=False):
+        with self._lock:
+            counts = self._kinds.setdefault(kind, {'prompts': 0, 'tokens_total': 0, 'tokens_max': 0, 'trimmed': 0})
+            counts['prompts'] += 1
+            counts['tokens_total'] += tokens
+            counts['tokens_max'] = max(counts['tokens_max'], tokens)
+            counts['trimmed'] += trimmed
+
+    def stats(self):
+        with self._lock:
+            kinds = {kind: dict(counts) for kind, counts in self._kinds.items()}
+        for counts in kinds.values():
+            counts['tokens_avg'] = round(counts['tokens_total'] / counts['prompts'], 1)
+        return kinds
+
+
+usage = PromptUsage()
+
+
+def recent_task_examples(db, goal_id, limit=EXAMPLE_TASKS):
+    """Up to ``limit`` recent resolved tasks of the goal, alternating completed and missed.
+
+    Repeated descriptions are skipped, so a daily routine shows up once. Returns a list of
+    (status, description) tuples, newest first within each status.
+    """
+    rows = db.execute(
+        """SELECT status, description FROM tasks
+           WHERE goal_id = ? AND status IN ('Completed', 'Missed')
+           ORDER BY due_date DESC LIMIT ?""",
+        (goal_id, limit * 5)).fetchall()
+    by_status = {'Completed': [], 'Missed': []}
+    seen = set()
+    for status, description in rows:
+        key = ' '.join(description.lower().split())
+        if key not in seen:
+            seen.add(key)
+            by_status[status].append(description)
+    examples = []
+    for pair in itertools.zip_longest(by_status['Completed'], by_status['Missed']):
+        examples += [(status, description) for status, description in zip(('Completed', 'Missed'), pair) if description]
+    return examples[:limit]
+
+
+def history_summary(stats, examples=(), budget=None):
+    """Task-history lines for a prompt: statistics first, then example tasks, within ``budget`` tokens.
+
+    Returns (text, trimmed) where ``trimmed`` says whether anything was left out.
+    """
+    def percent(rate):
+        return 'n/a' if rate is None else f"{rate:.0%}"
+
+    guidance = {
+        'easier': "Struggling lately: make the task smaller and easier to achieve.",
+        'moderate': "Keep the task at a moderate difficulty.",
+        'challenge': "Doing very well: make the task a bit more challenging.",
+    }
+    # (priority, line): lower priority numbers are kept first, output keeps this order
+    candidates = [
+        (0, f"- Success rate: {percent(stats['success_rate'])} overall, "
+            f"{percent(stats['recent_success_rate'])} over the last {analytics.RECENT_TASKS} tasks"),
+        (1, f"- {guidance[stats['difficulty']]}"),
+        (2, f"- Current streak: {stats['current_streak']} days (longest: {stats['longest_streak']})"),
+    ]
+    if stats['peak_period']:
+        candidates.append((3, f"- Usually completes tasks in the {stats['peak_period']}"))
+    if stats['missed_clusters']['most_missed_weekday']:
+        candidates.append((3, f"- Most often misses tasks on {stats['missed_clusters']['most_missed_weekday']}"))
+    for n, (status, description) in enumerate(examples):
+        candidates.append((4 + n, f"- {status}: {_clip(description, EXAMPLE_LENGTH)}"))
+
+    kept = set()
+    used = 0
+    for index, (_, line) in sorted(enumerate(candidates), key=lambda item: item[1][0]):
+        cost = estimate_tokens(line) + 1
+        if budget is not None and used + cost > budget:
+            continue
+        kept.add(index)
+        used += cost
+    text = '\n'.join(line for index, (_, line) in enumerate(candidates) if index in kept)
+    return text, len(kept) < len(candidates)
+
+
+def goal_history(db, goal_id, budget=None):
+    """history_summary() of a goal from its analytics and recent tasks."""
+    return history_summary(analytics.goal_stats(db, goal_id), recent_task_examples(db, goal_id), budget)
+
+
+def _finish(kind, template, trimmed=False, **fields):
+    text = compact(template.format(**fields))
+    usage.record(kind, estimate_tokens(text), trimmed)
+    return text
+
+
+TODAY_TASK = """
+Based on this goal and context, generate ONE specific, actionable task for today.
+
+Goal: {description}
+Motivation: {reasons}
+Consequences if not achieved: {consequences}
+
+Progress this week: {completed} completed, {missed} missed
+
+Task history:
+{history}
+
+The task must directly relate to the goal, build on their progress if they are doing well,
+be more achievable if they have been struggling, be concrete and be completable today.
+Return ONLY the task description, nothing else.
+"""
+
+COACH_MESSAGE = """
+Act as a very brief, supportive coach. Look at the following goal and the user's reasons for achieving it.
+Goal: "{description}"
+User's Reasons Why: "{reasons}"
+
+Based ONLY on the information above, provide a short (1-2 sentences maximum) encouraging message to help this user stay motivated towards their goal today. Do not ask questions. Be positive and direct. Address the user ("You...").
+"""
+
+PLAN = """
+Plan one specific, actionable task per day for each goal below.
+
+Goals:
+{goals}
+
+Dates:
+{dates}
+
+Each task must directly serve its goal, be concrete, be completable within its day and build
+gradually on the previous days. Adapt difficulty to each goal's task history.
+
+Return ONLY JSON, no prose and no code fences, in exactly this shape:
+{{"plans": [{{"goal_id": <goal_id>, "tasks": [{{"due_date": "YYYY-MM-DD", "description": "..."}}]}}]}}
+with one plan per goal and one task per date.
+"""
+
+# Each template's first line is fixed text, so it tells a built prompt's kind apart from
+# whatever the user wrote in the goal fields below it
+_OPENINGS = {compact(template).split('\n', 1)[0]: kind
+             for kind, template in (('today_task', TODAY_TASK), ('coach_message', COACH_MESSAGE), ('plan', PLAN))}
+
+
+def prompt_kind(text):
+    """'today_task', 'coach_message' or 'plan' for a prompt built here, None for any other text."""
+    return _OPENINGS.get(text.lstrip().split('\n', 1)[0])
+
+
+def today_task_prompt(db, goal, goal_id, week_progress, budget=TASK_PROMPT_BUDGET):
+    """Prompt for today's task. ``goal`` is a row with description, positive_reasons and
+    consequences_of_inaction; ``week_progress`` is (completed, missed) since Monday."""
+    fields = dict(description=_clip(goal['description'], FIELD_LENGTH),
+                  reasons=_clip(goal['positive_reasons'], FIELD_LENGTH),
+                  consequences=_clip(goal['consequences_of_inaction'], FIELD_LENGTH),
+                  completed=week_progress[0], missed=week_progress[1])
+    base = estimate_tokens(compact(TODAY_TASK.format(history='', **fields)))
+    history, trimmed = goal_history(db, goal_id, max(budget - base, 0))
+    return _finish('today_task', TODAY_TASK, trimmed, history=history, **fields)
+
+
+def coach_message_prompt(goal):
+    """Prompt for the goal page's short motivational message."""
+    return _finish('coach_message', COACH_MESSAGE, description=_clip(goal['description'], FIELD_LENGTH),
+                   reasons=_clip(goal['positive_reasons'], FIELD_LENGTH))
+
+
+def plan_prompt(db, goals, dates, budget=PLAN_PROMPT_BUDGET):
+    """One prompt covering every goal and date (see planner.py).
+
+    ``goals`` are rows or dicts with goal_id, description, positive_reasons and
+    consequences_of_inaction. What the fixed parts leave of the budget is split evenly
+    between the goals' histories.
+    """
+    blocks = []
+    for goal in goals:
+        lines = [f"[goal_id={goal['goal_id']}] {_clip(goal['description'], FIELD_LENGTH)}"]
+        if goal['positive_reasons']:
+            lines.append(f"Motivation: {_clip(goal['positive_reasons'], FIELD_LENGTH)}")
+        if goal['consequences_of_inaction']:
+            lines.append(f"Consequences if not achieved: {_clip(goal['consequences_of_inaction'], FIELD_LENGTH)}")
+        blocks.append(lines)
+    date_text = '\n'.join(str(d) for d in dates)
+    base = estimate_tokens(compact(PLAN.format(goals='\n\n'.join('\n'.join(lines) for lines in blocks), dates=date_text)))
+    per_goal = max(budget - base, 0) // max(len(goals), 1)
+
+    trimmed = False
+    for goal, lines in zip(goals, blocks):
+        history, cut = goal_history(db, goal['goal_id'], per_goal)
+        trimmed = trimmed or cut
+        if history:
+            lines.append("Task history:")
+            lines.append(history)
+    return _finish('plan', PLAN, trimmed, goals='\n\n'.join('\n'.join(lines) for lines in blocks), dates=date_text)
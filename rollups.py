@@ -0,0 +1,88 @@
+# rollups.py
+# Rebuilds the goal progress rollup tables from tasks.
+#
+# goal_progress_daily and goal_completion_hours are normally kept current by the
+# triggers on tasks (see migrations/0003_goal_progress_rollups.sql). Use this after
+# bulk loads that bypassed the triggers or to repair drift:
+#
+#   python rollups.py                      # all goals, 500 goals per transaction
+#   python rollups.py --goal 12 --goal 15  # just these goals
+
+import argparse
+import sqlite3
+import sys
+import time
+
+DATABASE = 'coach_agent.db'
+
+REBUILD_DAILY = """
+    INSERT INTO goal_progress_daily (goal_id, day, week_start, planned, completed, missed)
+    SELECT goal_id, due_date, COALESCE(date(due_date, 'weekday 0', '-6 days'), ''),
+           SUM(status = 'Planned'), SUM(status = 'Completed'), SUM(status = 'Missed')
+    FROM tasks
+    WHERE goal_id BETWEEN ? AND ?
+    GROUP BY goal_id, due_date"""
+
+REBUILD_HOURS = """
+    INSERT INTO goal_completion_hours (goal_id, hour, completed)
+    SELECT goal_id, CAST(strftime('%H', completion_date) AS INTEGER), COUNT(*)
+    FROM tasks
+    WHERE goal_id BETWEEN ? AND ?
+      AND status = 'Completed' AND strftime('%H', completion_date) IS NOT NULL
+    GROUP BY goal_id, CAST(strftime('%H', completion_date) AS INTEGER)"""
+
+
+def _rebuild_range(conn, low, high):
+    """Recomputes the rollups of goals low..high inside one transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM goal_progress_daily WHERE goal_id BETWEEN ? AND ?", (low, high))
+        conn.execute("DELETE FROM goal_completion_hours WHERE goal_id BETWEEN ? AND ?", (low, high))
+        rows = conn.execute(REBUILD_DAILY, (low, high)).rowcount
+        conn.execute(REBUILD_HOURS, (low, high))
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+
+def rebuild(path, batch_size=500, goal_ids=None):
+    """Rebuilds rollups for every goal (or just ``goal_ids``), one short transaction per batch."""
+    conn = sqlite3.connect(path, isolation_level=None, timeout=30.0)
+    rows = 0
+    try:
+        if goal_ids:
+            for goal_id in goal_ids:
+                rows += _rebuild_range(conn, goal_id, goal_id)
+            return rows
+        # Tasks are included too, so rows of goals that no longer exist are rebuilt (emptied) as well
+        low, high = conn.execute("""
+            SELECT MIN(goal_id), MAX(goal_id) FROM (
+                SELECT MIN(goal_id) AS goal_id FROM goals UNION ALL SELECT MAX(goal_id) FROM goals
+                UNION ALL SELECT MIN(goal_id) FROM tasks UNION ALL SELECT MAX(goal_id) FROM tasks)"""
+        ).fetchone()
+        if low is None:
+            return 0
+        for start in range(low, high + 1, batch_size):
+            rows += _rebuild_range(conn, start, start + batch_size - 1)
+        return rows
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild goal progress rollups from tasks.')
+    parser.add_argument('--db', default=DATABASE)
+    parser.add_argument('--batch-size', type=int, default=500, help='goals per transaction')
+    parser.add_argument('--goal', type=int, action='append', dest='goal_ids', help='only rebuild this goal')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    rows = rebuild(args.db, args.batch_size, args.goal_ids)
+    print(f"✅ Rebuilt {rows} daily rollup rows in {time.perf_counter() - started:.2f}s.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,20 +1,19 @@
 -- schema.sql
-
--- Drop existing tables in reverse order of dependency
-DROP TABLE IF EXISTS tasks;
-DROP TABLE IF EXISTS goals;
-DROP TABLE IF EXISTS users;
-
+-- Current full schema, used to create fresh databases in one step (migrate.py stamps
+-- them with the latest migration version). Existing databases are upgraded by the
+-- numbered files in migrations/ instead, so this file never drops anything.
+-- When changing the schema, add a migration AND update this file;
+-- `python migrate.py --check` verifies that both produce the same schema.
 
 -- Create the users table (simplified for single user for now)
-CREATE TABLE users (
+CREATE TABLE IF NOT EXISTS users (
     user_id INTEGER PRIMARY KEY AUTOINCREMENT,
     username TEXT UNIQUE NOT NULL,
     preferences TEXT -- Store JSON string for check-in time etc.
 );
 
 -- Create the goals table
-CREATE TABLE goals (
+CREATE TABLE IF NOT EXISTS goals (
     goal_id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER NOT NULL,
     description TEXT NOT NULL,
@@ -27,7 +26,7 @@ CREATE TABLE goals (
 );
 
 -- Create the tasks table
-CREATE TABLE tasks (
+CREATE TABLE IF NOT EXISTS tasks (
     task_id INTEGER PRIMARY KEY AUTOINCREMENT,
     goal_id INTEGER NOT NULL,
     description TEXT NOT NULL,
@@ -39,6 +38,250 @@ CREATE TABLE tasks (
     FOREIGN KEY (goal_id) REFERENCES goals (goal_id) ON DELETE CASCADE -- Optional: Delete tasks if goal is deleted
 );
 
+-- Secondary indexes for the hot route queries
+-- (check_query_plans.py verifies that none of the route queries falls back to a table scan)
+
+-- Dashboard: active goals for a user, newest first
+-- (goals WHERE user_id = ? AND status = 'Active' ORDER BY creation_date DESC)
+CREATE INDEX IF NOT EXISTS idx_goals_user_status_created ON goals (user_id, status, creation_date);
+
+-- Goals created by a user within a date range (last week's goals)
+CREATE INDEX IF NOT EXISTS idx_goals_user_created ON goals (user_id, creation_date);
+
+-- Per-goal task ranges by due date (rollup rebuilds, per-goal sweeps). Covers the
+-- per-status counts, which never touch the table rows.
+CREATE INDEX IF NOT EXISTS idx_tasks_goal_due_status ON tasks (goal_id, due_date, status, creation_date);
+
+-- Goal detail task pages: keyset (due_date, task_id) within a goal; the rowid (task_id)
+-- is the implicit last column, so the ORDER BY needs no sort
+CREATE INDEX IF NOT EXISTS idx_tasks_goal_due ON tasks (goal_id, due_date);
+
+-- Open (Planned) tasks by due date, for the overdue sweep
+CREATE INDEX IF NOT EXISTS idx_tasks_planned_due ON tasks (due_date) WHERE status = 'Planned';
+
+-- Progress rollups: per-goal, per-day task counts by status and a per-goal histogram of
+-- completion hours, kept current by the triggers below (rebuild with `python rollups.py`)
+CREATE TABLE IF NOT EXISTS goal_progress_daily (
+    goal_id INTEGER NOT NULL,
+    day TEXT NOT NULL, -- tasks.due_date (YYYY-MM-DD)
+    week_start TEXT NOT NULL, -- Monday of the ISO week containing day
+    planned INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    missed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (goal_id, day)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_goal_progress_week ON goal_progress_daily (goal_id, week_start);
+
+CREATE TABLE IF NOT EXISTS goal_completion_hours (
+    goal_id INTEGER NOT NULL,
+    hour INTEGER NOT NULL, -- 0-23, hour of tasks.completion_date
+    completed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (goal_id, hour)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_progress_insert AFTER INSERT ON tasks
+BEGIN
+    INSERT INTO goal_progress_daily (goal_id, day, week_start, planned, completed, missed)
+    VALUES (NEW.goal_id, NEW.due_date, COALESCE(date(NEW.due_date, 'weekday 0', '-6 days'), ''),
+            NEW.status = 'Planned', NEW.status = 'Completed', NEW.status = 'Missed')
+    ON CONFLICT (goal_id, day) DO UPDATE SET
+        planned = planned + excluded.planned,
+        completed = completed + excluded.completed,
+        missed = missed + excluded.missed;
+    INSERT INTO goal_completion_hours (goal_id, hour, completed)
+    SELECT NEW.goal_id, CAST(strftime('%H', NEW.completion_date) AS INTEGER), 1
+    WHERE NEW.status = 'Completed' AND strftime('%H', NEW.completion_date) IS NOT NULL
+    ON CONFLICT (goal_id, hour) DO UPDATE SET completed = completed + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_progress_update
+AFTER UPDATE OF goal_id, due_date, status, completion_date ON tasks
+BEGIN
+    UPDATE goal_progress_daily SET
+        planned = planned - (OLD.status = 'Planned'),
+        completed = completed - (OLD.status = 'Completed'),
+        missed = missed - (OLD.status = 'Missed')
+    WHERE goal_id = OLD.goal_id AND day = OLD.due_date;
+    INSERT INTO goal_progress_daily (goal_id, day, week_start, planned, completed, missed)
+    VALUES (NEW.goal_id, NEW.due_date, COALESCE(date(NEW.due_date, 'weekday 0', '-6 days'), ''),
+            NEW.status = 'Planned', NEW.status = 'Completed', NEW.status = 'Missed')
+    ON CONFLICT (goal_id, day) DO UPDATE SET
+        planned = planned + excluded.planned,
+        completed = completed + excluded.completed,
+        missed = missed + excluded.missed;
+    UPDATE goal_completion_hours SET completed = completed - 1
+    WHERE OLD.status = 'Completed' AND goal_id = OLD.goal_id
+      AND hour = CAST(strftime('%H', OLD.completion_date) AS INTEGER);
+    INSERT INTO goal_completion_hours (goal_id, hour, completed)
+    SELECT NEW.goal_id, CAST(strftime('%H', NEW.completion_date) AS INTEGER), 1
+    WHERE NEW.status = 'Completed' AND strftime('%H', NEW.completion_date) IS NOT NULL
+    ON CONFLICT (goal_id, hour) DO UPDATE SET completed = completed + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_progress_delete AFTER DELETE ON tasks
+BEGIN
+    UPDATE goal_progress_daily SET
+        planned = planned - (OLD.status = 'Planned'),
+        completed = completed - (OLD.status = 'Completed'),
+        missed = missed - (OLD.status = 'Missed')
+    WHERE goal_id = OLD.goal_id AND day = OLD.due_date;
+    UPDATE goal_completion_hours SET completed = completed - 1
+    WHERE OLD.status = 'Completed' AND goal_id = OLD.goal_id
+      AND hour = CAST(strftime('%H', OLD.completion_date) AS INTEGER);
+END;
+
+-- Task ids created per client idempotency key (retried bulk inserts return the original ids)
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id INTEGER NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    request_hash TEXT NOT NULL, -- SHA-256 of the normalized task list, to reject key reuse for a different request
+    task_ids TEXT NOT NULL, -- JSON array of the task_ids created by the original request
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, idempotency_key)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at);
+
+-- Today's task suggestion and coaching message per goal, precomputed off-peak by precompute.py;
+-- the triggers drop a goal's entries whenever its task outcomes change
+CREATE TABLE IF NOT EXISTS precomputed_suggestions (
+    goal_id INTEGER NOT NULL,
+    day TEXT NOT NULL, -- YYYY-MM-DD the suggestion is for
+    task_description TEXT,
+    coach_message TEXT,
+    model TEXT NOT NULL, -- llm backend model_name that produced it
+    computed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (goal_id, day)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_suggestions_update AFTER UPDATE OF goal_id, status ON tasks
+WHEN NEW.status IS NOT OLD.status OR NEW.goal_id IS NOT OLD.goal_id
+BEGIN
+    DELETE FROM precomputed_suggestions WHERE goal_id IN (OLD.goal_id, NEW.goal_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_suggestions_insert AFTER INSERT ON tasks
+WHEN NEW.status <> 'Planned'
+BEGIN
+    DELETE FROM precomputed_suggestions WHERE goal_id = NEW.goal_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_suggestions_delete AFTER DELETE ON tasks
+WHEN OLD.status <> 'Planned'
+BEGIN
+    DELETE FROM precomputed_suggestions WHERE goal_id = OLD.goal_id;
+END;
+
+-- Version counters behind the ETags and the rendered-fragment cache: ('goal', goal_id) changes
+-- with the goal, its tasks and its precomputed suggestion, ('user', user_id) with the user's goals
+CREATE TABLE IF NOT EXISTS content_versions (
+    scope TEXT NOT NULL, -- 'goal' or 'user'
+    id INTEGER NOT NULL, -- goal_id or user_id
+    version INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (scope, id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_version_insert AFTER INSERT ON tasks
+BEGIN
+    INSERT INTO content_versions (scope, id, version) VALUES ('goal', NEW.goal_id, 1)
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_version_update AFTER UPDATE ON tasks
+BEGIN
+    INSERT INTO content_versions (scope, id, version)
+    SELECT 'goal', goal_id, 1 FROM (SELECT NEW.goal_id AS goal_id UNION SELECT OLD.goal_id)
+    WHERE true
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_version_delete AFTER DELETE ON tasks
+BEGIN
+    INSERT INTO content_versions (scope, id, version) VALUES ('goal', OLD.goal_id, 1)
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_goals_version_insert AFTER INSERT ON goals
+BEGIN
+    INSERT INTO content_versions (scope, id, version) VALUES ('goal', NEW.goal_id, 1), ('user', NEW.user_id, 1)
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_goals_version_update AFTER UPDATE ON goals
+BEGIN
+    INSERT INTO content_versions (scope, id, version)
+    SELECT scope, id, 1 FROM (SELECT 'goal' AS scope, NEW.goal_id AS id UNION SELECT 'goal', OLD.goal_id
+                              UNION SELECT 'user', NEW.user_id UNION SELECT 'user', OLD.user_id)
+    WHERE true
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_goals_version_delete AFTER DELETE ON goals
+BEGIN
+    INSERT INTO content_versions (scope, id, version) VALUES ('goal', OLD.goal_id, 1), ('user', OLD.user_id, 1)
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_suggestions_version_insert AFTER INSERT ON precomputed_suggestions
+BEGIN
+    INSERT INTO content_versions (scope, id, version) VALUES ('goal', NEW.goal_id, 1)
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_suggestions_version_update AFTER UPDATE ON precomputed_suggestions
+BEGIN
+    INSERT INTO content_versions (scope, id, version) VALUES ('goal', NEW.goal_id, 1)
+    ON CONFLICT (scope, id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+-- Full-text search indexes (FTS5) over goal and task text, keyed by goal_id/task_id and kept
+-- current by the triggers below (served by /search; rebuild with `python search.py rebuild`)
+CREATE VIRTUAL TABLE IF NOT EXISTS goals_fts USING fts5(
+    description, positive_reasons,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+    description,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_goals_fts_insert AFTER INSERT ON goals
+BEGIN
+    INSERT OR REPLACE INTO goals_fts (rowid, description, positive_reasons)
+    VALUES (NEW.goal_id, NEW.description, NEW.positive_reasons);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_goals_fts_update AFTER UPDATE OF goal_id, description, positive_reasons ON goals
+BEGIN
+    DELETE FROM goals_fts WHERE rowid = OLD.goal_id;
+    INSERT OR REPLACE INTO goals_fts (rowid, description, positive_reasons)
+    VALUES (NEW.goal_id, NEW.description, NEW.positive_reasons);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_goals_fts_delete AFTER DELETE ON goals
+BEGIN
+    DELETE FROM goals_fts WHERE rowid = OLD.goal_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_insert AFTER INSERT ON tasks
+BEGIN
+    INSERT OR REPLACE INTO tasks_fts (rowid, description) VALUES (NEW.task_id, NEW.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_update AFTER UPDATE OF task_id, description ON tasks
+BEGIN
+    DELETE FROM tasks_fts WHERE rowid = OLD.task_id;
+    INSERT OR REPLACE INTO tasks_fts (rowid, description) VALUES (NEW.task_id, NEW.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_fts_delete AFTER DELETE ON tasks
+BEGIN
+    DELETE FROM tasks_fts WHERE rowid = OLD.task_id;
+END;
+
 -- Add initial default user (important for the app to work as coded)
 -- Using INSERT OR IGNORE to prevent errors if the user already exists
-INSERT OR IGNORE INTO users (user_id, username, preferences) VALUES (1, 'default_user', '{}');
\ No newline at end of file
+INSERT OR IGNORE INTO users (user_id, username, preferences) VALUES (1, 'default_user', '{}');
@@ -0,0 +1,179 @@
+# search.py
+# Full-text search over goals and tasks, and a batched rebuild of the search indexes
+#
+# goals_fts and tasks_fts (FTS5, see migrations/0009_search_index.sql) are kept current by
+# triggers, so every write path is covered without the routes doing anything. Searches
+# match every word of the query as a prefix ("run mar" finds "Running a marathon"), rank
+# with BM25 and return the matched words highlighted. Use the rebuild after bulk loads that
+# bypassed the triggers or to repair drift; like the migration's backfill it only ever
+# holds the write lock for one batch of rows:
+#
+#   python search.py                        # reindex goals and tasks, 5000 rows per transaction
+#   python search.py --table tasks --optimize  # just tasks, then merge the index segments
+
+import argparse
+import html
+import re
+import sqlite3
+import sys
+import time
+
+from markupsafe import Markup
+
+DATABASE = 'coach_agent.db'
+MAX_TERMS = 8  # Words of a query that are searched for; the rest are ignored
+MAX_RESULTS = 50
+
+_WORD = re.compile(r'\w+')
+_HIGHLIGHT_START, _HIGHLIGHT_END = '\x02', '\x03'  # Markers that cannot come from user text
+
+# table: (content table, key column, indexed columns)
+INDEXES = {
+    'goals': ('goals', 'goal_id', ('description', 'positive_reasons')),
+    'tasks': ('tasks', 'task_id', ('description',)),
+}
+
+
+def match_query(text):
+    """FTS5 MATCH expression for free text: every word must match, as a prefix when it has
+    at least two characters. Returns '' when the text has no words.
+
+    Words are quoted, so FTS5 operators and column filters typed by the user are plain text.
+    """
+    terms = _WORD.findall(text or '')[:MAX_TERMS]
+    return ' '.join(f'"{term}"*' if len(term) > 1 else f'"{term}"' for term in terms)
+
+
+def _highlighted(text):
+    """HTML-escapes FTS5 highlight()/snippet() output and turns its markers into <mark> tags."""
+    escaped = html.escape(text or '')
+    return Markup(escaped.replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_END, '</mark>'))
+
+
+def search_goals(db, user_id, query, limit=20, offset=0):
+    """The user's goals matching ``query``, best first. A description match outranks a reasons match."""
+    expression = match_query(query)
+    if not expression:
+        return []
+    rows = db.execute(
+        """SELECT g.goal_id, g.status, g.description,
+                  highlight(goals_fts, 0, char(2), char(3)) AS description_hl,
+                  snippet(goals_fts, 1, char(2), char(3), '…', 16) AS reasons_hl,
+                  bm25(goals_fts, 2.0, 1.0) AS score
+           FROM goals_fts JOIN goals g ON g.goal_id = goals_fts.rowid
+           WHERE goals_fts MATCH ? AND g.user_id = ?
+           ORDER BY score LIMIT ? OFFSET ?""",
+        (expression, user_id, limit, offset)).fetchall()
+    return [{
+        'goal_id': row['goal_id'],
+        'status': row['status'],
+        'description': row['description'],
+        'description_html': _highlighted(row['description_hl']),
+        'reasons_html': _highlighted(row['reasons_hl']),
+        'score': round(-row['score'], 4),  # bm25() is lower for better matches
+    } for row in rows]
+
+
+def search_tasks(db, user_id, query, limit=20, offset=0):
+    """The user's tasks matching ``query``, best first, with their goal's description."""
+    expression = match_query(query)
+    if not expression:
+        return []
+    rows = db.execute(
+        """SELECT t.task_id, t.goal_id, t.due_date, t.status, t.description,
+                  g.description AS goal_description,
+                  highlight(tasks_fts, 0, char(2), char(3)) AS description_hl,
+                  bm25(tasks_fts) AS score
+           FROM tasks_fts
+           JOIN tasks t ON t.task_id = tasks_fts.rowid
+           JOIN goals g ON g.goal_id = t.goal_id
+           WHERE tasks_fts MATCH ? AND g.user_id = ?
+           ORDER BY score, t.due_date DESC LIMIT ? OFFSET ?""",
+        (expression, user_id, limit, offset)).fetchall()
+    return [{
+        'task_id': row['task_id'],
+        'goal_id': row['goal_id'],
+        'goal_description': row['goal_description'],
+        'due_date': row['due_date'],
+        'status': row['status'],
+        'description': row['description'],
+        'description_html': _highlighted(row['description_hl']),
+        'score': round(-row['score'], 4),
+    } for row in rows]
+
+
+def _reindex_range(conn, table, low, high):
+    """Reindexes rows low..high of ``table`` inside one transaction, dropping index entries of
+    rows that no longer exist. Returns the number of rows indexed."""
+    content, key, columns = INDEXES[table]
+    fts = f"{table}_fts"
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            f"""DELETE FROM {fts} WHERE rowid BETWEEN ? AND ?
+                AND rowid NOT IN (SELECT {key} FROM {content} WHERE {key} BETWEEN ? AND ?)""",
+            (low, high, low, high))
+        rows = conn.execute(
+            f"""INSERT OR REPLACE INTO {fts} (rowid, {', '.join(columns)})
+                SELECT {key}, {', '.join(columns)} FROM {content} WHERE {key} BETWEEN ? AND ?""",
+            (low, high)).rowcount
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+
+def rebuild(path, tables=tuple(INDEXES), batch_size=5000, optimize=False):
+    """Reindexes ``tables`` one key range per transaction; returns {table: rows indexed}.
+
+    Writes that land during the rebuild are indexed by the triggers, and every batch
+    overwrites its rows with their current text, so nothing is lost or left stale.
+    """
+    conn = sqlite3.connect(path, isolation_level=None, timeout=30.0)
+    counts = {}
+    try:
+        for table in tables:
+            content, key, _ = INDEXES[table]
+            # The index is included too, so entries of rows that no longer exist are dropped as well
+            low, high = conn.execute(f"""
+                SELECT MIN(k), MAX(k) FROM (
+                    SELECT MIN({key}) AS k FROM {content} UNION ALL SELECT MAX({key}) FROM {content}
+                    UNION ALL SELECT * FROM (SELECT rowid FROM {table}_fts ORDER BY rowid LIMIT 1)
+                    UNION ALL SELECT * FROM (SELECT rowid FROM {table}_fts ORDER BY rowid DESC LIMIT 1))"""
+            ).fetchone()
+            counts[table] = 0
+            if low is None:
+                continue
+            for start in range(low, high + 1, batch_size):
+                counts[table] += _reindex_range(conn, table, start, start + batch_size - 1)
+            if optimize:
+                # Merges the index b-trees into one: smaller and faster to query, but one long write
+                conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('optimize')")
+        return counts
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild the full-text search indexes from goals and tasks.')
+    parser.add_argument('--db', default=DATABASE)
+    parser.add_argument('--table', choices=sorted(INDEXES), action='append', dest='tables',
+                        help='only rebuild this index (default: all)')
+    parser.add_argument('--batch-size', type=int, default=5000, help='rows per transaction')
+    parser.add_argument('--optimize', action='store_true', help='merge the index segments afterwards')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        counts = rebuild(args.db, tuple(args.tables or INDEXES), args.batch_size, args.optimize)
+    except sqlite3.Error as e:
+        print(f"🔴 Search index rebuild failed: {e}")
+        return 1
+    summary = ', '.join(f"{rows} {table}" for table, rows in counts.items())
+    print(f"✅ Reindexed {summary} in {time.perf_counter() - started:.1f}s.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
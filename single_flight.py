@@ -0,0 +1,109 @@
+# single_flight.py
+# Coalesces concurrent identical calls so only one of them does the work
+#
+# Threads (do) and coroutines (ado) share the same in-flight calls, so a request served by the
+# async AI routes can wait on a call a thread started, and the other way round.
+
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+
+class SingleFlightTimeout(TimeoutError):
+    """Raised to a waiting caller when the shared call did not finish in time."""
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its result.
+
+    The first caller for a key (the leader) runs ``fn`` in its own thread. Callers
+    arriving while it is in flight wait on the same future, and receive either the
+    leader's result or the exception it raised. The key is released as soon as the
+    leader finishes, so later calls run again (caching is a separate concern).
+    """
+
+    def __init__(self, timeout=60.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Future
+        self._counters = {
+            'calls': 0,
+            'executions': 0,
+            'coalesced': 0,
+            'errors': 0,
+            'timeouts': 0,
+        }
+
+    def do(self, key, fn, timeout=None):
+        """Returns ``fn()``, sharing one execution among concurrent callers with the same key."""
+        future, leader = self._join(key)
+        if not leader:
+            wait = self.timeout if timeout is None else timeout
+            try:
+                return future.result(timeout=wait)
+            except FutureTimeoutError:
+                raise self._timed_out(wait) from None
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def ado(self, key, coro_fn, timeout=None):
+        """Awaitable do(): returns ``await coro_fn()``, shared with concurrent callers of either kind."""
+        import asyncio  # Only async servers call this, and they have it loaded already
+        future, leader = self._join(key)
+        if not leader:
+            wait = self.timeout if timeout is None else timeout
+            try:
+                # shield(): a timed-out waiter must not cancel the leader's future
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), wait)
+            except asyncio.TimeoutError:
+                raise self._timed_out(wait) from None
+
+        try:
+            result = await coro_fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def _join(self, key):
+        """(future, leader): the key's in-flight future, created (with leader=True) if there is none."""
+        with self._lock:
+            self._counters['calls'] += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self._counters['executions'] += 1
+            else:
+                self._counters['coalesced'] += 1
+        return future, leader
+
+    def _finish(self, key, future, result=None, error=None):
+        """Releases the key and hands the leader's result (or exception) to the waiters."""
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is not None:
+                self._counters['errors'] += 1
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _timed_out(self, wait):
+        with self._lock:
+            self._counters['timeouts'] += 1
+        return SingleFlightTimeout(f"Timed out after {wait}s waiting for in-flight call")
+
+    def stats(self):
+        """Returns call/coalescing counters as a plain dict."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = len(self._inflight)
+        return stats
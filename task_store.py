@@ -0,0 +1,252 @@
+# task_store.py
+# Set-based task writes shared by the routes: validated bulk inserts with idempotency keys,
+# bulk status transitions and the overdue sweep.
+#
+#   python task_store.py sweep-overdue    # mark every overdue Planned task as Missed (e.g. from cron)
+
+import argparse
+import datetime
+import hashlib
+import json
+import sqlite3
+import sys
+
+VALID_STATUSES = ('Planned', 'Completed', 'Missed')
+MAX_BULK_TASKS = 1000  # Per request; larger imports should be split by the client
+DATABASE = 'coach_agent.db'
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+
+
+class TaskValidationError(ValueError):
+    """Raised when one or more tasks in a batch are invalid; nothing is written."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid task(s): {errors[0]['error']}" if errors else "Invalid tasks")
+        self.errors = errors  # [{'index': i, 'error': message}, ...]
+
+
+class IdempotencyConflictError(ValueError):
+    """Raised when an idempotency key is reused for a different set of tasks."""
+
+
+def _parse_due_date(value):
+    if not isinstance(value, str) or len(value) != 10:
+        raise ValueError("due_date must be a YYYY-MM-DD string")
+    return datetime.date.fromisoformat(value).isoformat()
+
+
+def validate_tasks(db, tasks, user_id):
+    """Checks every task up front and returns insert-ready rows.
+
+    Each task is a dict with goal_id, description, due_date (YYYY-MM-DD) and optionally
+    status and estimated_time. Goal ownership is checked for the whole batch in one query.
+    """
+    if not isinstance(tasks, list) or not tasks:
+        raise TaskValidationError([{'index': None, 'error': "tasks must be a non-empty list"}])
+    if len(tasks) > MAX_BULK_TASKS:
+        raise TaskValidationError([{'index': None, 'error': f"at most {MAX_BULK_TASKS} tasks per request"}])
+
+    errors = []
+    rows = []
+    for index, task in enumerate(tasks):
+        if not isinstance(task, dict):
+            errors.append({'index': index, 'error': "task must be an object"})
+            continue
+        try:
+            goal_id = int(task.get('goal_id'))
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'error': "goal_id must be an integer"})
+            continue
+        description = task.get('description')
+        if not isinstance(description, str) or not description.strip():
+            errors.append({'index': index, 'error': "description is required"})
+            continue
+        try:
+            due_date = _parse_due_date(task.get('due_date'))
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        status = task.get('status') or 'Planned'
+        if status not in VALID_STATUSES:
+            errors.append({'index': index, 'error': f"status must be one of {', '.join(VALID_STATUSES)}"})
+            continue
+        rows.append((goal_id, description.strip(), due_date, status, task.get('estimated_time')))
+
+    if not errors:
+        goal_ids = sorted({row[0] for row in rows})
+        placeholders = ','.join('?' * len(goal_ids))
+        owned = {r[0] for r in db.execute(
+            f"SELECT goal_id FROM goals WHERE user_id = ? AND goal_id IN ({placeholders})",
+            (user_id, *goal_ids))}
+        errors = [{'index': i, 'error': f"goal {row[0]} not found"}
+                  for i, row in enumerate(rows) if row[0] not in owned]
+    if errors:
+        raise TaskValidationError(errors)
+    return rows
+
+
+def _request_hash(rows):
+    return hashlib.sha256(json.dumps(rows, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def _replay(db, user_id, idempotency_key, request_hash):
+    # Expired keys may linger until the next insert deletes them; they no longer count
+    stored = db.execute(
+        """SELECT request_hash, task_ids FROM idempotency_keys
+           WHERE user_id = ? AND idempotency_key = ? AND created_at >= datetime('now', ?)""",
+        (user_id, idempotency_key, f'-{IDEMPOTENCY_KEY_TTL_HOURS} hours')).fetchone()
+    if stored is None:
+        return None
+    if stored[0] != request_hash:
+        raise IdempotencyConflictError(f"Idempotency key '{idempotency_key}' was already used for different tasks")
+    return json.loads(stored[1])
+
+
+def insert_tasks(db, tasks, user_id, idempotency_key=None):
+    """Validates and inserts ``tasks`` in one transaction and returns (task_ids, replayed).
+
+    With an ``idempotency_key``, a retry of the same request returns the task_ids of the
+    first attempt (replayed=True) instead of inserting the tasks again.
+    """
+    rows = validate_tasks(db, tasks, user_id)
+    request_hash = _request_hash(rows) if idempotency_key else None
+    if idempotency_key:
+        task_ids = _replay(db, user_id, idempotency_key, request_hash)
+        if task_ids is not None:
+            return task_ids, True
+
+    try:
+        # Take the write lock up front: ids handed out by AUTOINCREMENT inside one locked
+        # executemany are consecutive, so last_insert_rowid() identifies all of them.
+        if not db.in_transaction:
+            db.execute("BEGIN IMMEDIATE")
+        if idempotency_key:
+            # Re-check under the lock in case a concurrent retry won the race
+            task_ids = _replay(db, user_id, idempotency_key, request_hash)
+            if task_ids is not None:
+                db.rollback()
+                return task_ids, True
+        db.executemany(
+            "INSERT INTO tasks (goal_id, description, due_date, status, estimated_time) VALUES (?, ?, ?, ?, ?)",
+            rows)
+        last_id = db.execute("SELECT last_insert_rowid()").fetchone()[0]
+        task_ids = list(range(last_id - len(rows) + 1, last_id + 1))
+        if idempotency_key:
+            db.execute(
+                "DELETE FROM idempotency_keys WHERE created_at < datetime('now', ?)",
+                (f'-{IDEMPOTENCY_KEY_TTL_HOURS} hours',))
+            db.execute(
+                "INSERT INTO idempotency_keys (user_id, idempotency_key, request_hash, task_ids) VALUES (?, ?, ?, ?)",
+                (user_id, idempotency_key, request_hash, json.dumps(task_ids)))
+        db.commit()
+    except sqlite3.Error:
+        db.rollback()
+        raise
+    return task_ids, False
+
+
+def set_task_statuses(db, changes, user_id, now=None):
+    """Applies many (task_id, new_status) changes in one transaction and returns per-task results.
+
+    Ownership is checked with a single join for the whole batch, and the updates are
+    grouped into one UPDATE per target status. Tasks already in the requested status are
+    reported as unchanged and not written. Completed tasks get ``now`` as completion_date;
+    Missed and Planned clear it.
+    """
+    if len(changes) > MAX_BULK_TASKS:
+        raise TaskValidationError([{'index': None, 'error': f"at most {MAX_BULK_TASKS} changes per request"}])
+
+    # task_id -> result, in request order; rejected changes are keyed by their index instead,
+    # since their task_id may be anything (even an unhashable JSON list or object)
+    results = {}
+    wanted = {}  # task_id -> new status (a later change for the same task wins)
+    for index, (task_id, status) in enumerate(changes):
+        try:
+            task_id = int(task_id)
+        except (TypeError, ValueError):
+            results[('rejected', index)] = {'task_id': task_id, 'ok': False, 'error': "task_id must be an integer"}
+            continue
+        if status not in VALID_STATUSES:
+            results[('rejected', index)] = {'task_id': task_id, 'ok': False,
+                                            'error': f"status must be one of {', '.join(VALID_STATUSES)}"}
+            continue
+        wanted[task_id] = status
+        results[task_id] = None  # Placeholder keeps the request order
+
+    current = {}
+    if wanted:
+        placeholders = ','.join('?' * len(wanted))
+        current = {row[0]: (row[1], row[2]) for row in db.execute(
+            f"""SELECT t.task_id, t.goal_id, t.status
+                FROM tasks t JOIN goals g ON g.goal_id = t.goal_id
+                WHERE g.user_id = ? AND t.task_id IN ({placeholders})""",
+            (user_id, *wanted))}
+
+    by_status = {}
+    for task_id, status in wanted.items():
+        if task_id not in current:
+            results[task_id] = {'task_id': task_id, 'ok': False, 'error': "Task not found or not accessible."}
+            continue
+        goal_id, previous = current[task_id]
+        results[task_id] = {'task_id': task_id, 'ok': True, 'goal_id': goal_id, 'status': status,
+                            'previous_status': previous, 'changed': previous != status}
+        if previous != status:
+            by_status.setdefault(status, []).append(task_id)
+
+    if by_status:
+        completion_time = now or datetime.datetime.now()  # Record precise completion time
+        try:
+            for status, task_ids in by_status.items():
+                placeholders = ','.join('?' * len(task_ids))
+                db.execute(
+                    f"UPDATE tasks SET status = ?, completion_date = ? WHERE task_id IN ({placeholders})",
+                    (status, completion_time if status == 'Completed' else None, *task_ids))
+            db.commit()
+        except sqlite3.Error:
+            db.rollback()
+            raise
+    return list(results.values())
+
+
+def sweep_overdue_tasks(db, user_id=None, goal_id=None, today=None):
+    """Marks Planned tasks due before ``today`` as Missed with one set-based UPDATE.
+
+    Scoped to one user (and optionally one of their goals), or to every user when
+    ``user_id`` is None. Returns the number of tasks marked Missed.
+    """
+    today = (today or datetime.date.today()).isoformat()
+    sql = "UPDATE tasks SET status = 'Missed', completion_date = NULL WHERE status = 'Planned' AND due_date < ?"
+    params = [today]
+    if goal_id is not None:
+        sql += " AND goal_id = ? AND goal_id IN (SELECT goal_id FROM goals WHERE user_id = ?)"
+        params += [goal_id, user_id]
+    elif user_id is not None:
+        sql += " AND goal_id IN (SELECT goal_id FROM goals WHERE user_id = ?)"
+        params.append(user_id)
+    try:
+        count = db.execute(sql, params).rowcount
+        db.commit()
+    except sqlite3.Error:
+        db.rollback()
+        raise
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Task maintenance commands.')
+    parser.add_argument('command', choices=['sweep-overdue'])
+    parser.add_argument('--db', default=DATABASE)
+    parser.add_argument('--user', type=int, help='only sweep this user (default: everyone)')
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db, timeout=30.0)
+    try:
+        count = sweep_overdue_tasks(conn, user_id=args.user)
+    finally:
+        conn.close()
+    print(f"✅ Marked {count} overdue Planned tasks as Missed.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
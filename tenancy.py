@@ -0,0 +1,165 @@
+# tenancy.py
+# Users: who a request is for, queries scoped to that user, and optional sharding of users
+# over several SQLite files
+#
+# Every route works on g.user_id, resolved once per request by current_user_id(). Goal
+# lookups go through get_goal()/user_goals(), which always filter on user_id first, so a
+# goal id from another user behaves exactly like one that doesn't exist.
+#
+# With SHARD_COUNT > 1 each user's goals and tasks live in one of N database files, picked
+# by a hash of the user id, so writes from different users stop queueing on one SQLite
+# write lock and no single file grows with the whole user base. The main database stays
+# the user directory: it hands out user ids (unique across shards) and maps usernames to
+# them. Users are never moved, so SHARD_COUNT must not change once data has been written.
+#
+#   SHARD_COUNT=1 (default)   everything in coach_agent.db
+#   SHARD_COUNT=4             coach_agent.shard0.db ... coach_agent.shard3.db, plus coach_agent.db
+
+import os
+import sqlite3
+import threading
+import zlib
+
+from db_pool import ConnectionPool
+
+MAX_CACHED_USERNAMES = 10000
+
+
+def shard_index(user_id, count):
+    """The shard (0..count-1) holding ``user_id``'s data: a stable hash, the same in every process."""
+    return zlib.crc32(str(int(user_id)).encode('ascii')) % count if count > 1 else 0
+
+
+def shard_paths(database, count):
+    """Database file of every shard; a single shard is the main database itself."""
+    if count <= 1:
+        return [database]
+    root, ext = os.path.splitext(database)
+    return [f"{root}.shard{i}{ext}" for i in range(count)]
+
+
+class ShardRouter:
+    """One ConnectionPool per shard, plus the user directory's pool.
+
+    ``pool_for(user_id)`` is the pool for everything about that user; ``directory`` is the
+    main database's pool (the same pool as the only shard when there is just one).
+    """
+
+    def __init__(self, database, count=1, **pool_options):
+        self.database = database
+        self.count = max(int(count), 1)
+        self.paths = shard_paths(database, self.count)
+        self.pools = [ConnectionPool(path, **pool_options) for path in self.paths]
+        self.directory = self.pools[0] if self.count == 1 else ConnectionPool(database, **pool_options)
+
+    def path_for(self, user_id):
+        return self.paths[shard_index(user_id, self.count)]
+
+    def pool_for(self, user_id):
+        return self.pools[shard_index(user_id, self.count)]
+
+    def all_paths(self):
+        """The directory and every shard file, e.g. for migrations."""
+        return self.paths if self.count == 1 else [self.database] + self.paths
+
+    def health(self):
+        """Pool health of the directory and every shard; 'ok' only when all of them are."""
+        if self.count == 1:
+            return self.directory.health()
+        shards = [dict(pool.health(), path=path) for path, pool in zip(self.paths, self.pools)]
+        directory = dict(self.directory.health(), path=self.database)
+        ok = directory['status'] == 'ok' and all(shard['status'] == 'ok' for shard in shards)
+        return {'status': 'ok' if ok else 'error', 'shard_count': self.count,
+                'directory': directory, 'shards': shards}
+
+    def close_all(self):
+        for pool in {id(pool): pool for pool in self.pools + [self.directory]}.values():
+            pool.close_all()
+
+
+class UserDirectory:
+    """Finds users by username in the main database, creating them on first sight.
+
+    Also makes sure the user's row exists in their shard, so each shard file is complete
+    on its own (exports, foreign keys). Username lookups are cached in process.
+    """
+
+    def __init__(self, router):
+        self.router = router
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def user_id(self, username):
+        with self._lock:
+            user_id = self._ids.get(username)
+        if user_id is not None:
+            return user_id
+
+        conn = self.router.directory.acquire()
+        try:
+            conn.execute("INSERT OR IGNORE INTO users (username, preferences) VALUES (?, '{}')", (username,))
+            user_id = conn.execute("SELECT user_id FROM users WHERE username = ?", (username,)).fetchone()[0]
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            self.router.directory.release(conn)
+        if self.router.count > 1:
+            self._add_to_shard(user_id, username)
+
+        with self._lock:
+            if len(self._ids) >= MAX_CACHED_USERNAMES:
+                self._ids.clear()
+            self._ids[username] = user_id
+        return user_id
+
+    def _add_to_shard(self, user_id, username):
+        pool = self.router.pool_for(user_id)
+        conn = pool.acquire()
+        try:
+            conn.execute("INSERT OR IGNORE INTO users (user_id, username, preferences) VALUES (?, ?, '{}')",
+                         (user_id, username))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            pool.release(conn)
+
+
+def current_user_id(request, session, directory, header=None, default=None):
+    """The user a request acts for, or None when nobody is logged in and there is no ``default``.
+
+    In order: the trusted ``header`` (a username set by an authenticating reverse proxy, only
+    when configured), the user logged in through the session, then ``default``.
+    """
+    if header:
+        username = request.headers.get(header, '').strip()
+        if username:
+            return directory.user_id(username)
+    user_id = session.get('user_id')
+    if user_id is not None:
+        return int(user_id)
+    return default
+
+
+# --- Queries scoped to one user ---
+def get_goal(db, user_id, goal_id, columns='*'):
+    """The user's goal ``goal_id`` (``columns`` of it), or None if it doesn't exist or isn't theirs."""
+    try:
+        goal_id = int(goal_id)
+    except (TypeError, ValueError):
+        return None
+    return db.execute(f"SELECT {columns} FROM goals WHERE user_id = ? AND goal_id = ?",
+                      (user_id, goal_id)).fetchone()
+
+
+def user_goals(db, user_id, status=None, columns='goal_id, description, status'):
+    """The user's goals, newest first, optionally with one ``status`` only (idx_goals_user_status_created)."""
+    if status is None:
+        return db.execute(f"SELECT {columns} FROM goals WHERE user_id = ? ORDER BY creation_date DESC",
+                          (user_id,)).fetchall()
+    return db.execute(
+        f"SELECT {columns} FROM goals WHERE user_id = ? AND status = ? ORDER BY creation_date DESC",
+        (user_id, status)).fetchall()
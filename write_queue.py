@@ -0,0 +1,206 @@
+# write_queue.py
+# Single-writer queue: every write to a database file runs on one thread, many per commit
+#
+# SQLite allows one writer at a time anyway. Letting each request thread commit on its own
+# makes them queue on the file lock (and fail with "database is locked" once busy_timeout
+# runs out) and pays for one commit per request. Here routes submit write functions
+# instead; the writer thread takes whatever has queued up (waiting at most ``window``
+# seconds for company, up to ``max_batch`` writes) and runs them in one transaction. Each
+# write gets its own SAVEPOINT, so one that raises is undone alone and its caller gets the
+# exception, while the rest of the batch commits. Callers are answered after the COMMIT,
+# so a returned result is durable and visible to every connection.
+#
+# Write functions take the connection as their first argument and must not manage the
+# transaction: commit() and rollback() on it are no-ops (raise to undo the write).
+
+import concurrent.futures
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from db_pool import ConnectionPool
+
+
+class WriteQueueFullError(sqlite3.OperationalError):
+    """Raised by submit() when ``max_queue`` writes are already waiting."""
+
+
+class WriteTimeoutError(sqlite3.OperationalError):
+    """Raised by execute() when a write did not finish within the timeout (it may still run)."""
+
+
+class _BatchConnection:
+    """The writer's connection as write functions see it: the writer owns the transaction."""
+
+    in_transaction = True
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class _Write:
+    __slots__ = ('fn', 'args', 'kwargs', 'future', 'queued_at')
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = concurrent.futures.Future()
+        self.queued_at = time.perf_counter()
+
+
+class WriteQueue:
+    """One writer thread for the database at ``path``, group-committing queued writes.
+
+    The connection is set up like the app's pooled ones (WAL, pragmas, row factory). The
+    thread starts on the first submit() in each process, so the queue survives forking.
+    """
+
+    def __init__(self, path, max_batch=64, window=0.001, max_queue=1000, pragmas=None, factory=sqlite3.Connection):
+        self.path = path
+        self.factory = factory
+        self.max_batch = max_batch
+        self.window = window
+        self.max_queue = max_queue
+        self.pragmas = pragmas
+        self._lock = threading.Lock()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._thread = None
+        self._stats = {'writes': 0, 'failed': 0, 'batches': 0, 'batch_failures': 0, 'largest_batch': 0,
+                       'rejected': 0, 'wait_seconds': 0.0, 'commit_seconds': 0.0}
+
+    def _ensure_thread(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset_state()  # Inherited from a parent process: its thread didn't survive the fork
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f'sqlite-writer:{self.path}', daemon=True)
+                    self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues ``fn(conn, *args, **kwargs)`` and returns a Future of its result."""
+        self._ensure_thread()
+        write = _Write(fn, args, kwargs)
+        try:
+            self._queue.put_nowait(write)
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise WriteQueueFullError(f"{self.max_queue} writes already waiting for {self.path}") from None
+        return write.future
+
+    def execute(self, fn, *args, timeout=30.0, **kwargs):
+        """Runs ``fn(conn, *args, **kwargs)`` on the writer thread and returns its result once committed."""
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            raise WriteTimeoutError(f"Write to {self.path} did not finish within {timeout}s") from None
+
+    def _connect(self):
+        pool = ConnectionPool(self.path, max_size=1, pragmas=self.pragmas, factory=self.factory)
+        conn = pool.acquire()
+        conn.isolation_level = None  # The writer issues BEGIN/SAVEPOINT/COMMIT itself
+        return conn
+
+    def _next_batch(self):
+        """The next writes to commit together, and whether close() was called after them."""
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                # Take what is already waiting at once; only then wait out the rest of the window
+                remaining = deadline - time.perf_counter()
+                write = self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if write is None:
+                return batch, True
+            batch.append(write)
+        return batch, False
+
+    def _run(self):
+        conn = self._connect()
+        proxy = _BatchConnection(conn)
+        closing = False
+        while not closing:
+            batch, closing = self._next_batch()
+            if not batch:
+                break
+            started = time.perf_counter()
+            outcomes = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for write in batch:
+                    conn.execute("SAVEPOINT write")
+                    try:
+                        outcomes.append((write, True, write.fn(proxy, *write.args, **write.kwargs)))
+                        conn.execute("RELEASE write")
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write")
+                        conn.execute("RELEASE write")
+                        outcomes.append((write, False, e))
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                # BEGIN or COMMIT itself failed: nothing in the batch was written
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                outcomes = [(write, False, e) for write in batch]
+                with self._lock:
+                    self._stats['batch_failures'] += 1
+
+            finished = time.perf_counter()
+            with self._lock:
+                self._stats['batches'] += 1
+                self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+                self._stats['commit_seconds'] += finished - started
+                for write, ok, _ in outcomes:
+                    self._stats['writes'] += 1
+                    self._stats['failed'] += not ok
+                    self._stats['wait_seconds'] += started - write.queued_at
+            for write, ok, value in outcomes:
+                if ok:
+                    write.future.set_result(value)
+                else:
+                    write.future.set_exception(value)
+        conn.close()
+
+    def close(self, timeout=None):
+        """Commits the writes submitted so far, then stops the writer thread and closes its connection."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and self._pid == os.getpid():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def stats(self):
+        """Write/batch counters, average batch size and average queue wait and batch time."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queued'] = self._queue.qsize()
+        batches, writes = stats['batches'], stats['writes']
+        stats['avg_batch'] = round(writes / batches, 2) if batches else None
+        stats['avg_wait_ms'] = round(stats.pop('wait_seconds') / writes * 1000, 3) if writes else None
+        stats['avg_batch_ms'] = round(stats.pop('commit_seconds') / batches * 1000, 3) if batches else None
+        return stats